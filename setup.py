@@ -81,9 +81,7 @@ setup(
     python_requires='>2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*',
     install_requires=read('requirements.txt').splitlines(),
     extras_require={
-        # eg:
-        #   'rst': ['docutils>=0.11'],
-        #   ':python_version=="2.6"': ['argparse'],
+        'index': ['numpy'],
     },
     entry_points={
         'console_scripts': [
@@ -1,2 +1,10 @@
 __version__ = '0.6.0'
 from .core import get_scansion  # noqa
+
+
+def __getattr__(name):
+    # The asyncio API is only imported when it is first used
+    if name == "aget_scansion":
+        from .aio import aget_scansion
+        return aget_scansion
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from weakref import WeakKeyDictionary
+
+from .core import BATCH_SIZE
+from .core import get_scansion_options
+from .parallel import scan_chunk
+
+# Default scanner of each event loop
+_scanners = WeakKeyDictionary()
+
+
+async def achunked(texts, size):
+    """Split an iterable or an asynchronous iterable in lists of at most size
+    elements"""
+    chunk = []
+    if hasattr(texts, "__aiter__"):
+        async for text in texts:
+            chunk.append(text)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class AsyncScanner:
+    """Run scansions from asyncio code without blocking the event loop. The
+    pipeline runs in an executor, a thread pool by default or any
+    `concurrent.futures` executor, e.g., a `ProcessPoolExecutor` with
+    `rantanplan.parallel.init_worker` as initializer, with at most
+    max_concurrency batches running at once. Concurrent `scansion` calls
+    with the same options that arrive within max_wait seconds (by default,
+    in the same iteration of the event loop) are tagged as a single batch,
+    and analyzed one by one if the batch fails, so that only the calls with
+    a failing text raise.
+    The spaCy pipeline of a process is not thread-safe, so batches can only
+    run concurrently in a process pool: with a thread pool, max_concurrency
+    must be 1.
+    """
+
+    def __init__(self, executor=None, max_concurrency=1,
+                 batch_size=BATCH_SIZE, max_wait=0.0):
+        if max_concurrency > 1 and (
+                executor is None or isinstance(executor, ThreadPoolExecutor)):
+            raise ValueError(
+                "Batches share the pipeline of the process when they run in "
+                "threads, use a ProcessPoolExecutor for max_concurrency > 1")
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._semaphore = None
+        self._pending = {}
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def run_batch(self, texts, options):
+        """Analyze a list of texts in the executor
+
+        :param texts: List of texts to be analyzed
+        :param options: Dictionary with the keyword arguments of
+            `get_scansion`
+        :return: List with the scansion of each text
+        :rtype: list
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, scan_chunk, texts, options, self.batch_size)
+
+    async def scansion(self, text, **options):
+        """Analyze a text, batching it with other concurrent calls
+
+        :param text: Full text to be analyzed
+        :param options: Keyword arguments for `get_scansion`
+        :return: Output of `get_scansion`
+        :rtype: list
+        """
+        options = get_scansion_options(**options)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = json.dumps(options, sort_keys=True)
+        self._pending.setdefault(key, (options, []))[1].append(
+            (text, future))
+        if self._flush_handle is None:
+            if self.max_wait:
+                self._flush_handle = loop.call_later(self.max_wait,
+                                                     self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        for options, requests in pending.values():
+            for start in range(0, len(requests), self.batch_size):
+                task = asyncio.ensure_future(self._process(
+                    requests[start:start + self.batch_size], options))
+                # Keep a reference so the task is not garbage collected
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, requests, options):
+        requests = [(text, future) for text, future in requests
+                    if not future.cancelled()]
+        if not requests:
+            return
+        try:
+            scansions = await self.run_batch(
+                [text for text, _ in requests], options)
+        except Exception as error:
+            if len(requests) == 1:
+                _, future = requests[0]
+                if not future.done():
+                    future.set_exception(error)
+                return
+            # Analyze the texts one by one so only the culprits fail
+            for request in requests:
+                await self._process([request], options)
+        else:
+            for (_, future), scansion in zip(requests, scansions):
+                if not future.done():
+                    future.set_result(scansion)
+
+    async def scansions(self, texts, **options):
+        """Generate the scansion of each text of an iterable or asynchronous
+        iterable of texts, in the same order. Texts are analyzed in batches
+        of batch_size, with up to max_concurrency batches in flight.
+
+        :param texts: Iterable or asynchronous iterable of texts
+        :param options: Keyword arguments for `get_scansion`
+        :return: Asynchronous generator with the output of `get_scansion`
+            for each text
+        :rtype: async_generator
+        """
+        options = get_scansion_options(**options)
+        pending = deque()
+        try:
+            async for chunk in achunked(texts, self.batch_size):
+                pending.append(asyncio.ensure_future(
+                    self.run_batch(chunk, options)))
+                if len(pending) > self.max_concurrency:
+                    for scansion in await pending.popleft():
+                        yield scansion
+            while pending:
+                for scansion in await pending.popleft():
+                    yield scansion
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def get_async_scanner():
+    """Return the default `AsyncScanner` of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _scanners:
+        _scanners[loop] = AsyncScanner()
+    return _scanners[loop]
+
+
+async def aget_scansion(text, scanner=None, **options):
+    """Asynchronous version of `get_scansion` that runs the analysis in an
+    executor. Calls made at the same time are tagged together in one batch.
+
+    :param text: Full text to be analyzed
+    :param scanner: `AsyncScanner` to use. Defaults to the default scanner
+        of the running event loop
+    :param options: Keyword arguments for `get_scansion`
+    :return: list of dictionaries per line
+        (or list of list of dictionaries if split on stanzas)
+    :rtype: list
+    """
+    scanner = scanner or get_async_scanner()
+    return await scanner.scansion(text, **options)
+
+
+def aiter_scansions(texts, scanner=None, **options):
+    """Asynchronous version of `get_scansions`
+
+    :param texts: Iterable or asynchronous iterable of texts
+    :param scanner: `AsyncScanner` to use. Defaults to the default scanner
+        of the running event loop
+    :param options: Keyword arguments for `get_scansion`
+    :return: Asynchronous generator with the output of `get_scansion` for
+        each text
+    :rtype: async_generator
+    """
+    scanner = scanner or get_async_scanner()
+    return scanner.scansions(texts, **options)
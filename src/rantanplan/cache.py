@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from . import __version__
+from .pipeline import DEFAULT_LANG
+
+# Default limits of the cache, evicting the least recently used entries
+MAX_ENTRIES = 2 ** 20
+MAX_SIZE = 2 ** 30
+# Environment variable to override the default location of the cache
+CACHE_PATH_ENV = "RANTANPLAN_CACHE"
+# Version of the format of the entries, part of their keys
+CACHE_FORMAT = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scansions (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scansions_accessed ON scansions (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, entries, size)
+    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM scansions;
+"""
+
+
+def get_default_cache_path():
+    """Return the path of the cache file, either from the RANTANPLAN_CACHE
+    environment variable or in the user cache directory"""
+    if os.environ.get(CACHE_PATH_ENV):
+        return os.environ[CACHE_PATH_ENV]
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "rantanplan", "scansions.sqlite")
+
+
+def get_package_version(name):
+    """Return the installed version of a package, or None if not installed"""
+    try:
+        from importlib.metadata import PackageNotFoundError
+        from importlib.metadata import version
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(name).version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def get_versions():
+    """Return the versions the results depend on, without loading the spaCy
+    model: rantanplan, spaCy, spacy-affixes and the default model"""
+    return {
+        "rantanplan": __version__,
+        "spacy": get_package_version("spacy"),
+        "spacy-affixes": get_package_version("spacy-affixes"),
+        DEFAULT_LANG: get_package_version(DEFAULT_LANG),
+    }
+
+
+class ScansionCache:
+    """Persistent cache of scansion results in a SQLite file. Entries are
+    keyed by a hash of the text, the analysis options and the versions of
+    rantanplan and the spaCy model, so upgrading any of them never returns
+    stale results. Scansions are stored as JSON. The number of entries and
+    their total size are kept up to date on every change, and when the
+    cache grows over max_entries or max_size bytes, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, max_size=MAX_SIZE):
+        self.path = path or get_default_cache_path()
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.versions = json.dumps(get_versions(), sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None,
+            check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that runs its block in a write transaction,
+        rolled back if it raises"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def get_totals(self):
+        """Return a tuple with the number of entries and their total size
+        in bytes"""
+        return self.connection.execute(
+            "SELECT entries, size FROM totals").fetchone()
+
+    def update_totals(self, entries, size):
+        """Add to the number of entries and their total size"""
+        self.connection.execute(
+            "UPDATE totals SET entries = entries + ?, size = size + ?",
+            (entries, size))
+
+    def get_key(self, text, options):
+        """Return the cache key of a text analyzed with some options
+
+        :param text: Text to be analyzed
+        :param options: Dictionary with the keyword arguments of
+            `get_scansion`
+        :return: Hexadecimal SHA-256 digest
+        :rtype: str
+        """
+        digest = hashlib.sha256(f"{CACHE_FORMAT}\0".encode("utf-8"))
+        digest.update(self.versions.encode("utf-8"))
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def lookup(self, texts, options):
+        """Look up the scansions of a list of texts
+
+        :param texts: List of texts
+        :param options: Dictionary with the keyword arguments of
+            `get_scansion`
+        :return: List with a tuple of key and scansion per text. The scansion
+            is None if the text is not in the cache
+        :rtype: list
+        """
+        keys = [self.get_key(text, options) for text in texts]
+        values = {}
+        unique_keys = list(set(keys))
+        # Keep well under the SQLite limit of variables per statement
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            rows = self.connection.execute(
+                "SELECT key, value FROM scansions WHERE key IN "
+                f"({', '.join('?' * len(chunk))})", chunk)
+            values.update(rows)
+        if values:
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE scansions SET accessed = ? WHERE key = ?",
+                [(now, key) for key in values])
+        return [(key, json.loads(values[key]) if key in values else None)
+                for key in keys]
+
+    def store(self, entries):
+        """Store scansions in the cache, evicting old entries if needed
+
+        :param entries: Iterable of tuples of key and scansion
+        """
+        now = time.time()
+        values = {}
+        for key, value in entries:
+            values[key] = json.dumps(
+                value, ensure_ascii=False,
+                separators=(",", ":")).encode("utf-8")
+        if not values:
+            return
+        keys = list(values)
+        with self.transaction():
+            replaced_entries = replaced_size = 0
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                count, size = self.connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scansions "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchone()
+                replaced_entries += count
+                replaced_size += size
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scansions "
+                "(key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                [(key, data, len(data), now) for key, data in values.items()])
+            self.update_totals(
+                len(values) - replaced_entries,
+                sum(len(data) for data in values.values()) - replaced_size)
+            self._evict()
+
+    def _evict(self):
+        entries, size = self.get_totals()
+        if entries <= self.max_entries and size <= self.max_size:
+            return 0
+        evicted = []
+        evicted_size = 0
+        rows = self.connection.execute(
+            "SELECT key, size FROM scansions ORDER BY accessed")
+        for key, entry_size in rows:
+            if (entries - len(evicted) <= self.max_entries
+                    and size - evicted_size <= self.max_size):
+                break
+            evicted.append((key, ))
+            evicted_size += entry_size
+        self.connection.executemany(
+            "DELETE FROM scansions WHERE key = ?", evicted)
+        self.update_totals(-len(evicted), -evicted_size)
+        return len(evicted)
+
+    def evict(self):
+        """Delete the least recently used entries until the cache is within
+        its limits. Only the stored totals are read unless a limit is crossed
+
+        :return: Number of deleted entries
+        :rtype: int
+        """
+        with self.transaction():
+            return self._evict()
+
+    def info(self):
+        """Return a dictionary with the location, usage and limits of the
+        cache"""
+        entries, size = self.get_totals()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size": size,
+            "max_entries": self.max_entries,
+            "max_size": self.max_size,
+            "versions": json.loads(self.versions),
+        }
+
+    def purge(self):
+        """Delete all the entries of the cache
+
+        :return: Number of deleted entries
+        :rtype: int
+        """
+        with self.transaction():
+            deleted = self.connection.execute(
+                "DELETE FROM scansions").rowcount
+            self.connection.execute(
+                "UPDATE totals SET entries = 0, size = 0")
+        self.connection.execute("VACUUM")
+        return deleted
+
+    def split(self, texts, options):
+        """Look up a list of texts, returning the lookup entries and the list
+        of texts that are not in the cache and need to be analyzed"""
+        entries = self.lookup(texts, options)
+        misses = [text for text, (_, value) in zip(texts, entries)
+                  if value is None]
+        return entries, misses
+
+    def merge(self, entries, scansions):
+        """Fill the missing entries of a lookup with the scansions of the
+        texts that were not in the cache, storing them
+
+        :param entries: List of tuples of key and scansion from `split`
+        :param scansions: Iterable with the scansions of the missing texts,
+            in order
+        :return: List with the scansion of every text
+        :rtype: list
+        """
+        scansions = iter(scansions)
+        results = []
+        computed = []
+        for key, value in entries:
+            if value is None:
+                value = next(scansions)
+                computed.append((key, value))
+            results.append(value)
+        self.store(computed)
+        return results
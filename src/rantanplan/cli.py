@@ -14,10 +14,448 @@ Why does this file exist, and why not put this in __main__?
 
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
+import glob
+import json
+import os
+from collections import deque
+from contextlib import nullcontext
+from itertools import tee
+
 import click
 
+from . import __version__
+from .cache import ScansionCache
+from .core import BATCH_SIZE
+from .core import RHYTHM_FORMATS
+from .parallel import CHUNK_LINES
+from .parallel import imap_scansions
+from .parallel import stream_scansions
+from .rhyme_dictionary import RhymeDictionary
+from .rhyme_index import RHYME_KEYS
+from .runner import SHARD_SIZE
+from .runner import ManifestMismatchError
+from .runner import run as run_corpus
+from .server import MAX_QUEUE
+from .server import MAX_WAIT
+from .server import REQUEST_TIMEOUT
+from .server import make_server
+from .tagging import scan_tagged
+from .tagging import tag_texts
+
+OUTPUT_FORMATS = ("json", "ndjson")
+STDIN = "-"
+
+
+def parse_lengths(ctx, param, value):
+    """Click callback to parse a comma separated list of line lengths"""
+    if value is None:
+        return None
+    try:
+        return [int(length) for length in value.split(",")]
+    except ValueError:
+        raise click.BadParameter(
+            "must be a comma separated list of integers (e.g., 11,11,7)")
+
+
+def expand_inputs(inputs):
+    """Expand file names and glob patterns, keeping "-" for stdin
+
+    :param inputs: List of file names, glob patterns or "-"
+    :return: Generator with the file names
+    :rtype: generator
+    """
+    for pattern in inputs or (STDIN, ):
+        if pattern == STDIN or os.path.isfile(pattern):
+            yield pattern
+            continue
+        paths = sorted(path for path in glob.glob(pattern, recursive=True)
+                       if os.path.isfile(path))
+        if not paths:
+            raise click.BadParameter(f"No such file: {pattern}",
+                                     param_hint="INPUTS")
+        yield from paths
+
+
+def read_inputs(inputs):
+    """Read the texts of a list of file names or glob patterns lazily
+
+    :param inputs: List of file names, glob patterns or "-" for stdin
+    :return: Generator with tuples of source and text
+    :rtype: generator
+    """
+    for path in expand_inputs(inputs):
+        with click.open_file(path, encoding="utf-8") as input_file:
+            yield path, input_file.read()
+
+
+def write_records(records, output, output_format="json"):
+    """Write records to a file as a JSON list or as newline-delimited JSON,
+    one record at a time
+
+    :param records: Iterable of JSON serializable records
+    :param output: File object to write to
+    :param output_format: Either "json" or "ndjson"
+    """
+    if output_format == "ndjson":
+        for record in records:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+        return
+    separator = "[\n"
+    for record in records:
+        output.write(separator + json.dumps(record, ensure_ascii=False))
+        separator = ",\n"
+    output.write("[]\n" if separator == "[\n" else "\n]\n")
+
+
+def scan_inputs(inputs, jobs=1, batch_size=BATCH_SIZE, split_lines=None,
+                report=None, **options):
+    """Analyze the texts of a list of files or glob patterns
+
+    :param inputs: List of file names, glob patterns or "-" for stdin
+    :param jobs: Number of worker processes
+    :param batch_size: Number of texts tagged at once
+    :param split_lines: Number of lines from which texts are split in chunks
+        analyzed by several workers. Defaults to None for not splitting
+    :param report: Callable called with the scheduling report of the worker
+        processes
+    :param options: Keyword arguments for `get_scansion`
+    :return: Generator with a dictionary per text with its source and
+        scansion
+    :rtype: generator
+    """
+    sources = deque()
+
+    def texts():
+        for source, text in read_inputs(inputs):
+            sources.append(source)
+            yield text
+
+    scansions = imap_scansions(
+        texts(), jobs=jobs, batch_size=batch_size, split_lines=split_lines,
+        report=report, **options)
+    for scansion in scansions:
+        yield {"source": sources.popleft(), "scansion": scansion}
+
+
+@click.group()
+@click.version_option(__version__)
+def main():
+    """Rantanplan: scansion tool for Spanish texts"""
+
+
+def analysis_options(command):
+    """Add the analysis and processing options shared by the commands that
+    analyze texts"""
+    options = [
+        click.option("--rhyme", is_flag=True,
+                     help="Perform rhyme analysis."),
+        click.option("--rhythm-format", type=click.Choice(RHYTHM_FORMATS),
+                     default="pattern", show_default=True,
+                     help="Output format for the rhythm of each line."),
+        click.option("--split-stanzas-on", metavar="REGEX", default=None,
+                     help="Regular expression to split texts in stanzas."),
+        click.option("--rhythmical-lengths", metavar="LENGTHS", default=None,
+                     callback=parse_lengths,
+                     help="Comma separated rhythmical lengths the lines must "
+                          "meet."),
+        click.option("--offsets", is_flag=True,
+                     help="Output the character offsets of tokens, syllables "
+                          "and phonological groups instead of their text."),
+        click.option("--verse-types", is_flag=True,
+                     help="Output the rhythmic type of each line, e.g., "
+                          "heroic or sapphic hendecasyllables."),
+        click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+                     show_default=True,
+                     help="Number of worker processes, each with its own "
+                          "pipeline."),
+        click.option("--batch-size", type=click.IntRange(min=1),
+                     default=BATCH_SIZE, show_default=True,
+                     help="Number of texts tagged at once."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def scansion_options(command):
+    """Add the options shared by the commands that analyze texts on the fly,
+    which can also use the result cache"""
+    command = click.option(
+        "--cache", "use_cache", is_flag=True,
+        help="Reuse and store results in the on-disk cache.")(command)
+    return analysis_options(command)
+
+
+def report_schedule(report):
+    """Print the scheduling report of the worker processes to stderr"""
+    click.echo(
+        f"{report['units']} units of work, {report['split_texts']} texts "
+        f"split in chunks, {report['elapsed']:.1f}s", err=True)
+    for worker in report["workers"]:
+        click.echo(
+            f"Worker {worker['pid']}: {worker['units']} units, "
+            f"cost {worker['cost']}, busy {worker['busy']:.1f}s, "
+            f"{worker['utilization']:.0%} utilization", err=True)
+
+
+@main.command()
+@click.argument("inputs", nargs=-1)
+@scansion_options
+@click.option("--tagged", is_flag=True,
+              help="INPUTS are files written by the tag command.")
+@click.option("--format", "output_format", type=click.Choice(OUTPUT_FORMATS),
+              default="json", show_default=True,
+              help="Write a JSON list or newline-delimited JSON.")
+@click.option("-o", "--output", type=click.File("w", encoding="utf-8"),
+              default=STDIN, help="Output file. Defaults to stdout.")
+@click.option("--split-long", is_flag=True,
+              help=f"Split texts of {CHUNK_LINES} lines or more in chunks "
+                   "analyzed by several worker processes. Lines near the "
+                   "edges of the chunks may be tagged differently.")
+@click.option("--report", is_flag=True,
+              help="Print the utilization of each worker process to stderr.")
+def scan(inputs, rhyme, rhythm_format, split_stanzas_on, rhythmical_lengths,
+         offsets, verse_types, jobs, batch_size, use_cache, tagged,
+         output_format, output, split_long, report):
+    """Scan the texts in INPUTS (files or glob patterns, "-" for stdin)."""
+    options = {
+        "rhyme_analysis": rhyme,
+        "rhythm_format": rhythm_format,
+        "rhythmical_lengths": rhythmical_lengths,
+        "offsets_output": offsets,
+        "verse_type_output": verse_types,
+    }
+    if tagged:
+        if split_stanzas_on is not None:
+            raise click.UsageError(
+                "Stanzas of tagged texts are split by the tag command.")
+        ignored = [option for option, used in (
+            ("--jobs", jobs != 1),
+            ("--batch-size", batch_size != BATCH_SIZE),
+            ("--cache", use_cache),
+            ("--split-long", split_long),
+            ("--report", report),
+        ) if used]
+        if ignored:
+            raise click.UsageError(
+                f"{', '.join(ignored)} cannot be used with --tagged, tagged "
+                "texts are scanned in the current process.")
+        if not inputs or STDIN in inputs:
+            raise click.UsageError("Tagged texts cannot be read from stdin.")
+        records = (
+            {"source": text_id, "scansion": scansion}
+            for path in expand_inputs(inputs)
+            for text_id, scansion in scan_tagged(path, **options)
+        )
+        write_records(records, output, output_format)
+        return
+    with ScansionCache() if use_cache else nullcontext() as cache:
+        records = scan_inputs(
+            inputs,
+            jobs=jobs,
+            batch_size=batch_size,
+            split_stanzas_on=split_stanzas_on,
+            cache=cache,
+            split_lines=CHUNK_LINES if split_long else None,
+            report=report_schedule if report else None,
+            **options,
+        )
+        write_records(records, output, output_format)
+
+
+@main.command()
+@click.argument("inputs", nargs=-1)
+@click.option("-o", "--output", type=click.Path(dir_okay=False),
+              required=True, help="File of DocBins to write.")
+@click.option("--split-stanzas-on", metavar="REGEX", default=None,
+              help="Regular expression to split texts in stanzas.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=BATCH_SIZE,
+              show_default=True, help="Number of texts tagged at once.")
+def tag(inputs, output, split_stanzas_on, batch_size):
+    """Tag the texts in INPUTS (files or glob patterns, "-" for stdin) and
+    save them to a file of DocBins that can be scanned many times with
+    "scan --tagged" without tagging them again."""
+    sources, texts = tee(read_inputs(inputs))
+    tagged = tag_texts(
+        (text for _, text in texts),
+        output,
+        ids=(source for source, _ in sources),
+        split_stanzas_on=split_stanzas_on,
+        batch_size=batch_size,
+    )
+    click.echo(f"Tagged {tagged} texts into {output}", err=True)
+
+
+@main.command()
+@click.argument("input_file", metavar="INPUT", default=STDIN,
+                type=click.File("r", encoding="utf-8"))
+@scansion_options
+@click.option("-o", "--output", type=click.File("w", encoding="utf-8"),
+              default=STDIN, help="Output file. Defaults to stdout.")
+def stream(input_file, rhyme, rhythm_format, split_stanzas_on,
+           rhythmical_lengths, offsets, verse_types, jobs, batch_size,
+           use_cache, output):
+    """Scan a stream of newline-delimited JSON records like
+    {"id": ..., "text": ...} from INPUT (defaults to stdin), writing a
+    {"id": ..., "scansion": ...} record per line in the same order."""
+    with ScansionCache() if use_cache else nullcontext() as cache:
+        records = stream_scansions(
+            input_file,
+            jobs=jobs,
+            batch_size=batch_size,
+            rhyme_analysis=rhyme,
+            rhythm_format=rhythm_format,
+            split_stanzas_on=split_stanzas_on,
+            rhythmical_lengths=rhythmical_lengths,
+            offsets_output=offsets,
+            verse_type_output=verse_types,
+            cache=cache,
+        )
+        try:
+            write_records(records, output, "ndjson")
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True,
+              help="Address to bind to.")
+@click.option("--port", type=click.IntRange(0, 65535), default=8000,
+              show_default=True, help="Port to bind to.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=BATCH_SIZE,
+              show_default=True,
+              help="Maximum number of requests tagged at once.")
+@click.option("--max-wait", type=click.FloatRange(min=0),
+              default=MAX_WAIT * 1000, show_default=True,
+              help="Milliseconds to wait for more requests to fill a batch.")
+@click.option("--max-queue", type=click.IntRange(min=1), default=MAX_QUEUE,
+              show_default=True,
+              help="Requests waiting to be analyzed before answering 503.")
+@click.option("--timeout", type=click.FloatRange(min=0),
+              default=REQUEST_TIMEOUT, show_default=True,
+              help="Seconds a request waits for its result.")
+def serve(host, port, batch_size, max_wait, max_queue, timeout):
+    """Serve get_scansion and syllabify over a local HTTP/JSON API."""
+    server = make_server(host, port, batch_size=batch_size,
+                         max_wait=max_wait / 1000, max_queue=max_queue,
+                         request_timeout=timeout)
+    host, port = server.server_address[:2]
+    click.echo(f"Serving on http://{host}:{port}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def format_duration(seconds):
+    """Format a number of seconds as H:MM:SS"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def report_progress(status):
+    """Print the progress of a batch run to stderr"""
+    eta = status["eta"]
+    click.echo(
+        f"Shard {status['shard'] + 1}/{status['shards']}: "
+        f"{status['records']}/{status['total']} poems, "
+        f"{status['errors']} errors, {status['rate']:.1f} poems/s, "
+        f"ETA {format_duration(eta) if eta is not None else '-'}",
+        err=True)
+
+
+@main.command()
+@click.argument("source", type=click.Path(exists=True))
+@click.argument("output_dir", type=click.Path(file_okay=False))
+@analysis_options
+@click.option("--shard-size", type=click.IntRange(min=1), default=SHARD_SIZE,
+              show_default=True, help="Number of poems per output shard.")
+def run(source, output_dir, rhyme, rhythm_format, split_stanzas_on,
+        rhythmical_lengths, offsets, verse_types, jobs, batch_size,
+        shard_size):
+    """Scan the corpus in SOURCE (a directory of texts or an NDJSON file) in
+    shards written to OUTPUT_DIR. Completed shards are recorded in a
+    manifest, so running it again resumes an interrupted run."""
+    try:
+        summary = run_corpus(
+            source,
+            output_dir,
+            shard_size=shard_size,
+            jobs=jobs,
+            batch_size=batch_size,
+            progress=report_progress,
+            rhyme_analysis=rhyme,
+            rhythm_format=rhythm_format,
+            split_stanzas_on=split_stanzas_on,
+            rhythmical_lengths=rhythmical_lengths,
+            offsets_output=offsets,
+            verse_type_output=verse_types,
+        )
+    except ManifestMismatchError as error:
+        raise click.ClickException(str(error))
+    click.echo(
+        f"Done: {summary['records']} poems in {summary['shards']} shards, "
+        f"{summary['errors']} errors", err=True)
+
+
+@main.group()
+def rhymes():
+    """Build rhyme dictionaries and look up rhymes in them."""
+
+
+@rhymes.command()
+@click.argument("word_list", default=STDIN,
+                type=click.File("r", encoding="utf-8"))
+@click.option("-o", "--output", type=click.Path(dir_okay=False),
+              required=True, help="Rhyme dictionary file to write.")
+def build(word_list, output):
+    """Compute the rhyme keys of the words in WORD_LIST, one per line
+    (defaults to stdin), and save them with the reverse index from rhyme
+    keys to words as a gzipped JSON file."""
+    dictionary = RhymeDictionary.build(word_list)
+    dictionary.save(output)
+    click.echo(f"Built a rhyme dictionary of {len(dictionary)} words into "
+               f"{output}", err=True)
+
+
+@rhymes.command()
+@click.argument("word")
+@click.option("-d", "--dictionary", "path", required=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="Rhyme dictionary file written by the build command.")
+@click.option("--key", type=click.Choice(list(RHYME_KEYS)),
+              default="consonant", show_default=True,
+              help="Rhyme key to compare.")
+def find(word, path, key):
+    """Print the words of a rhyme dictionary that rhyme with WORD."""
+    dictionary = RhymeDictionary.load(path)
+    for rhyme in dictionary.rhymes_with(word, key=key):
+        click.echo(rhyme)
+
+
+@main.group()
+def cache():
+    """Inspect or purge the on-disk result cache.
+
+    The cache is stored in the file set in the RANTANPLAN_CACHE environment
+    variable, or in the user cache directory."""
+
+
+@cache.command()
+def info():
+    """Show the location, usage and limits of the cache."""
+    with ScansionCache() as scansion_cache:
+        click.echo(json.dumps(scansion_cache.info(), indent=2))
+
 
-@click.command()
-@click.argument('names', nargs=-1)
-def main(names):
-    click.echo(repr(names))
+@cache.command()
+@click.confirmation_option(prompt="Delete every cached result?")
+def purge():
+    """Delete every cached result."""
+    with ScansionCache() as scansion_cache:
+        deleted = scansion_cache.purge()
+    click.echo(f"Deleted {deleted} cached results")
@@ -10,12 +10,20 @@
 # http://elies.rediris.es/elies4/Fon8.htm
 import re
 from collections import Counter
+from collections import deque
+from collections import namedtuple
+from copy import deepcopy
+from functools import lru_cache
+from itertools import count
+from itertools import groupby
 from itertools import product
+from types import MappingProxyType
 
 from spacy.tokens import Doc
 
 from .pipeline import load_pipeline
 from .rhymes import analyze_rhyme
+from .rhymes import analyze_rhyme_segments
 from .structures import STRUCTURES_LENGTH
 from .syllabification import ALTERNATIVE_SYLLABIFICATION
 from .syllabification import CONSONANT_CLUSTER_RE
@@ -43,6 +51,20 @@ from .syllabification import WEAK_VOWELS
 from .syllabification import accents_re
 from .syllabification import letter_clusters_re
 from .syllabification import paroxytone_re
+from .utils import ContextCounter
+from .utils import chunked
+from .verses import get_stress_mask
+from .verses import get_verse_type
+
+# Number of texts tagged at once by the spaCy pipeline in batch processing
+BATCH_SIZE = 64
+# Output formats for the rhythm of each line
+RHYTHM_FORMATS = ("pattern", "binary", "indexed", "bitmask")
+# Distinct combinations of PoS and extended tag whose features are interned
+TAG_FEATURES_CACHE_SIZE = 2 ** 12
+
+TagFeatures = namedtuple(
+    "TagFeatures", ["pos", "tag", "monosyllable", "polysyllable"])
 
 
 def have_prosodic_liaison(first_syllable, second_syllable):
@@ -178,7 +200,7 @@ def get_length_ranges(phonological_groups, length):
 def get_rhythmical_pattern(phonological_groups, rhythm_format="pattern",
                            rhyme_analysis=False):
     """Gets a rhythm pattern for a poem in either "pattern": "-++-+-+-"
-    "binary": "01101010" or "indexed": [1,2,4,6] format
+    "binary": "01101010", "indexed": [1,2,4,6] or "bitmask": 86 format
 
     :param phonological_groups: a dictionary with the syllables of the line
     :param rhythm_format: The output format for the rhythm
@@ -244,15 +266,21 @@ def format_stress(stresses, rhythm_format="pattern", indexed_separator="-"):
         "indexed": 2,5,8
         "pattern": -++--+-+-
         "binary": 01101001
+        "bitmask": 150 (an integer with the bit of each stressed syllable set,
+        the first syllable being the least significant bit)
 
     :param stresses: List of boolean elements representing stressed syllables
-    :param rhythm_format: Format to be used: indexed, pattern, or binary
+    :param rhythm_format: Format to be used: indexed, pattern, binary or
+        bitmask
     :param indexed_separator: String to use as a separator for indexed pattern
-    :return: String with the stress pattern
+    :return: String with the stress pattern, or integer for bitmask
     :rtype: str
     """
     separator = ""
-    if rhythm_format == 'indexed':
+    if rhythm_format == 'bitmask':
+        return sum(1 << index for index, stress in enumerate(stresses)
+                   if stress)
+    elif rhythm_format == 'indexed':
         stresses = [
             str(index + 1) for index, stress in enumerate(stresses) if stress
         ]
@@ -414,8 +442,72 @@ def spacy_tag_to_dict(tag):
         return {}
 
 
+def is_stressed_monosyllable_tag(pos, tag):
+    """Check if the PoS and tag of a monosyllable make it stressed, unless
+    the word itself is an exception
+
+    :param pos: PoS tag from spacy ("DET")
+    :param tag: Dictionary with the extended PoS tag info from spacy
+    :return: `True` or `False`
+    :rtype: bool
+    """
+    return bool(
+        pos not in ("SCONJ", "CCONJ", "DET", "PRON", "ADP")
+        or (pos == "PRON" and tag.get("Case") == "Nom")
+        or (pos == "DET" and tag.get("Definite") in ("Dem", "Ind"))
+        or pos in ("PROPN", "NUM", "NOUN", "VERB", "AUX", "ADV")
+        or (pos == "ADJ" and tag.get("Poss", None) != "Yes")
+        or (pos == "PRON" and tag.get("PronType", None) in ("Prs", "Ind"))
+        or (pos == "DET" and tag.get("PronType", None) == "Ind")
+        or (pos in ("ADJ", "DET" and tag.get("Poss", None) == "Yes"))
+        or (pos in ("PRON", "DET")
+            and tag.get("PronType", None) in ("Exc", "Int", "Dem")))
+
+
+def is_stressed_polysyllable_tag(pos, tag):
+    """Check if the PoS and tag of a word with no orthographic accent make it
+    stressed, unless the word itself is an exception
+
+    :param pos: PoS tag from spacy ("DET")
+    :param tag: Dictionary with the extended PoS tag info from spacy
+    :return: `True` or `False`
+    :rtype: bool
+    """
+    return bool(
+        pos in ("INTJ", "PROPN", "NUM", "NOUN", "VERB", "AUX", "ADV")
+        or pos == "ADJ"
+        or (pos == "PRON" and tag.get("PronType", None) in ("Prs", "Ind"))
+        or (pos == "DET" and tag.get("PronType", None) in ("Dem", "Ind"))
+        or (pos == "DET" and tag.get("Definite", None) == "Ind")
+        or (pos == "PRON" and tag.get("Poss", None) == "Yes")
+        or (pos in ("PRON", "DET")
+            and tag.get("PronType", None) in ("Exc", "Int", "Dem")))
+
+
+@lru_cache(maxsize=TAG_FEATURES_CACHE_SIZE)
+def get_tag_features(pos, tag):
+    """Intern the features of a combination of PoS and extended tag string,
+    parsing the tag and precomputing the stress eligibility of monosyllables
+    and polysyllables only once for each distinct combination
+
+    :param pos: PoS tag from spacy ("DET")
+    :param tag: Extended PoS tag info from spacy
+        ("Definite=Ind|Gender=Masc|Number=Sing|PronType=Art")
+    :return: Named tuple with pos, the read-only tag dictionary and the
+        monosyllable and polysyllable stress eligibility
+    :rtype: TagFeatures
+    """
+    tags = MappingProxyType(spacy_tag_to_dict(tag))
+    return TagFeatures(
+        pos=pos,
+        tag=tags,
+        monosyllable=is_stressed_monosyllable_tag(pos, tags),
+        polysyllable=is_stressed_polysyllable_tag(pos, tags),
+    )
+
+
 def get_word_stress(word, pos, tag, alternative_syllabification=False,
-                    is_last_word=False):
+                    is_last_word=False, features=None):
     """Gets a list of syllables from a word and creates a list with syllabified
     word and stressed syllable index
 
@@ -426,6 +518,9 @@ def get_word_stress(word, pos, tag, alternative_syllabification=False,
     :param pos: PoS tag from spacy ("DET")
     :param tag: Extended PoS tag info from spacy
         ("Definite=Ind|Gender=Masc|Number=Sing|PronType=Art")
+    :param features: `TagFeatures` of pos and tag from `get_tag_features`,
+        with the stress eligibility precomputed. Defaults to None to
+        evaluate pos and tag for this word
     :return: Dict with [original syllab word, stressed syllabified word,
         negative index position of stressed syllable or 0 if not stressed]
     :rtype: dict
@@ -467,28 +562,9 @@ def get_word_stress(word, pos, tag, alternative_syllabification=False,
             if ((first_monosyllable not in UNSTRESSED_UNACCENTED_MONOSYLLABLES)
                     and (
                         first_monosyllable in STRESSED_UNACCENTED_MONOSYLLABLES
-                        or pos not in (
-                                "SCONJ", "CCONJ", "DET", "PRON", "ADP")
-                        or (pos == "PRON" and tag.get("Case") == "Nom")
-                        or (pos == "DET" and tag.get("Definite") in (
-                            "Dem", "Ind"))
-                        or pos in (
-                                "PROPN", "NUM", "NOUN", "VERB", "AUX",
-                                "ADV")
-                        or (pos == "ADJ" and tag.get("Poss",
-                                                     None) != "Yes")
-                        or (pos == "PRON"
-                            and tag.get("PronType", None) in (
-                                    "Prs", "Ind"))
-                        or (pos == "DET" and tag.get("PronType",
-                                                     None) == "Ind")
-                        or (pos in ("ADJ", "DET"
-                                           and tag.get("Poss",
-                                                       None) == "Yes"))
-                        or (pos in ("PRON", "DET")
-                            and tag.get("PronType", None) in (
-                                    "Exc", "Int", "Dem"))
-                        or "".join(word).lower() in STRESSED_PRON) and (
+                        or (features.monosyllable if features is not None
+                            else is_stressed_monosyllable_tag(pos, tag))
+                        or word_lower in STRESSED_PRON) and (
                             word_lower not in UNSTRESSED_FORMS)):
                 stressed_position = -1
             else:
@@ -497,16 +573,8 @@ def get_word_stress(word, pos, tag, alternative_syllabification=False,
             tilde = get_orthographic_accent(syllable_list)
             if tilde is not None:
                 stressed_position = tilde - len(syllable_list)
-            elif (pos in ("INTJ", "PROPN", "NUM", "NOUN", "VERB", "AUX", "ADV")
-                  or pos == "ADJ"
-                  or (pos == "PRON" and tag.get("PronType", None) in (
-                            "Prs", "Ind"))
-                  or (pos == "DET" and tag.get("PronType", None) in (
-                            "Dem", "Ind"))
-                  or (pos == "DET" and tag.get("Definite", None) == "Ind")
-                  or (pos == "PRON" and tag.get("Poss", None) == "Yes")
-                  or (pos in ("PRON", "DET")
-                      and tag.get("PronType", None) in ("Exc", "Int", "Dem"))
+            elif ((features.polysyllable if features is not None
+                   else is_stressed_polysyllable_tag(pos, tag))
                   or (word_lower in STRESSED_PRON)) and (
                     word_lower not in UNSTRESSED_FORMS) and (
                     word_lower not in POSSESSIVE_PRON_UNSTRESSED):
@@ -585,16 +653,18 @@ def get_words(word_list, alternative_syllabification=False):
             else:
                 pos = word.pos_ or ""
                 tag = word.tag_ or ""
-            tags = spacy_tag_to_dict(tag)
+            features = get_tag_features(pos, tag)
             # If it's the last word of a verse, mark it so it's always stressed
             # `is` is used here to be sure it's the same spacy object
             if word is [w for w in word_list if w.is_alpha][-1]:
-                stressed_word = get_word_stress(word.text, pos, tags,
+                stressed_word = get_word_stress(word.text, pos, features.tag,
                                                 alternative_syllabification,
-                                                is_last_word=True)
+                                                is_last_word=True,
+                                                features=features)
             else:
-                stressed_word = get_word_stress(word.text, pos, tags,
-                                                alternative_syllabification)
+                stressed_word = get_word_stress(word.text, pos, features.tag,
+                                                alternative_syllabification,
+                                                features=features)
             if word.pos_ in ("AUX", "VERB") and word._.affixes_length:
                 stressed_word.update(
                     {'affixes_length': word._.affixes_length})
@@ -681,10 +751,39 @@ def set_stress_exceptions(word):
     return word
 
 
+def get_scansion_options(rhyme_analysis=False, rhythm_format="pattern",
+                         rhythmical_lengths=None, split_stanzas_on=None,
+                         pos_output=False, always_return_rhyme=False,
+                         rhythmical_lengths_window=8, segment_stanzas=False,
+                         offsets_output=False, verse_type_output=False,
+                         rhyme_offset=4):
+    """Return a dictionary with every analysis option of `get_scansion`,
+    filling in the default values of the ones not given
+
+    :return: Dictionary with the keyword arguments of `get_scansion`
+    :rtype: dict
+    """
+    return {
+        "rhyme_analysis": rhyme_analysis,
+        "rhythm_format": rhythm_format,
+        "rhythmical_lengths": rhythmical_lengths,
+        "split_stanzas_on": split_stanzas_on,
+        "pos_output": pos_output,
+        "always_return_rhyme": always_return_rhyme,
+        "rhythmical_lengths_window": rhythmical_lengths_window,
+        "segment_stanzas": segment_stanzas,
+        "offsets_output": offsets_output,
+        "verse_type_output": verse_type_output,
+        "rhyme_offset": rhyme_offset,
+    }
+
+
 def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                  rhythmical_lengths=None, split_stanzas_on=None,
                  pos_output=False, always_return_rhyme=False,
-                 rhythmical_lengths_window=8):
+                 rhythmical_lengths_window=8, segment_stanzas=False,
+                 offsets_output=False, verse_type_output=False,
+                 rhyme_offset=4, cache=None):
     """Generates a list of dictionaries for each line
 
     :param text: Full text to be analyzed
@@ -699,10 +798,43 @@ def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
         even if no structure is detected
     :param rhythmical_lengths_window: Size of the window to calculate the most
         frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        text in stanzas during rhyme analysis, detecting a structure for each
+        one of them. Lines get the structure of their stanza and the index of
+        the stanza in a "stanza" key
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
+    :param cache: `ScansionCache` to look up the result before analyzing the
+        text and to store it afterwards. Defaults to None for no caching
     :return: list of dictionaries per line
         (or list of list of dictionaries if split on stanzas)
     :rtype: list
     """
+    if cache is not None:
+        options = get_scansion_options(
+            rhyme_analysis=rhyme_analysis,
+            rhythm_format=rhythm_format,
+            rhythmical_lengths=rhythmical_lengths,
+            split_stanzas_on=split_stanzas_on,
+            pos_output=pos_output,
+            always_return_rhyme=always_return_rhyme,
+            rhythmical_lengths_window=rhythmical_lengths_window,
+            segment_stanzas=segment_stanzas,
+            offsets_output=offsets_output,
+            verse_type_output=verse_type_output,
+            rhyme_offset=rhyme_offset,
+        )
+        [(key, scansion)] = cache.lookup([text], options)
+        if scansion is None:
+            scansion = get_scansion(text, **options)
+            cache.store([(key, scansion)])
+        return scansion
     if split_stanzas_on is None:
         return _get_scansion(
             text=text,
@@ -712,9 +844,14 @@ def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
             pos_output=pos_output,
             always_return_rhyme=always_return_rhyme,
             rhythmical_lengths_window=rhythmical_lengths_window,
+            segment_stanzas=segment_stanzas,
+            offsets_output=offsets_output,
+            verse_type_output=verse_type_output,
+            rhyme_offset=rhyme_offset,
         )
     else:
-        return [
+        stanzas = split_stanzas(text, split_stanzas_on)
+        scansion = [
             _get_scansion(
                 text=stanza,
                 rhyme_analysis=rhyme_analysis,
@@ -723,14 +860,173 @@ def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                 pos_output=pos_output,
                 always_return_rhyme=always_return_rhyme,
                 rhythmical_lengths_window=rhythmical_lengths_window,
-            ) for stanza in re.compile(split_stanzas_on).split(text)
+                segment_stanzas=segment_stanzas,
+                offsets_output=offsets_output,
+                verse_type_output=verse_type_output,
+                rhyme_offset=rhyme_offset,
+            ) for _, stanza in stanzas
         ]
+        if offsets_output:
+            for (offset, _), lines in zip(stanzas, scansion):
+                shift_offsets(lines, offset)
+        return scansion
+
+
+def split_stanzas(text, split_stanzas_on=None):
+    """Split a text in stanzas with a regular expression
+
+    :param text: Full text
+    :param split_stanzas_on: Regular expression to split text in stanzas.
+        Defaults to None for not splitting.
+    :return: List with a tuple of the character offset of each stanza in the
+        text and the stanza
+    :rtype: list
+    """
+    if split_stanzas_on is None:
+        return [(0, text)]
+    stanzas = []
+    offset = 0
+    for stanza in re.compile(split_stanzas_on).split(text):
+        offset = text.find(stanza, offset)
+        stanzas.append((offset, stanza))
+        offset += len(stanza)
+    return stanzas
+
+
+def get_scansions(texts, rhyme_analysis=False, rhythm_format="pattern",
+                  rhythmical_lengths=None, split_stanzas_on=None,
+                  pos_output=False, always_return_rhyme=False,
+                  rhythmical_lengths_window=8, segment_stanzas=False,
+                  offsets_output=False, verse_type_output=False,
+                  rhyme_offset=4, batch_size=BATCH_SIZE, cache=None):
+    """Generates the scansion of each text of an iterable of texts, tagging
+    them in batches with the spaCy pipeline. Results are yielded in the same
+    order as the texts as soon as they are available.
+
+    :param texts: Iterable of texts to be analyzed
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param split_stanzas_on: Regular expression to split texts in stanzas.
+        Defaults to None for not splitting.
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param rhythmical_lengths_window: Size of the window to calculate the most
+        frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        texts in stanzas during rhyme analysis
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
+    :param batch_size: Number of texts (or stanzas) tagged at once
+    :param cache: `ScansionCache` to look up the results before analyzing the
+        texts and to store them afterwards. Only the texts not found are
+        tagged. Defaults to None for no caching
+    :return: Generator with the output of `get_scansion` for each text
+    :rtype: generator
+    """
+    options = {
+        "rhyme_analysis": rhyme_analysis,
+        "rhythm_format": rhythm_format,
+        "rhythmical_lengths": rhythmical_lengths,
+        "pos_output": pos_output,
+        "always_return_rhyme": always_return_rhyme,
+        "rhythmical_lengths_window": rhythmical_lengths_window,
+        "segment_stanzas": segment_stanzas,
+        "offsets_output": offsets_output,
+        "verse_type_output": verse_type_output,
+        "rhyme_offset": rhyme_offset,
+    }
+    if cache is not None:
+        options["split_stanzas_on"] = split_stanzas_on
+        for chunk in chunked(texts, batch_size):
+            entries, misses = cache.split(chunk, options)
+            scansions = get_scansions(
+                misses, batch_size=batch_size, **options) if misses else ()
+            yield from cache.merge(entries, scansions)
+        return
+    nlp = load_pipeline()
+    if split_stanzas_on is None:
+        for doc in nlp.pipe(texts, batch_size=batch_size):
+            yield _get_scansion(doc, **options)
+    else:
+        stanzas = (
+            (stanza, (index, offset))
+            for index, text in enumerate(texts)
+            for offset, stanza in split_stanzas(text, split_stanzas_on)
+        )
+        docs = nlp.pipe(stanzas, as_tuples=True, batch_size=batch_size)
+        for _, text_docs in groupby(docs, key=lambda doc: doc[1][0]):
+            scansion = []
+            for doc, (_, offset) in text_docs:
+                lines = _get_scansion(doc, **options)
+                if offsets_output:
+                    shift_offsets(lines, offset)
+                scansion.append(lines)
+            yield scansion
+
+
+def get_scansion_sweep(text, option_sets, batch_size=BATCH_SIZE):
+    """Generates the scansion of a text for each of several sets of options,
+    tagging and syllabifying the text only once (once per distinct
+    split_stanzas_on) and running only the option-dependent analysis for
+    each set
+
+    :param text: Full text to be analyzed
+    :param option_sets: List of dictionaries with keyword arguments for
+        `get_scansion`
+    :param batch_size: Number of stanzas tagged at once when splitting
+    :return: List with the output of `get_scansion` for each set of options
+    :rtype: list
+    """
+    option_sets = [get_scansion_options(**options) for options in option_sets]
+    uses = Counter(options["split_stanzas_on"] for options in option_sets)
+    prepared = {}
+    scansions = []
+    for options in option_sets:
+        options = options.copy()
+        split_stanzas_on = options.pop("split_stanzas_on")
+        if split_stanzas_on not in prepared:
+            nlp = load_pipeline()
+            stanzas = split_stanzas(text, split_stanzas_on)
+            if split_stanzas_on is None:
+                docs = [nlp(text)]
+            else:
+                docs = nlp.pipe((stanza for _, stanza in stanzas),
+                                batch_size=batch_size)
+            prepared[split_stanzas_on] = [
+                (offset, get_lines(doc))
+                for (offset, _), doc in zip(stanzas, docs)
+            ]
+        uses[split_stanzas_on] -= 1
+        stanzas = []
+        for offset, (lines, raw_tokens) in prepared[split_stanzas_on]:
+            lines = analyze_lines(
+                # The last set of options can take the prepared lines
+                lines if not uses[split_stanzas_on] else deepcopy(lines),
+                raw_tokens,
+                **options,
+            )
+            if options["offsets_output"]:
+                shift_offsets(lines, offset)
+            stanzas.append(lines)
+        scansions.append(stanzas[0] if split_stanzas_on is None else stanzas)
+    return scansions
 
 
 def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                   rhythmical_lengths=None, split_stanzas_on=None,
                   pos_output=False, always_return_rhyme=False,
-                  rhythmical_lengths_window=8):
+                  rhythmical_lengths_window=8, segment_stanzas=False,
+                  offsets_output=False, verse_type_output=False,
+                  rhyme_offset=4):
     """Generates a list of dictionaries for each line
 
     :param text: Full text to be analyzed
@@ -745,6 +1041,16 @@ def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
         even if no structure is detected
     :param rhythmical_lengths_window: Size of the window to calculate the most
         frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        text in stanzas during rhyme analysis
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
     :return: list of dictionaries per line
     :rtype: list
     """
@@ -753,89 +1059,526 @@ def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
     else:
         nlp = load_pipeline()
         tokens = nlp(text)
-    seen_tokens = []
+    lines, raw_tokens = get_lines(tokens)
+    return analyze_lines(
+        lines,
+        raw_tokens,
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        rhythmical_lengths_window=rhythmical_lengths_window,
+        segment_stanzas=segment_stanzas,
+        offsets_output=offsets_output,
+        verse_type_output=verse_type_output,
+        rhyme_offset=rhyme_offset,
+    )
+
+
+def iter_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
+                  rhythmical_lengths=None, split_stanzas_on=None,
+                  pos_output=False, always_return_rhyme=False,
+                  rhythmical_lengths_window=8, segment_stanzas=False,
+                  offsets_output=False, verse_type_output=False,
+                  rhyme_offset=4):
+    """Generates the dictionary of each line of `get_scansion` as soon as it
+    is final, releasing its spaCy tokens, so long texts can be written out
+    line by line. Without rhyme analysis only the lines inside the context
+    window are kept in memory; with rhyme analysis the structure of the
+    whole text is detected before the first line is generated. The lines
+    are the same that `get_scansion` returns for the same options
+
+    :param text: Full text to be analyzed, or its spaCy Doc
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: Output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param split_stanzas_on: Regular expression to split text in stanzas.
+        Defaults to None for not splitting.
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param rhythmical_lengths_window: Size of the window to calculate the most
+        frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        text in stanzas during rhyme analysis
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
+    :return: Generator with a dictionary per line (or a list of dictionaries
+        per stanza if split on stanzas)
+    :rtype: generator
+    """
+    options = dict(
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        rhythmical_lengths_window=rhythmical_lengths_window,
+        segment_stanzas=segment_stanzas,
+        offsets_output=offsets_output,
+        verse_type_output=verse_type_output,
+        rhyme_offset=rhyme_offset,
+    )
+    if split_stanzas_on is not None:
+        for offset, stanza in split_stanzas(text, split_stanzas_on):
+            lines = _get_scansion(stanza, **options)
+            if offsets_output:
+                shift_offsets(lines, offset)
+            yield lines
+        return
+    if isinstance(text, Doc):
+        tokens = text
+    else:
+        nlp = load_pipeline()
+        tokens = nlp(text)
+    yield from iter_analyzed_lines(iter_lines(tokens), **options)
+
+
+def get_lines(tokens):
+    """Split the tagged tokens of a text in lines, syllabifying their words
+    and extracting their phonological groups. This is the part of the
+    analysis that does not depend on the options of `get_scansion`
+
+    :param tokens: spaCy Doc or list of tokens of the text
+    :return: Tuple with the list of dictionary lines, with "tokens" and
+        "phonological_groups", and the list of spaCy tokens of each line
+    :rtype: tuple
+    """
     lines = []
     raw_tokens = []
-    # Handle multi-line sentences and create the line with words
+    for line, line_tokens in iter_lines(tokens):
+        lines.append(line)
+        raw_tokens.append(line_tokens)
+    return lines, raw_tokens
+
+
+def iter_lines(tokens):
+    """Generates the lines of `get_lines` one at a time
+
+    :param tokens: spaCy Doc or list of tokens of the text
+    :return: Generator with a tuple of dictionary line and spaCy tokens
+    :rtype: generator
+    """
+    for line_tokens in split_lines(tokens):
+        yield get_line(line_tokens), line_tokens
+
+
+def split_lines(tokens):
+    """Split the tagged tokens of a text in lines
+
+    :param tokens: spaCy Doc or list of tokens of the text
+    :return: Generator with the list of spaCy tokens of each line
+    :rtype: generator
+    """
+    seen_tokens = []
+    # Handle multi-line sentences
     for token in tokens:
         if (token.pos_ == SPACE
                 and '\n' in token.orth_
                 and len(seen_tokens) > 0):
-            lines.append({"tokens": get_words(seen_tokens, False)})
-            raw_tokens.append(seen_tokens)
+            yield seen_tokens
             seen_tokens = []
         else:
             seen_tokens.append(token)
     if len(seen_tokens) > 0:
-        lines.append({"tokens": get_words(seen_tokens, False)})
-        raw_tokens.append(seen_tokens)
-    # Extract phonological groups and rhythm per line
-    for line in lines:
-        syllables = get_syllables_word_end(line["tokens"])
-        phonological_groups = get_phonological_groups(
-            get_phonological_groups(syllables, liaison_type="sinaeresis")
-        )
-        line.update({
-            "phonological_groups": phonological_groups,
-            "rhythm": get_rhythmical_pattern(phonological_groups,
-                                             rhythm_format,
-                                             rhyme_analysis=rhyme_analysis)
-        })
-    if rhyme_analysis:
-        analyzed_lines = analyze_rhyme(lines,
-                                       always_return_rhyme=always_return_rhyme)
-        if analyzed_lines is not None:
-            for rhyme in [analyzed_lines]:
-                for index, line in enumerate(lines):
-                    line["structure"] = rhyme.get("name", "unknown")
-                    line["rhyme"] = rhyme["rhyme"][index]
-                    line["ending"] = rhyme["endings"][index]
-                    line["ending_stress"] = rhyme["endings_stress"][index]
-                    if line["ending_stress"] == 0:
-                        line["rhyme_type"] = ""
-                        line["rhyme_relaxation"] = None
-                    else:
-                        line["rhyme_type"] = rhyme["rhyme_type"]
-                        line["rhyme_relaxation"] = rhyme["rhyme_relaxation"]
+        yield seen_tokens
+
+
+def get_line(tokens):
+    """Create the dictionary of a line with its words and its phonological
+    groups
+
+    :param tokens: List of spaCy tokens of the line
+    :return: Dictionary line with "tokens" and "phonological_groups"
+    :rtype: dict
+    """
+    line = {"tokens": get_words(tokens, False)}
+    syllables = get_syllables_word_end(line["tokens"])
+    line["phonological_groups"] = get_phonological_groups(
+        get_phonological_groups(syllables, liaison_type="sinaeresis")
+    )
+    return line
+
+
+def analyze_lines(lines, raw_tokens, rhyme_analysis=False,
+                  rhythm_format="pattern", rhythmical_lengths=None,
+                  pos_output=False, always_return_rhyme=False,
+                  rhythmical_lengths_window=8, segment_stanzas=False,
+                  offsets_output=False, verse_type_output=False,
+                  rhyme_offset=4):
+    """Analyze the rhythm and rhyme of the lines from `get_lines`, fitting
+    their lengths to the detected structure. Lines are modified in place
+
+    :param lines: List of dictionary lines from `get_lines`
+    :param raw_tokens: List of spaCy tokens of each line from `get_lines`
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: Output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param rhythmical_lengths_window: Size of the window to calculate the most
+        frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        text in stanzas during rhyme analysis
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
+    :return: list of dictionaries per line
+    :rtype: list
+    """
+    return list(iter_analyzed_lines(
+        zip(lines, raw_tokens),
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        rhythmical_lengths_window=rhythmical_lengths_window,
+        segment_stanzas=segment_stanzas,
+        offsets_output=offsets_output,
+        verse_type_output=verse_type_output,
+        rhyme_offset=rhyme_offset,
+    ))
+
+
+def iter_analyzed_lines(line_tokens, rhyme_analysis=False,
+                        rhythm_format="pattern", rhythmical_lengths=None,
+                        pos_output=False, always_return_rhyme=False,
+                        rhythmical_lengths_window=8, segment_stanzas=False,
+                        offsets_output=False, verse_type_output=False,
+                        rhyme_offset=4):
+    """Generates the lines of `analyze_lines` as soon as each one is final.
+    Without rhyme analysis, lines are read lazily from line_tokens, keeping
+    only the ones inside the context window, and each line is yielded after
+    its own length fitting. With rhyme analysis, all the lines are needed to
+    detect the structure, and then they are fitted and yielded stanza by
+    stanza. The spaCy tokens of a line are released once it is yielded
+
+    :param line_tokens: Iterable of tuples of dictionary line and spaCy
+        tokens, as generated by `iter_lines`
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: Output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param rhythmical_lengths_window: Size of the window to calculate the most
+        frequent line length when rhythmical_lengths is False. Defaults to 8
+    :param segment_stanzas: `True` or `False` for automatically splitting the
+        text in stanzas during rhyme analysis
+    :param offsets_output: `True` or `False` for replacing the text of
+        tokens, syllables and phonological groups with their "start" and
+        "end" character offsets in the text
+    :param verse_type_output: `True` or `False` for adding the rhythmic type
+        of each line to its rhythm as "verse_type", e.g., "heroic" for a
+        hendecasyllable stressed on the 2nd and 6th syllables
+    :param rhyme_offset: Maximum distance in lines between two rhyming
+        lines, the offset of `analyze_rhyme`. Defaults to 4, None for no limit
+    :return: Generator with a dictionary per line
+    :rtype: generator
+    """
+    def add_rhythm(line):
+        line["rhythm"] = get_rhythmical_pattern(line["phonological_groups"],
+                                                rhythm_format,
+                                                rhyme_analysis=rhyme_analysis)
+        return line
+
+    def finish(line, tokens):
+        if offsets_output:
+            set_offsets(line, tokens)
+        if verse_type_output:
+            line["rhythm"]["verse_type"] = get_verse_type(
+                get_stress_mask(line["rhythm"]), line["rhythm"]["length"])
+        if not pos_output:
+            remove_pos_from_output([line])
+        return remove_exact_length_matches([line])[0]
+
+    if not rhyme_analysis:
+        # Lines before the current one are already fitted, and lines after it
+        # up to the window (at least one to know if it is the only line) are
+        # needed to get the length from the context
+        lookahead = max(rhythmical_lengths_window, 1)
+        pending = ((add_rhythm(line), tokens) for line, tokens in line_tokens)
+        window_lines = deque()
+        window_tokens = deque()
+        # Index of the first line of window_lines
+        first = 0
+
+        def get_length(index):
+            position = index - first
+            if 0 <= position < len(window_lines):
+                return window_lines[position]["rhythm"]["length"]
+            return None
+
+        context = ContextCounter(get_length, window=rhythmical_lengths_window)
+        for idx in count():
+            while len(window_lines) <= idx - first + lookahead:
+                line, tokens = next(pending, (None, None))
+                if line is None:
+                    break
+                window_lines.append(line)
+                window_tokens.append(tokens)
+            position = idx - first
+            if position >= len(window_lines):
+                return
+            line = window_lines[position]
+            if rhythmical_lengths:
+                structure_length_idx = rhythmical_lengths[idx]
+            elif idx > 0 or len(window_lines) > 1:
+                structure_length_idx = context.most_common(idx)
+            else:
+                structure_length_idx = None
+            fit_line_length(line, window_tokens[position],
+                            structure_length_idx, rhythm_format,
+                            rhyme_analysis)
+            yield finish(line, window_tokens[position])
+            window_tokens[position] = None
+            while idx - first >= rhythmical_lengths_window:
+                window_lines.popleft()
+                window_tokens.popleft()
+                first += 1
+        return
+    lines = []
+    raw_tokens = []
+    for line, tokens in line_tokens:
+        lines.append(add_rhythm(line))
+        raw_tokens.append(tokens)
     lines_length = len(lines)
-    structure_length = rhythmical_lengths if rhythmical_lengths else None
-    for idx, line in enumerate(lines):
-        if not structure_length:
-            # Handle repeating stanzas
-            line_structure = line.get("structure", None)
-            structure_length, repeating_structure = STRUCTURES_LENGTH.get(
-                line_structure, [[], False])
-            if structure_length and repeating_structure:
-                repetitions = int(lines_length / len(structure_length))
-                structure_length = structure_length * repetitions
-        if structure_length:
-            structure_length_idx = structure_length[idx]
-        elif lines_length > 1:
-            structure_length_idx = get_structure_from_context(
-                lines, idx, window=rhythmical_lengths_window
-            )
+    if segment_stanzas:
+        analyzed_stanzas = analyze_rhyme_segments(
+            lines, offset=rhyme_offset,
+            always_return_rhyme=always_return_rhyme)
+        stanzas = [(stanza["start"], stanza["end"])
+                   for stanza in analyzed_stanzas]
+        for index, stanza in enumerate(analyzed_stanzas):
+            for line in lines[stanza["start"]:stanza["end"]]:
+                line["stanza"] = index
+            if "rhyme" in stanza:
+                add_rhyme_to_lines(
+                    lines[stanza["start"]:stanza["end"]], stanza)
+    else:
+        stanzas = [(0, lines_length)]
+        analyzed_lines = analyze_rhyme(
+            lines, offset=rhyme_offset,
+            always_return_rhyme=always_return_rhyme)
+        if analyzed_lines is not None:
+            add_rhyme_to_lines(lines, analyzed_lines)
+    # Same as get_structure_from_context over the lines fitted so far
+    context = ContextCounter(
+        lambda index: (lines[index]["rhythm"]["length"]
+                       if index < lines_length else None),
+        window=rhythmical_lengths_window)
+    for start, end in stanzas:
+        stanza_length = end - start
+        structure_length = rhythmical_lengths if rhythmical_lengths else None
+        structure_offset = 0 if rhythmical_lengths else start
+        for idx in range(start, end):
+            line = lines[idx]
+            if not structure_length:
+                # Handle repeating stanzas
+                line_structure = line.get("structure", None)
+                structure_length, repeating_structure = STRUCTURES_LENGTH.get(
+                    line_structure, [[], False])
+                if structure_length and repeating_structure:
+                    repetitions = int(stanza_length / len(structure_length))
+                    structure_length = structure_length * repetitions
+            if structure_length:
+                structure_length_idx = structure_length[
+                    idx - structure_offset]
+            elif lines_length > 1:
+                structure_length_idx = context.most_common(idx)
+            else:
+                structure_length_idx = None
+            fit_line_length(line, raw_tokens[idx], structure_length_idx,
+                            rhythm_format, rhyme_analysis)
+            yield finish(line, raw_tokens[idx])
+            raw_tokens[idx] = None
+
+
+def set_offsets(line, tokens):
+    """Replace the text of the tokens, syllables and phonological groups of a
+    line with their "start" and "end" character offsets in the text, taken
+    from the spaCy tokens. Syllables take as many characters of their word as
+    they have, and phonological groups as many letters of the line, so a
+    group formed by synalepha spans the characters between its words too
+
+    :param line: Dictionary line
+    :param tokens: List of spaCy tokens of the line
+    :return: The dictionary line
+    :rtype: dict
+    """
+    letters = []
+    tokens = iter(tokens)
+    for index, token in enumerate(line["tokens"]):
+        spacy_token = next(tokens)
+        start = spacy_token.idx
+        end = start + len(spacy_token)
+        if "word" not in token:
+            line["tokens"][index] = {
+                key: value for key, value in token.items() if key != "symbol"}
+            line["tokens"][index].update({"start": start, "end": end})
+            continue
+        lengths = [len(syllable["syllable"]) for syllable in token["word"]]
+        # Words with affixes are split in several adjacent spaCy tokens
+        while end - start < sum(lengths) and not spacy_token.whitespace_:
+            spacy_token = next(tokens, None)
+            if spacy_token is None or spacy_token.idx != end:
+                break
+            end += len(spacy_token)
+        # Syllables are shared with the phonological groups, so new
+        # dictionaries are created instead of updating them
+        word = []
+        offset = start
+        for syllable, length in zip(token["word"], lengths):
+            syllable = {key: value for key, value in syllable.items()
+                        if key != "syllable"}
+            syllable.update({"start": offset,
+                             "end": min(offset + length, end)})
+            offset = syllable["end"]
+            word.append(syllable)
+        word[-1]["end"] = end
+        line["tokens"][index] = dict(token, word=word, start=start, end=end)
+        letters.extend(range(start, end))
+    groups = []
+    offset = 0
+    for group in line["phonological_groups"]:
+        length = len(group["syllable"])
+        group_letters = letters[offset:offset + length] or letters[-1:]
+        group = {key: value for key, value in group.items()
+                 if key != "syllable"}
+        group.update({"start": group_letters[0],
+                      "end": group_letters[-1] + 1})
+        groups.append(group)
+        offset += length
+    line["phonological_groups"] = groups
+    return line
+
+
+def shift_offsets(lines, offset):
+    """Add offset to the character offsets of lines analyzed with
+    offsets_output, e.g., to make the offsets of the lines of a stanza
+    relative to the whole text
+
+    :param lines: List of dictionary lines
+    :param offset: Number of characters to add
+    :return: The list of lines
+    :rtype: list
+    """
+    if not offset:
+        return lines
+    for line in lines:
+        for token in line["tokens"]:
+            token["start"] += offset
+            token["end"] += offset
+            for syllable in token.get("word", ()):
+                syllable["start"] += offset
+                syllable["end"] += offset
+        for group in line["phonological_groups"]:
+            group["start"] += offset
+            group["end"] += offset
+    return lines
+
+
+def resolve_offsets(lines, text):
+    """Generates copies of lines analyzed with offsets_output with the text
+    of their tokens, syllables and phonological groups taken back from the
+    analyzed text, one line at a time
+
+    :param lines: Iterable of dictionary lines with character offsets
+    :param text: Full text that was analyzed
+    :return: Generator with a dictionary line per line, with "symbol" and
+        "syllable" keys as without offsets_output
+    :rtype: generator
+    """
+    for line in lines:
+        tokens = []
+        for token in line["tokens"]:
+            if "word" in token:
+                tokens.append({**token, "word": [
+                    {**syllable,
+                     "syllable": text[syllable["start"]:syllable["end"]]}
+                    for syllable in token["word"]
+                ]})
+            else:
+                tokens.append(
+                    {**token, "symbol": text[token["start"]:token["end"]]})
+        groups = [
+            {**group, "syllable": "".join(
+                character
+                for character in text[group["start"]:group["end"]]
+                if character.isalpha())}
+            for group in line["phonological_groups"]
+        ]
+        yield {**line, "tokens": tokens, "phonological_groups": groups}
+
+
+def fit_line_length(line, tokens, length, rhythm_format="pattern",
+                    rhyme_analysis=False):
+    """Look for alternative phonological groups of a line shorter than the
+    expected length that meet it, updating the line in place
+
+    :param line: Dictionary line with "phonological_groups" and "rhythm"
+    :param tokens: List of spaCy tokens of the line
+    :param length: Expected length of the line, or None
+    :param rhythm_format: Output format for rhythm analysis
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :return: The dictionary line
+    :rtype: dict
+    """
+    if length is not None and line["rhythm"]["length"] < length:
+        for candidate in generate_phonological_groups(tokens):
+            rhythm = get_rhythmical_pattern(
+                candidate, rhythm_format, rhyme_analysis=rhyme_analysis)
+            if rhythm["length"] == length:
+                line.update({
+                    "phonological_groups": candidate,
+                    "rhythm": rhythm,
+                })
+                break
+    return line
+
+
+def add_rhyme_to_lines(lines, rhyme):
+    """Add the output of the rhyme analysis of a text to each of its lines
+
+    :param lines: List of dictionary lines of the poem
+    :param rhyme: Dictionary with the rhyme analysis of the lines
+    :return: List of dictionary lines with the rhyme keys
+    :rtype: list
+    """
+    for index, line in enumerate(lines):
+        line["structure"] = rhyme.get("name", "unknown")
+        line["rhyme"] = rhyme["rhyme"][index]
+        line["ending"] = rhyme["endings"][index]
+        line["ending_stress"] = rhyme["endings_stress"][index]
+        if line["ending_stress"] == 0:
+            line["rhyme_type"] = ""
+            line["rhyme_relaxation"] = None
         else:
-            structure_length_idx = None
-        if structure_length_idx is not None:
-            if line["rhythm"]["length"] < structure_length_idx:
-                candidates = generate_phonological_groups(raw_tokens[idx])
-                for candidate in candidates:
-                    rhythm = get_rhythmical_pattern(
-                        candidate, rhythm_format,
-                        rhyme_analysis=rhyme_analysis)
-                    if rhythm["length"] == structure_length_idx:
-                        line.update({
-                            "phonological_groups": candidate,
-                            "rhythm": rhythm,
-                        })
-                        break
-    if not pos_output:
-        remove_pos_from_output(lines)
-    return remove_exact_length_matches(lines)
+            line["rhyme_type"] = rhyme["rhyme_type"]
+            line["rhyme_relaxation"] = rhyme["rhyme_relaxation"]
+    return lines
 
 
 def get_structure_from_context(lines, n, window=3):
-    """Get the most frequent line length around line n using a window
+    """Get the most frequent line length around line n using a window.
+    The analysis gets the same lengths incrementally with `ContextCounter`
 
     :param lines: List of dictionary lines of the poem
     :param n:  Integer with the reference position
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+import mmap
+import os
+import re
+from array import array
+from collections.abc import Sequence
+from itertools import chain
+
+# Version of the on-disk format of the offsets index
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+WHITESPACE = b" \t\r\n"
+
+
+def check_encoding(encoding):
+    """Raise a ValueError unless the encoding is UTF-8 or a single-byte
+    encoding compatible with ASCII, the only ones in which whitespace and
+    delimiter bytes can be searched for without decoding the file"""
+    if codecs.lookup(encoding).name == "utf-8":
+        return
+    single_byte = len(bytes(range(256)).decode(encoding, "replace")) == 256
+    if not single_byte or WHITESPACE.decode(encoding) != " \t\r\n":
+        raise ValueError(
+            f"Unsupported corpus encoding {encoding!r}, use UTF-8 or a "
+            "single-byte encoding compatible with ASCII")
+
+
+def build_offsets(buffer, delimiter):
+    """Find the boundaries of the poems of a buffer in a single pass. Poems
+    are separated by lines made of the delimiter, optionally surrounded by
+    whitespace. Surrounding blank lines are left out of the poems, and empty
+    poems are skipped.
+
+    :param buffer: Bytes-like object, e.g., a memory-mapped file
+    :param delimiter: Bytes of the delimiter line
+    :return: Array with the start and end offsets of each poem, interleaved
+    :rtype: array.array
+    """
+    delimiter_re = re.compile(
+        rb"^[ \t]*" + re.escape(delimiter) + rb"[ \t\r]*(?:\n|\Z)",
+        re.MULTILINE)
+    offsets = array("Q")
+    start = 0
+    boundaries = chain(
+        (match.span() for match in delimiter_re.finditer(buffer)),
+        [(len(buffer), len(buffer))],
+    )
+    for end, next_start in boundaries:
+        while start < end and buffer[start] in WHITESPACE:
+            start += 1
+        while end > start and buffer[end - 1] in WHITESPACE:
+            end -= 1
+        if start < end:
+            offsets.extend((start, end))
+        start = next_start
+    return offsets
+
+
+class Corpus(Sequence):
+    """Read-only sequence of the poems of a plain text file in which poems
+    are separated by delimiter lines. The file is memory-mapped rather than
+    read, and an index with the offsets of every poem is built in one pass
+    and saved next to the file (or to index_path), so later opens are
+    instant. Poems are only decoded when accessed, and slicing or `select`
+    return views over the same mapping, so subsets can be fed straight to
+    `get_scansions` or `imap_scansions`. Closing a view does not close the
+    file. Files must be in UTF-8 or a single-byte encoding compatible with
+    ASCII, e.g., Latin-1::
+
+        with Corpus("sonnets.txt", delimiter="***") as corpus:
+            scansions = get_scansions(corpus[1000:2000])
+    """
+
+    def __init__(self, path, delimiter, encoding="utf-8", index_path=None,
+                 save_index=True):
+        check_encoding(encoding)
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.index_path = index_path or f"{path}{INDEX_SUFFIX}"
+        # Views share the file and mapping of the corpus they come from
+        self._owner = True
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # Empty files cannot be memory-mapped
+        self._buffer = (mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+                        if size else b"")
+        self._offsets = self.load_index()
+        if self._offsets is None:
+            self._offsets = build_offsets(self._buffer,
+                                          delimiter.encode(encoding))
+            if save_index:
+                self.save_index()
+        self.indices = range(len(self._offsets) // 2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the file and its mapping, unless this is a view"""
+        if not self._owner:
+            return
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def _index_header(self):
+        stat = os.fstat(self._file.fileno())
+        return {
+            "version": INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "delimiter": self.delimiter,
+            "encoding": self.encoding,
+        }
+
+    def load_index(self):
+        """Load the offsets index if it exists and matches the file
+
+        :return: Array of offsets, or None if there is no valid index
+        :rtype: array.array
+        """
+        try:
+            with open(self.index_path, "rb") as index_file:
+                header = json.loads(index_file.readline())
+                if header != self._index_header():
+                    return None
+                offsets = array("Q")
+                offsets.frombytes(index_file.read())
+                return offsets
+        except (OSError, ValueError):
+            return None
+
+    def save_index(self):
+        """Save the offsets index, with a header to detect stale indices"""
+        temporary_path = f"{self.index_path}.tmp"
+        with open(temporary_path, "wb") as index_file:
+            index_file.write(json.dumps(self._index_header()).encode("utf-8"))
+            index_file.write(b"\n")
+            index_file.write(self._offsets.tobytes())
+        os.replace(temporary_path, self.index_path)
+
+    def _view(self, indices):
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view.indices = indices
+        view._owner = False
+        return view
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self.indices[index])
+        start, end = self._get_offsets(index)
+        return self._buffer[start:end].decode(self.encoding)
+
+    def _get_offsets(self, index):
+        position = self.indices[index] * 2
+        return self._offsets[position], self._offsets[position + 1]
+
+    def raw(self, index):
+        """Return the bytes of a poem as a memoryview of the mapping, without
+        copying them
+
+        :param index: Index of the poem
+        :return: Memory view with the encoded poem. It must be released
+            before closing the corpus
+        :rtype: memoryview
+        """
+        start, end = self._get_offsets(index)
+        return memoryview(self._buffer)[start:end]
+
+    def select(self, indices):
+        """Return a view with the poems at the given indices, e.g., to re-run
+        a subset of the corpus
+
+        :param indices: Iterable of indices
+        :return: Corpus view
+        :rtype: Corpus
+        """
+        return self._view([self.indices[index] for index in indices])
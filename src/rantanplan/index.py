@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from array import array
+
+from .verses import MAX_MASK_LENGTH
+from .verses import VERSE_TYPE_MASKS
+from .verses import VERSE_TYPE_NAMES
+from .verses import get_positions_mask
+from .verses import get_stress_mask
+from .verses import get_verse_type
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+INDEX_VERSION = 1
+INDEX_COLUMNS = ("masks", "lengths", "poems", "stanzas", "lines")
+INDEX_METADATA = "index.json"
+
+
+def parse_pattern(pattern):
+    """Parse a stress pattern like ``-+---+---+-``, in which ``+`` is a
+    stressed syllable, ``-`` an unstressed one and ``?`` any of them
+
+    :param pattern: String with the pattern
+    :return: Tuple with the length, the mask of the stressed syllables and
+        the mask of the unstressed ones
+    :rtype: tuple
+    :raises ValueError: If the pattern has other characters
+    """
+    stressed = unstressed = 0
+    for index, mark in enumerate(pattern):
+        if mark == "+":
+            stressed |= 1 << index
+        elif mark == "-":
+            unstressed |= 1 << index
+        elif mark != "?":
+            raise ValueError(
+                f"Invalid mark {mark!r} in pattern {pattern!r}, "
+                "use +, - or ?")
+    return len(pattern), stressed, unstressed
+
+
+def iter_scansion_lines(scansion):
+    """Generates the lines of the output of `get_scansion`
+
+    :param scansion: List of lines or, if split on stanzas, list of lists of
+        lines
+    :return: Generator with a tuple with the index of the stanza (-1 if the
+        text was not split), the index of the line and the line
+    :rtype: generator
+    """
+    if scansion and isinstance(scansion[0], list):
+        stanzas = enumerate(scansion)
+    else:
+        stanzas = [(-1, scansion)]
+    for stanza, lines in stanzas:
+        for index, line in enumerate(lines):
+            yield stanza, index, line
+
+
+def classify_masks(masks, lengths):
+    """Get the rhythmic type of many lines at once, vectorized over their
+    stress masks. It matches `rantanplan.verses.get_verse_type` line by line
+
+    :param masks: Array of uint64 with the stresses of each line as a bitmask
+    :param lengths: Array with the metrical length of each line
+    :return: Array of int8 with the index of the type of each line in
+        VERSE_TYPE_NAMES, or -1 for lines without type
+    :rtype: numpy.ndarray
+    """
+    codes = np.full(len(masks), -1, dtype=np.int8)
+    for length, types in VERSE_TYPE_MASKS.items():
+        candidates = lengths == length
+        for name, stressed, unstressed in types:
+            stressed = np.uint64(stressed)
+            matches = candidates & ((masks & stressed) == stressed)
+            if unstressed:
+                matches &= (masks & np.uint64(unstressed)) == 0
+            codes[matches] = VERSE_TYPE_NAMES.index(name)
+            candidates &= ~matches
+    return codes
+
+
+def set_verse_types(scansions):
+    """Add the rhythmic type of each line to stored results of
+    `get_scansion`, like the verse_type_output option does. Lines are
+    classified at once with NumPy if it is installed, or one by one
+    otherwise
+
+    :param scansions: List with the scansion of each text
+    :return: The same scansions, with a "verse_type" in the rhythm of each
+        line
+    :rtype: list
+    """
+    rhythms = [line["rhythm"] for scansion in scansions
+               for _, _, line in iter_scansion_lines(scansion)]
+    if np is None:
+        for rhythm in rhythms:
+            rhythm["verse_type"] = get_verse_type(get_stress_mask(rhythm),
+                                                  rhythm["length"])
+        return scansions
+    masks = array("Q")
+    lengths = array("H")
+    for rhythm in rhythms:
+        if rhythm["length"] > MAX_MASK_LENGTH:
+            # Long lines have no type
+            masks.append(0)
+            lengths.append(0)
+        else:
+            masks.append(get_stress_mask(rhythm))
+            lengths.append(rhythm["length"])
+    codes = classify_masks(np.frombuffer(masks, dtype=np.uint64),
+                           np.frombuffer(lengths, dtype=np.uint16))
+    names = VERSE_TYPE_NAMES + (None, )
+    for rhythm, code in zip(rhythms, codes.tolist()):
+        rhythm["verse_type"] = names[code]
+    return scansions
+
+
+class RhythmIndex:
+    """Index of the rhythm of the lines of a corpus of scansions, stored as
+    NumPy arrays with the stresses of each line as a bitmask, its length and
+    its location (poem, stanza and line). Metrical queries are answered with
+    vectorized scans over the arrays, so millions of lines can be explored
+    at once::
+
+        index = RhythmIndex.build(scansions, ids=titles)
+        rows = index.query(length=11, stressed=[6, 10])
+        locations = index.locate(rows)
+
+    Indices can be saved to a directory and loaded memory-mapped.
+    """
+
+    def __init__(self, masks, lengths, poems, stanzas, lines, ids=None):
+        if np is None:
+            raise ImportError(
+                "RhythmIndex needs NumPy, install rantanplan[index]")
+        self.masks = masks
+        self.lengths = lengths
+        self.poems = poems
+        self.stanzas = stanzas
+        self.lines = lines
+        self.ids = ids
+
+    @classmethod
+    def build(cls, scansions, ids=None):
+        """Build an index from the output of `get_scansion` for several
+        texts, analyzed with any rhythm format. Lines of more than
+        MAX_MASK_LENGTH syllables are left out.
+
+        :param scansions: Iterable with the scansion of each text, either a
+            list of lines or, if split on stanzas, a list of lists of lines
+        :param ids: List with the id of each text. Defaults to their index
+        :return: New index
+        :rtype: RhythmIndex
+        """
+        masks = array("Q")
+        lengths = array("B")
+        poems = array("L")
+        stanzas = array("l")
+        lines = array("L")
+        for poem, scansion in enumerate(scansions):
+            for stanza, index, line in iter_scansion_lines(scansion):
+                rhythm = line["rhythm"]
+                if rhythm["length"] > MAX_MASK_LENGTH:
+                    continue
+                masks.append(get_stress_mask(rhythm))
+                lengths.append(rhythm["length"])
+                poems.append(poem)
+                stanzas.append(stanza)
+                lines.append(index)
+        return cls(
+            np.frombuffer(masks, dtype=np.uint64),
+            np.frombuffer(lengths, dtype=np.uint8),
+            np.array(poems, dtype=np.uint32),
+            np.array(stanzas, dtype=np.int32),
+            np.array(lines, dtype=np.uint32),
+            ids=list(ids) if ids is not None else None,
+        )
+
+    def __len__(self):
+        return len(self.masks)
+
+    def query(self, length=None, stressed=(), unstressed=(), pattern=None,
+              verse_type=None):
+        """Find the lines with a given length, stresses and type
+
+        :param length: Number of syllables of the lines. Defaults to any
+        :param stressed: Positions, starting at 1, that must be stressed
+        :param unstressed: Positions, starting at 1, that must be unstressed
+        :param pattern: Stress pattern like ``-+---+---+-`` (``?`` for any
+            syllable) the lines must match, setting their length too
+        :param verse_type: Rhythmic type of the lines, e.g., "heroic"
+        :return: Array with the rows of the matching lines, in order
+        :rtype: numpy.ndarray
+        """
+        stressed_mask = get_positions_mask(stressed)
+        unstressed_mask = get_positions_mask(unstressed)
+        if pattern is not None:
+            pattern_length, pattern_stressed, pattern_unstressed = (
+                parse_pattern(pattern))
+            if length is not None and length != pattern_length:
+                raise ValueError("The length does not match the pattern")
+            length = pattern_length
+            stressed_mask |= pattern_stressed
+            unstressed_mask |= pattern_unstressed
+        matches = np.ones(len(self), dtype=bool)
+        if length is not None:
+            matches &= self.lengths == length
+        if stressed_mask:
+            stressed_mask = np.uint64(stressed_mask)
+            matches &= (self.masks & stressed_mask) == stressed_mask
+        if unstressed_mask:
+            matches &= (self.masks & np.uint64(unstressed_mask)) == 0
+        if verse_type is not None:
+            if verse_type not in VERSE_TYPE_NAMES:
+                raise ValueError(f"Unknown verse type {verse_type!r}")
+            matches &= (self.verse_types()
+                        == VERSE_TYPE_NAMES.index(verse_type))
+        return np.flatnonzero(matches)
+
+    def verse_types(self, rows=None):
+        """Get the rhythmic type of the lines of the index
+
+        :param rows: Iterable of rows. Defaults to every line
+        :return: Array with the index of the type of each line in
+            VERSE_TYPE_NAMES, or -1 for lines without type
+        :rtype: numpy.ndarray
+        """
+        if rows is None:
+            return classify_masks(self.masks, self.lengths)
+        return classify_masks(self.masks[rows], self.lengths[rows])
+
+    def locate(self, rows):
+        """Return the location of some rows of the index
+
+        :param rows: Iterable of rows, e.g., from `query`
+        :return: List with a tuple of the id of the text, the index of the
+            stanza (-1 if the text was not split) and the index of the line
+            per row
+        :rtype: list
+        """
+        return [
+            (self.ids[poem] if self.ids is not None else poem, stanza, line)
+            for poem, stanza, line in zip(self.poems[rows].tolist(),
+                                          self.stanzas[rows].tolist(),
+                                          self.lines[rows].tolist())
+        ]
+
+    def save(self, path):
+        """Save the index to a directory, with a .npy file per array
+
+        :param path: Directory to save the index to
+        """
+        os.makedirs(path, exist_ok=True)
+        for column in INDEX_COLUMNS:
+            np.save(os.path.join(path, f"{column}.npy"),
+                    getattr(self, column))
+        with open(os.path.join(path, INDEX_METADATA), "w",
+                  encoding="utf-8") as metadata:
+            json.dump({"version": INDEX_VERSION, "ids": self.ids}, metadata,
+                      ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load an index saved with `save`
+
+        :param path: Directory of the index
+        :param mmap_mode: Memory-map mode of the arrays. Defaults to
+            read-only, so the arrays are not read into memory. None to read
+            them
+        :return: Loaded index
+        :rtype: RhythmIndex
+        :raises ValueError: If the index was saved by another version
+        """
+        with open(os.path.join(path, INDEX_METADATA),
+                  encoding="utf-8") as metadata:
+            metadata = json.load(metadata)
+        if metadata.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}")
+        columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"),
+                            mmap_mode=mmap_mode)
+            for column in INDEX_COLUMNS
+        }
+        return cls(ids=metadata["ids"], **columns)
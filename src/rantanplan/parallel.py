@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import get_context
+
+from spacy.tokens import DocBin
+
+from .core import BATCH_SIZE
+from .core import get_line
+from .core import get_scansion
+from .core import get_scansion_options
+from .core import get_scansions
+from .core import iter_analyzed_lines
+from .core import shift_offsets
+from .core import split_lines
+from .core import split_stanzas
+from .pipeline import load_pipeline
+from .tagging import DOCBIN_ATTRS
+from .tagging import get_tagged_vocab
+from .tagging import keep_extensions
+from .utils import chunked
+
+# Number of lines per chunk when a single long text is split among workers
+CHUNK_LINES = 500
+# Lines tagged before and after each chunk as context for the tagger
+CONTEXT_LINES = 2
+
+
+def init_worker():
+    """Load the spaCy pipeline once when a worker process starts, so it is
+    kept warm for every chunk of texts the worker analyzes"""
+    load_pipeline()
+
+
+def scan_chunk(texts, options, batch_size=BATCH_SIZE):
+    """Analyze a chunk of texts in a worker process
+
+    :param texts: List of texts to be analyzed
+    :param options: Dictionary with the keyword arguments of `get_scansion`
+    :param batch_size: Number of texts tagged at once
+    :return: List with the scansion of each text
+    :rtype: list
+    """
+    return list(get_scansions(texts, batch_size=batch_size, **options))
+
+
+def estimate_cost(text):
+    """Estimate the cost of analyzing a text from its number of words and
+    lines, which drive the tagging and the search for alternative
+    syllabifications
+
+    :param text: Text to be analyzed
+    :return: Estimated cost, in arbitrary units
+    :rtype: int
+    """
+    return len(text.split()) + text.count("\n") + 1
+
+
+def pack_units(costs, max_cost, max_size):
+    """Pack items in units of work with at most max_size items and a total
+    cost of at most max_cost, unless a single item exceeds it. Items are
+    placed from the most to the least costly in the first unit they fit, so
+    small items fill the gaps left by the large ones.
+
+    :param costs: List with the estimated cost of each item
+    :param max_cost: Maximum total cost of a unit
+    :param max_size: Maximum number of items of a unit
+    :return: List with a tuple of the cost of the unit and the list of the
+        indices of its items, from the most to the least costly unit
+    :rtype: list
+    """
+    units = []
+    for index in sorted(range(len(costs)), key=lambda index: -costs[index]):
+        cost = costs[index]
+        for unit in units:
+            if len(unit[1]) < max_size and unit[0] + cost <= max_cost:
+                unit[0] += cost
+                unit[1].append(index)
+                break
+        else:
+            units.append([cost, [index]])
+    units.sort(key=lambda unit: -unit[0])
+    return [(cost, indices) for cost, indices in units]
+
+
+def run_timed(function, *args):
+    """Run a function in a worker process, measuring how long it takes
+
+    :return: Tuple with the id of the worker process, the seconds it was busy
+        and the result of the function
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return os.getpid(), time.perf_counter() - start, result
+
+
+class ScheduleStats:
+    """Units of work, estimated cost and busy time of each worker process of
+    a pool, to report how well the work was balanced among them"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.split_texts = 0
+        self.workers = {}
+
+    def add(self, pid, busy, cost):
+        worker = self.workers.setdefault(
+            pid, {"units": 0, "cost": 0, "busy": 0.0})
+        worker["units"] += 1
+        worker["cost"] += cost
+        worker["busy"] += busy
+
+    def report(self):
+        """Return a dictionary with the elapsed seconds, the number of units
+        and of texts split in chunks, and the units, estimated cost, busy
+        seconds and utilization (the fraction of the elapsed time it was
+        busy) of each worker process"""
+        elapsed = time.monotonic() - self.start
+        workers = [
+            dict(worker, pid=pid,
+                 utilization=worker["busy"] / elapsed if elapsed else 0.0)
+            for pid, worker in sorted(self.workers.items())
+        ]
+        return {
+            "elapsed": elapsed,
+            "units": sum(worker["units"] for worker in workers),
+            "split_texts": self.split_texts,
+            "workers": workers,
+        }
+
+
+def imap_scansions(texts, jobs=1, batch_size=BATCH_SIZE, chunk_size=None,
+                   cache=None, split_lines=None, report=None, **options):
+    """Generates the scansion of each text of an iterable of texts, in the
+    same order, using up to jobs worker processes. Each worker keeps its own
+    warm pipeline. Texts are read in windows of a few chunks of chunk_size
+    texts per worker, so memory stays bounded for arbitrarily long
+    iterables. The cost of the texts of a window is estimated with
+    `estimate_cost` and they are packed in units of similar cost, of at most
+    chunk_size texts, that are sent to the workers from the most to the
+    least costly, so no worker is left analyzing a long text while the
+    others are idle. The output is the same whatever the number of jobs,
+    unless split_lines is set: texts of split_lines lines or more are then
+    split in chunks as in `get_long_scansion`, whose output is only an
+    approximation of that of `get_scansion`.
+
+    :param texts: Iterable of texts to be analyzed
+    :param jobs: Number of worker processes. With 1, texts are analyzed in
+        the current process
+    :param batch_size: Number of texts tagged at once
+    :param chunk_size: Maximum number of texts sent to a worker at once.
+        Defaults to batch_size
+    :param cache: `ScansionCache` looked up in the current process, so only
+        the texts not found are sent to the workers. Defaults to None
+    :param split_lines: Number of lines of a text (or of one of its stanzas)
+        from which it is split in chunks analyzed by several workers, e.g.,
+        CHUNK_LINES. Defaults to None for not splitting texts
+    :param report: Callable called at the end with the scheduling report of
+        `ScheduleStats.report` when worker processes are used
+    :param options: Keyword arguments for `get_scansion`
+    :return: Generator with the output of `get_scansion` for each text
+    :rtype: generator
+    """
+    if jobs is None or jobs <= 1:
+        yield from get_scansions(
+            texts, batch_size=batch_size, cache=cache, **options)
+        return
+    if chunk_size is None:
+        chunk_size = batch_size
+    analysis_options = get_scansion_options(**options)
+    stats = ScheduleStats()
+    context = get_context()
+    with context.Pool(jobs, initializer=init_worker) as pool:
+        pending = deque()
+
+        def submit(window):
+            entries = None
+            if cache is not None:
+                entries, window = cache.split(window, analysis_options)
+            long_texts = {
+                index: submit_long_text(
+                    pool, text, analysis_options["split_stanzas_on"],
+                    split_lines)
+                for index, text in enumerate(window)
+                if split_lines is not None and is_long_text(
+                    text, analysis_options["split_stanzas_on"], split_lines)
+            }
+            stats.split_texts += len(long_texts)
+            short = [index for index in range(len(window))
+                     if index not in long_texts]
+            costs = [estimate_cost(window[index]) for index in short]
+            max_cost = max(sum(costs) / (2 * jobs), 1)
+            units = [
+                ([short[index] for index in indices], cost, pool.apply_async(
+                    run_timed, (scan_chunk,
+                                [window[short[index]] for index in indices],
+                                options, batch_size)))
+                for cost, indices in pack_units(costs, max_cost, chunk_size)
+            ]
+            pending.append((entries, len(window), units, long_texts))
+
+        def results():
+            entries, size, units, long_texts = pending.popleft()
+            scansions = [None] * size
+            for indices, cost, result in units:
+                pid, busy, unit_scansions = result.get()
+                stats.add(pid, busy, cost)
+                for index, scansion in zip(indices, unit_scansions):
+                    scansions[index] = scansion
+            for index, chunks in long_texts.items():
+                scansions[index] = collect_long_text(
+                    chunks, analysis_options, stats)
+            if entries is None:
+                return scansions
+            return cache.merge(entries, scansions)
+
+        for window in chunked(texts, 2 * jobs * chunk_size):
+            submit(window)
+            if len(pending) >= 2:
+                yield from results()
+        while pending:
+            yield from results()
+    if report is not None:
+        report(stats.report())
+
+
+def parse_record(line, line_number=None):
+    """Parse a newline-delimited JSON record with the text of a poem, like
+    ``{"id": "poem-1", "text": "..."}``. Records without an id get their
+    line number instead.
+
+    :param line: Line with the JSON record
+    :param line_number: Number of the line, used in errors and as default id
+    :return: Tuple of id and text
+    :rtype: tuple
+    :raises ValueError: If the line is not a valid record
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as error:
+        raise ValueError(
+            f"Invalid JSON on line {line_number}: {error}") from None
+    if not isinstance(record, dict) or not isinstance(
+            record.get("text"), str):
+        raise ValueError(f"Missing \"text\" string on line {line_number}")
+    return record.get("id", line_number), record["text"]
+
+
+def read_records(lines):
+    """Parse newline-delimited JSON records with the text of a poem each,
+    skipping blank lines
+
+    :param lines: Iterable of lines, e.g., an open file
+    :return: Generator with a tuple of id and text per record
+    :rtype: generator
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield parse_record(line, line_number)
+
+
+def stream_scansions(lines, jobs=1, batch_size=BATCH_SIZE, chunk_size=None,
+                     **options):
+    """Analyze a stream of newline-delimited JSON records, yielding a record
+    with the id and the scansion of each poem in input order as soon as it is
+    done. Records are read lazily and only a bounded number of them are in
+    flight at any time, so memory stays flat regardless of the stream size.
+
+    :param lines: Iterable of lines with JSON records with "id" and "text"
+    :param jobs: Number of worker processes
+    :param batch_size: Number of texts tagged at once
+    :param chunk_size: Number of texts sent to a worker at once. Defaults to
+        batch_size
+    :param options: Keyword arguments for `get_scansion`
+    :return: Generator with a dictionary with "id" and "scansion" per record
+    :rtype: generator
+    """
+    ids = deque()
+
+    def texts():
+        for record_id, text in read_records(lines):
+            ids.append(record_id)
+            yield text
+
+    scansions = imap_scansions(texts(), jobs=jobs, batch_size=batch_size,
+                               chunk_size=chunk_size, **options)
+    for scansion in scansions:
+        yield {"id": ids.popleft(), "scansion": scansion}
+
+
+def get_chunk_bounds(text, chunk_lines=CHUNK_LINES,
+                     context_lines=CONTEXT_LINES):
+    """Split a text in chunks of chunk_lines lines, each of them surrounded by
+    context_lines lines of context. The context before a chunk starts on a
+    non-blank line, so the lines of the chunk are split exactly as in the
+    whole text
+
+    :param text: Full text
+    :param chunk_lines: Number of lines per chunk
+    :param context_lines: Number of lines of context around each chunk
+    :return: List with a tuple of the start and end offsets of the text to
+        tag and the start and end offsets of the chunk, relative to the text
+        to tag, per chunk
+    :rtype: list
+    """
+    text_lines = text.split("\n")
+    starts = [0]
+    for text_line in text_lines:
+        starts.append(starts[-1] + len(text_line) + 1)
+    starts[-1] = len(text)
+    # Blank lines at the start belong to the first line of the text
+    leading = next((index for index, text_line in enumerate(text_lines)
+                    if text_line.strip()), len(text_lines))
+    firsts = [0, *range(leading + chunk_lines, len(text_lines), chunk_lines)]
+    bounds = []
+    for first, last in zip(firsts, firsts[1:] + [len(text_lines)]):
+        context_first = max(first - context_lines, 0)
+        while context_first > 0 and (context_first >= first
+                                     or not text_lines[context_first].strip()):
+            context_first -= 1
+        context_last = min(last + context_lines, len(text_lines))
+        offset = starts[context_first]
+        bounds.append((offset, starts[context_last],
+                       starts[first] - offset, starts[last] - offset))
+    return bounds
+
+
+def get_chunk_lines(doc, start, end):
+    """Return the tokens of the lines of a Doc that start between two
+    character offsets"""
+    return [tokens for tokens in split_lines(doc)
+            if start <= tokens[0].idx < end]
+
+
+def tag_chunk(text, start, end):
+    """Tag a chunk of a long text in a worker process, with its context, and
+    extract its lines
+
+    :param text: Text of the chunk with its context
+    :param start: Offset of the start of the chunk in text
+    :param end: Offset of the end of the chunk in text
+    :return: Tuple with the list of dictionary lines of the chunk, as from
+        `get_line`, and the tagged text serialized as a DocBin
+    :rtype: tuple
+    """
+    nlp = load_pipeline()
+    doc = nlp(text)
+    lines = [get_line(tokens) for tokens in get_chunk_lines(doc, start, end)]
+    docbin = DocBin(attrs=DOCBIN_ATTRS, store_user_data=True)
+    docbin.add(keep_extensions(doc))
+    return lines, docbin.to_bytes()
+
+
+def get_long_scansion(text, jobs=2, chunk_lines=CHUNK_LINES,
+                      context_lines=CONTEXT_LINES, **options):
+    """Analyze a single long text, e.g., an epic poem, using up to jobs
+    worker processes. The text is split in chunks of chunk_lines lines that
+    the workers tag and syllabify, with context_lines lines of context around
+    each chunk for the tagger. Rhythm, rhyme and the fitting of line lengths
+    depend on the whole text, so they are done in the current process over
+    the merged lines as chunks arrive. The output is an approximation of
+    that of `get_scansion`: it is the same only as long as the tags of each
+    line do not depend on text beyond its context lines, which a sentence
+    spanning more lines than the context breaks.
+
+    :param text: Full text to be analyzed
+    :param jobs: Number of worker processes. With 1, or if the text is not
+        longer than a chunk, it is analyzed in the current process
+    :param chunk_lines: Number of lines per chunk
+    :param context_lines: Number of lines of context around each chunk
+    :param options: Keyword arguments for `get_scansion`
+    :return: list of dictionaries per line
+        (or list of list of dictionaries if split on stanzas)
+    :rtype: list
+    """
+    options = get_scansion_options(**options)
+    split_stanzas_on = options["split_stanzas_on"]
+    if (jobs is None or jobs <= 1
+            or not is_long_text(text, split_stanzas_on, chunk_lines)):
+        return get_scansion(text, **options)
+    context = get_context()
+    with context.Pool(jobs, initializer=init_worker) as pool:
+        chunks = submit_long_text(pool, text, split_stanzas_on, chunk_lines,
+                                  context_lines)
+        return collect_long_text(chunks, options)
+
+
+def is_long_text(text, split_stanzas_on=None, chunk_lines=CHUNK_LINES):
+    """Whether a text has a stanza longer than chunk_lines lines, so it is
+    worth splitting in chunks"""
+    return any(stanza.count("\n") >= chunk_lines
+               for _, stanza in split_stanzas(text, split_stanzas_on))
+
+
+def submit_long_text(pool, text, split_stanzas_on=None,
+                     chunk_lines=CHUNK_LINES, context_lines=CONTEXT_LINES):
+    """Send the chunks of a long text to be tagged by the workers of a pool
+
+    :param pool: `multiprocessing` pool started with `init_worker`
+    :param text: Full text to be analyzed
+    :param split_stanzas_on: Regular expression to split text in stanzas.
+        Defaults to None for not splitting.
+    :param chunk_lines: Number of lines per chunk
+    :param context_lines: Number of lines of context around each chunk
+    :return: Tuple with whether the text was split in stanzas and a list
+        with the offset of each stanza and the bounds, estimated cost and
+        pending result of each of its chunks
+    :rtype: tuple
+    """
+    chunks = []
+    for offset, stanza in split_stanzas(text, split_stanzas_on):
+        stanza_chunks = []
+        for bounds in get_chunk_bounds(stanza, chunk_lines, context_lines):
+            chunk = stanza[bounds[0]:bounds[1]]
+            stanza_chunks.append((bounds, estimate_cost(chunk),
+                                  pool.apply_async(run_timed, (
+                                      tag_chunk, chunk, *bounds[2:]))))
+        chunks.append((offset, stanza_chunks))
+    return split_stanzas_on is not None, chunks
+
+
+def collect_long_text(chunks, options, stats=None):
+    """Merge the chunks of a long text sent with `submit_long_text`, as they
+    arrive, and analyze its lines
+
+    :param chunks: Output of `submit_long_text`
+    :param options: Dictionary with the keyword arguments of `get_scansion`
+    :param stats: `ScheduleStats` to record the chunks in. Defaults to None
+    :return: list of dictionaries per line
+        (or list of list of dictionaries if split on stanzas)
+    :rtype: list
+    """
+    split, chunks = chunks
+    options = {option: value for option, value in options.items()
+               if option != "split_stanzas_on"}
+    vocab = get_tagged_vocab()
+    # Offset in the text of the chunk of each line read
+    offsets = deque()
+
+    def line_tokens(offset, stanza_chunks):
+        for (chunk_offset, _, start, end), cost, result in stanza_chunks:
+            pid, busy, (lines, data) = result.get()
+            if stats is not None:
+                stats.add(pid, busy, cost)
+            docbin = DocBin(store_user_data=True).from_bytes(data)
+            doc = next(docbin.get_docs(vocab))
+            for line in zip(lines, get_chunk_lines(doc, start, end)):
+                offsets.append(offset + chunk_offset)
+                yield line
+
+    scansions = []
+    for offset, stanza_chunks in chunks:
+        lines = []
+        for line in iter_analyzed_lines(line_tokens(offset, stanza_chunks),
+                                        **options):
+            line_offset = offsets.popleft()
+            if options["offsets_output"]:
+                shift_offsets([line], line_offset)
+            lines.append(line)
+        scansions.append(lines)
+    return scansions if split else scansions[0]
@@ -25,6 +25,9 @@ def custom_tokenizer(nlp):
                      infix_finditer=infix_re.finditer, token_match=None)
 
 
+# Default spaCy language model
+DEFAULT_LANG = 'es_core_news_md'
+
 # load_pipeline should work as a "singleton"
 _load_pipeline = {}
 
@@ -38,7 +41,7 @@ def load_pipeline(lang=None, split_affixes=True):
     """
     global _load_pipeline
     if lang is None:
-        lang = 'es_core_news_md'
+        lang = DEFAULT_LANG
     if lang not in _load_pipeline:
         nlp = spacy.load(lang)
         nlp.remove_pipe("ner") if nlp.has_pipe("ner") else None
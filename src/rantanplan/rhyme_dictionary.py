@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+
+from .rhyme_index import RHYME_KEYS
+from .rhyme_index import check_rhyme_key
+from .rhyme_index import get_word_ending
+from .rhymes import get_clean_code
+
+# Version of the on-disk format of rhyme dictionaries
+DICTIONARY_VERSION = 1
+
+
+def get_ending_codes(ending, stressed_position):
+    """Return a tuple with the clean code of an ending for each rhyme key"""
+    return tuple(
+        get_clean_code(ending, stressed_position, assonance, relaxation)
+        for assonance, relaxation in RHYME_KEYS.values()
+    )
+
+
+class RhymeDictionary:
+    """Rhyme keys of the words of a lexicon, precomputed by syllabifying and
+    stressing every word as the last word of a line, together with the
+    reverse index from each rhyme key to its words. Dictionaries are saved
+    as gzipped JSON::
+
+        dictionary = RhymeDictionary.build(words)
+        dictionary.save("rhymes.json.gz")
+        dictionary = RhymeDictionary.load("rhymes.json.gz")
+        dictionary.rhymes_with("corazón", key="assonant")
+    """
+
+    def __init__(self, endings, words, rhymes=None):
+        self.endings = endings
+        self.words = words
+        if rhymes is None:
+            rhymes = {key: {} for key in RHYME_KEYS}
+            for word, index in words.items():
+                for key, code in zip(RHYME_KEYS, endings[index][2]):
+                    rhymes[key].setdefault(code, []).append(word)
+        self.rhymes = rhymes
+
+    @classmethod
+    def build(cls, words):
+        """Build a dictionary from a list of words
+
+        :param words: Iterable of words. Surrounding whitespace is stripped
+            and empty words are skipped
+        :return: New dictionary
+        :rtype: RhymeDictionary
+        """
+        endings = []
+        ending_indices = {}
+        word_endings = {}
+        for word in words:
+            word = word.strip()
+            if not word or word in word_endings:
+                continue
+            ending = get_word_ending(word)
+            if ending not in ending_indices:
+                ending_indices[ending] = len(endings)
+                endings.append((*ending, get_ending_codes(*ending)))
+            word_endings[word] = ending_indices[ending]
+        return cls(endings, word_endings)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def get_keys(self, word):
+        """Get the rhyme keys of a word, computing them if the word is not in
+        the dictionary
+
+        :param word: Word
+        :return: Dictionary with the value of each rhyme key in RHYME_KEYS
+        :rtype: dict
+        """
+        if word in self.words:
+            codes = self.endings[self.words[word]][2]
+        else:
+            codes = get_ending_codes(*get_word_ending(word))
+        return dict(zip(RHYME_KEYS, codes))
+
+    def rhymes_with(self, word, key="consonant"):
+        """Find the words of the dictionary that rhyme with a word
+
+        :param word: Word to rhyme with, in the dictionary or not
+        :param key: Name of the rhyme key, one of RHYME_KEYS
+        :return: List of words with the same rhyme key, except the word
+            itself, in the order of the word list
+        :rtype: list
+        """
+        check_rhyme_key(key)
+        code = self.get_keys(word)[key]
+        return [rhyme for rhyme in self.rhymes[key].get(code, ())
+                if rhyme != word]
+
+    def save(self, path):
+        """Save the dictionary to a gzipped JSON file
+
+        :param path: Path of the file
+        """
+        content = {
+            "version": DICTIONARY_VERSION,
+            "keys": list(RHYME_KEYS),
+            "endings": self.endings,
+            "words": self.words,
+            "rhymes": self.rhymes,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as output:
+            json.dump(content, output, ensure_ascii=False,
+                      separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        """Load a dictionary saved with `save`
+
+        :param path: Path of the file
+        :return: Loaded dictionary
+        :rtype: RhymeDictionary
+        :raises ValueError: If the file was saved by another version
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as source:
+            content = json.load(source)
+        if (content.get("version") != DICTIONARY_VERSION
+                or content.get("keys") != list(RHYME_KEYS)):
+            raise ValueError(f"Unsupported rhyme dictionary in {path}")
+        endings = [(tuple(ending), stressed_position, tuple(codes))
+                   for ending, stressed_position, codes in content["endings"]]
+        return cls(endings, content["words"], content["rhymes"])
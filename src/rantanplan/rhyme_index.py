@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+
+from .core import get_phonological_groups
+from .core import get_syllables_word_end
+from .core import get_word_stress
+from .core import join_affixes
+from .rhymes import get_clean_code
+from .rhymes import get_stressed_endings
+
+# Rhyme keys of each line, as column names, and the arguments of
+# `get_clean_code` for them
+RHYME_KEYS = {
+    "consonant": (False, False),
+    "assonant": (True, False),
+    "relaxed_consonant": (False, True),
+    "relaxed_assonant": (True, True),
+}
+# Poem metadata the most frequent rhymes can be grouped by
+GROUP_COLUMNS = ("author", "period")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS poems (
+    id INTEGER PRIMARY KEY,
+    poem TEXT UNIQUE NOT NULL,
+    author TEXT,
+    period TEXT
+);
+CREATE TABLE IF NOT EXISTS lines (
+    poem INTEGER NOT NULL REFERENCES poems (id),
+    stanza INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    consonant TEXT NOT NULL,
+    assonant TEXT NOT NULL,
+    relaxed_consonant TEXT NOT NULL,
+    relaxed_assonant TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_poem ON lines (poem);
+CREATE INDEX IF NOT EXISTS lines_word ON lines (word);
+CREATE INDEX IF NOT EXISTS lines_consonant ON lines (consonant);
+CREATE INDEX IF NOT EXISTS lines_assonant ON lines (assonant);
+CREATE INDEX IF NOT EXISTS lines_relaxed_consonant
+    ON lines (relaxed_consonant);
+CREATE INDEX IF NOT EXISTS lines_relaxed_assonant ON lines (relaxed_assonant);
+"""
+
+
+def get_last_word(line):
+    """Return the last word of a scansion line, lower cased, or an empty
+    string if it has none"""
+    for token in reversed(line["tokens"]):
+        if "word" in token:
+            return "".join(
+                syllable["syllable"] for syllable in token["word"]).lower()
+    return ""
+
+
+def get_rhyme_keys(lines):
+    """Get the rhyme keys of some lines, the same clean codes
+    `analyze_rhyme` compares within a poem
+
+    :param lines: List of dictionary lines of a scansion, with the text of
+        their syllables (not analyzed with offsets_output)
+    :return: List with a dictionary per line with its last "word" and a key
+        per name in RHYME_KEYS
+    :rtype: list
+    """
+    keys = []
+    for line, (ending, _, stressed_position) in zip(
+            lines, get_stressed_endings(lines)):
+        line_keys = {"word": get_last_word(line)}
+        for name, (assonance, relaxation) in RHYME_KEYS.items():
+            line_keys[name] = get_clean_code(
+                tuple(ending), stressed_position, assonance, relaxation)
+        keys.append(line_keys)
+    return keys
+
+
+def get_word_ending(word):
+    """Get the stressed ending of a word as `get_stressed_endings` finds it
+    when the word ends a line, with the stress rules of the last word
+
+    :param word: Word to get the ending from
+    :return: Tuple with the tuple of syllables from the stressed one and the
+        negative position of the stressed syllable
+    :rtype: tuple
+    """
+    stressed_word = get_word_stress(word, "", "", is_last_word=True)
+    stressed_word["pos"] = ""
+    words = join_affixes([stressed_word])
+    syllables = get_syllables_word_end(words)
+    groups = get_phonological_groups(
+        get_phonological_groups(syllables, liaison_type="sinaeresis"))
+    [(ending, _, stressed_position)] = get_stressed_endings(
+        [{"phonological_groups": groups}])
+    return tuple(ending), stressed_position
+
+
+def check_rhyme_key(key):
+    """Raise a ValueError if key is not the name of a rhyme key"""
+    if key not in RHYME_KEYS:
+        raise ValueError(
+            f"Unknown rhyme key {key!r}, use one of {', '.join(RHYME_KEYS)}")
+
+
+class RhymeIndex:
+    """Inverted index of the rhymes of a corpus in a SQLite file. The last
+    word of every line is stored with its consonant and assonant rhyme keys,
+    with and without relaxation, each of them indexed, so finding the lines
+    that rhyme with a word or the most frequent rhymes of each author takes
+    milliseconds without scanning the corpus again::
+
+        with RhymeIndex("rhymes.sqlite") as index:
+            index.add_records(records)
+            index.find_rhymes("corazón", key="assonant")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _add(self, poem_id, scansion, author=None, period=None):
+        self.connection.execute(
+            "DELETE FROM lines WHERE poem IN "
+            "(SELECT id FROM poems WHERE poem = ?)", (str(poem_id), ))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO poems (poem, author, period) "
+            "VALUES (?, ?, ?)", (str(poem_id), author, period))
+        (poem, ), = self.connection.execute(
+            "SELECT id FROM poems WHERE poem = ?", (str(poem_id), ))
+        if scansion and isinstance(scansion[0], list):
+            stanzas = enumerate(scansion)
+        else:
+            stanzas = [(-1, scansion)]
+        rows = []
+        for stanza, lines in stanzas:
+            for index, keys in enumerate(get_rhyme_keys(lines)):
+                rows.append((poem, stanza, index, keys["word"],
+                             *(keys[name] for name in RHYME_KEYS)))
+        self.connection.executemany(
+            "INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def add(self, poem_id, scansion, author=None, period=None):
+        """Index the lines of a poem, replacing them if the poem was already
+        in the index
+
+        :param poem_id: Id of the poem
+        :param scansion: Output of `get_scansion` for the poem
+        :param author: Author of the poem, or None
+        :param period: Period of the poem, or None
+        """
+        self.add_records([{"id": poem_id, "scansion": scansion,
+                           "author": author, "period": period}])
+
+    def add_records(self, records):
+        """Index the poems of records like ``{"id": ..., "scansion": ...}``,
+        as written by `rantanplan.runner.run`, with optional "author" and
+        "period" keys, in a single transaction. Records without a scansion
+        are skipped
+
+        :param records: Iterable of dictionary records
+        :return: Number of poems indexed
+        :rtype: int
+        """
+        added = 0
+        self.connection.execute("BEGIN")
+        try:
+            for record in records:
+                if "scansion" not in record:
+                    continue
+                self._add(record["id"], record["scansion"],
+                          record.get("author"), record.get("period"))
+                added += 1
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        return added
+
+    def get_keys(self, word, key="consonant"):
+        """Get the rhyme keys a word has in the corpus, usually only one, from
+        the most to the least frequent
+
+        :param word: Word at the end of some lines
+        :param key: Name of the rhyme key, one of RHYME_KEYS
+        :return: List of rhyme keys
+        :rtype: list
+        """
+        check_rhyme_key(key)
+        rows = self.connection.execute(
+            f"SELECT {key} FROM lines WHERE word = ? GROUP BY {key} "
+            "ORDER BY COUNT(*) DESC", (word.lower(), ))
+        return [row[0] for row in rows]
+
+    def find_lines(self, rhyme, key="consonant"):
+        """Find the lines with a rhyme key
+
+        :param rhyme: Value of the rhyme key, with the stressed vowel upper
+            cased, e.g., "Ado" or "Ao"
+        :param key: Name of the rhyme key, one of RHYME_KEYS
+        :return: List with a tuple of poem id, index of the stanza (-1 if
+            the poem was not split), index of the line and last word per
+            line, in corpus order
+        :rtype: list
+        """
+        check_rhyme_key(key)
+        return self.connection.execute(
+            "SELECT poems.poem, lines.stanza, lines.line, lines.word "
+            "FROM lines JOIN poems ON poems.id = lines.poem "
+            f"WHERE lines.{key} = ? "
+            "ORDER BY lines.poem, lines.stanza, lines.line", (rhyme, )
+        ).fetchall()
+
+    def find_rhymes(self, word, key="consonant"):
+        """Find the lines of the corpus that rhyme with a word, whether it
+        ends any line of the corpus or not. The rhyme key of the word is
+        computed as if it ended a line, as in `get_rhyme_keys`. If no line
+        has it, the word may have been stressed differently in the context
+        of its lines, so the keys it has at the end of the lines of the
+        corpus are used instead. Lines ending in the word itself are
+        included
+
+        :param word: Word to rhyme with
+        :param key: Name of the rhyme key, one of RHYME_KEYS
+        :return: List of lines like `find_lines`
+        :rtype: list
+        """
+        check_rhyme_key(key)
+        ending, stressed_position = get_word_ending(word.lower())
+        lines = self.find_lines(
+            get_clean_code(ending, stressed_position, *RHYME_KEYS[key]), key)
+        if lines:
+            return lines
+        return [line for rhyme in self.get_keys(word, key)
+                for line in self.find_lines(rhyme, key)]
+
+    def most_common(self, key="consonant", group_by=None, n=10):
+        """Get the most frequent rhymes of the corpus, or of each author or
+        period
+
+        :param key: Name of the rhyme key, one of RHYME_KEYS
+        :param group_by: "author" or "period" to count the rhymes of each
+            of them, or None for the whole corpus
+        :param n: Number of rhymes per group, or None for all of them
+        :return: List of tuples of rhyme key and number of lines, from the
+            most to the least frequent, or a dictionary with that list per
+            author or period if grouped
+        :rtype: list or dict
+        """
+        check_rhyme_key(key)
+        if group_by is None:
+            rows = self.connection.execute(
+                f"SELECT {key}, COUNT(*) AS lines FROM lines "
+                f"WHERE {key} != '' GROUP BY {key} "
+                f"ORDER BY lines DESC, {key}")
+            rhymes = rows.fetchall()
+            return rhymes[:n] if n is not None else rhymes
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(
+                f"Rhymes can only be grouped by {' or '.join(GROUP_COLUMNS)}")
+        rows = self.connection.execute(
+            f"SELECT poems.{group_by}, lines.{key}, COUNT(*) AS lines "
+            "FROM lines JOIN poems ON poems.id = lines.poem "
+            f"WHERE lines.{key} != '' GROUP BY poems.{group_by}, lines.{key} "
+            f"ORDER BY poems.{group_by}, lines DESC, lines.{key}")
+        groups = {}
+        for group, rhyme, count in rows:
+            rhymes = groups.setdefault(group, [])
+            if n is None or len(rhymes) < n:
+                rhymes.append((rhyme, count))
+        return groups
+
+    def info(self):
+        """Return a dictionary with the location and size of the index"""
+        (poems, ), = self.connection.execute("SELECT COUNT(*) FROM poems")
+        (lines, ), = self.connection.execute("SELECT COUNT(*) FROM lines")
+        return {"path": self.path, "poems": poems, "lines": lines}
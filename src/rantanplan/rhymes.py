@@ -2,11 +2,13 @@
 import re
 import string
 from collections import Counter
+from functools import lru_cache
 
 from spacy_affixes.utils import strip_accents
 
 from rantanplan.structures import ASSONANT_RHYME
 from rantanplan.structures import CONSONANT_RHYME
+from rantanplan.structures import STANZA_MAX_LENGTH
 from rantanplan.structures import STRUCTURES
 from rantanplan.utils import argcount
 from rantanplan.utils import generate_exceeded_offset_indices
@@ -39,6 +41,31 @@ HOMOPHONES = [
     ("qui", "ki"), ("que", "ke"),
     ("ge", "je"), ("gi", "ji"),
 ]
+# Compiled form of HOMOPHONES: single letters are replaced through a
+# translation table and the rest in one pass of an alternation regex
+HOMOPHONES_TABLE = str.maketrans({
+    **{find: change for find, change in HOMOPHONES if len(find) == 1},
+    **{find.upper(): change.upper()
+       for find, change in HOMOPHONES if len(find) == 1},
+})
+HOMOPHONES_GROUPS = {
+    **{find: change for find, change in HOMOPHONES if len(find) > 1},
+    **{find.upper(): change.upper()
+       for find, change in HOMOPHONES if len(find) > 1},
+}
+HOMOPHONES_GROUPS_RE = re.compile("|".join(
+    sorted(HOMOPHONES_GROUPS, key=len, reverse=True)))
+ACCENTED_LETTERS = "áéíóúàèìòùâêîôûäëïöüñç"
+STRIP_ACCENTS_TABLE = str.maketrans({
+    letter: strip_accents(letter)
+    for letter in ACCENTED_LETTERS + ACCENTED_LETTERS.upper()
+})
+STRIP_ACCENTS_LETTERS = frozenset(
+    string.printable + ACCENTED_LETTERS + ACCENTED_LETTERS.upper())
+CLEAN_CODES_CACHE_SIZE = 2 ** 16
+STRUCTURES_CACHE_SIZE = 2 ** 14
+COMPILED_STRUCTURES_CACHE_SIZE = 2 ** 5
+BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
 
 
 def get_ending_with_liaison(phonological_group, liaison):
@@ -86,57 +113,94 @@ def get_stressed_endings(lines):
     return endings
 
 
-def get_clean_codes(stressed_endings, assonance=False, relaxation=False):
-    """Clean syllables from stressed_endings depending on the rhyme kind,
-    assonance or consonant, and some relaxation of diphthongs for rhyming
-    purposes. Stress is also marked by upper casing the corresponding
-    syllable. The codes for the endings and the rhymes in numerical form
-    are returned."""
+def mark_stressed_syllable(syllable):
+    """Mark the stress of a syllable by upper casing its tilded vowel, or the
+    whole syllable if there is no tilde (e.g., 'sión' -> 'siÓn', 'ma' -> 'MA')
+    """
+    match = TILDED_VOWELS_RE.search(syllable)
+    if match:
+        span = match.span()
+        return (syllable[:span[0]] + match.group().upper()
+                + syllable[span[1]:])
+    return syllable.upper()
+
+
+def relax_syllable(syllable):
+    """Remove the weak vowel of diphthongs and replace homophones in a
+    syllable for rhyming purposes"""
+    relaxed_syllable = WEAK_STRONG_VOWELS_RE.sub(r"\1", syllable, count=1)
+    relaxed_syllable = STRONG_WEAK_VOWELS_RE.sub(
+        r"\1", relaxed_syllable, count=1)
+    relaxed_syllable = WEAK_WEAK_VOWELS_RE.sub(
+        r"\1", relaxed_syllable, count=1)
+    # Homophones
+    relaxed_syllable = relaxed_syllable.translate(HOMOPHONES_TABLE)
+    return HOMOPHONES_GROUPS_RE.sub(
+        lambda match: HOMOPHONES_GROUPS[match.group()], relaxed_syllable)
+
+
+def strip_ending_accents(ending):
+    """Remove the accents of an ending, as `strip_accents` does, through a
+    translation table whenever all its characters are known"""
+    if STRIP_ACCENTS_LETTERS.issuperset(ending):
+        return ending.translate(STRIP_ACCENTS_TABLE)
+    return strip_accents(ending)
+
+
+def get_ending_base(stressed_ending, relaxation=False):
+    """Join the syllables of a stressed ending, with its stressed syllable
+    already marked, into the intermediate form shared by consonant and
+    assonant codes"""
+    # TODO: Other forms of relaxation should be tried iteratively, such as
+    # changing `i` for `e`, etc.
+    if relaxation:
+        ending = "".join(relax_syllable(syllable)
+                         for syllable in stressed_ending)
+    else:
+        ending = "".join(stressed_ending)
+    ending = GROUP_GQ_RE.sub(r"\1\2", ending)
+    return DIPHTHONG_Y_RE.sub(r"\1i\2", ending)
+
+
+def get_ending_code(ending_base, assonance=False):
+    """Derive the consonant or assonant rhyme code from an ending base"""
+    if assonance:
+        ending = CONSONANTS_RE.sub(r"", ending_base)
+    else:
+        # Consonance
+        ending = DIPHTHONG_H_RE.sub(r"\1\2", ending_base)
+        ending = INITIAL_CONSONANTS_RE.sub(r"", ending, count=1)
+    return strip_ending_accents(ending)
+
+
+@lru_cache(maxsize=CLEAN_CODES_CACHE_SIZE)
+def get_cached_ending_base(stressed_ending, stressed_position,
+                           relaxation=False):
+    """Memoized `get_ending_base` for a stressed ending given as a tuple of
+    syllables and the position of its stressed syllable"""
+    stressed_ending = list(stressed_ending)
+    stressed_ending[stressed_position] = mark_stressed_syllable(
+        stressed_ending[stressed_position])
+    return get_ending_base(stressed_ending, relaxation)
+
+
+@lru_cache(maxsize=CLEAN_CODES_CACHE_SIZE)
+def get_clean_code(stressed_ending, stressed_position, assonance=False,
+                   relaxation=False):
+    """Return the clean rhyme code of a single stressed ending given as a
+    tuple of syllables and the position of its stressed syllable. Codes are
+    memoized, so recurring endings are only normalized once."""
+    ending_base = get_cached_ending_base(
+        stressed_ending, stressed_position, relaxation)
+    return get_ending_code(ending_base, assonance)
+
+
+def get_codes(endings):
+    """Assign consecutive numeric codes to a list of ending codes and return
+    the mapping from numbers to endings and the numeric code of each ending"""
     codes = {}
     code_numbers = []
-    # Clean consonants as needed and assign numeric codes
-    for stressed_ending, _, stressed_position in stressed_endings:
-        syllable = stressed_ending[stressed_position]
-        # If there is a tilde, only upper case that vowel
-        match = TILDED_VOWELS_RE.search(syllable)
-        if match:
-            span = match.span()
-            syllable = (syllable[:span[0]] + match.group().upper()
-                        + syllable[span[1]:])
-        # Otherwise, only the final if there is a diphthong
-        else:
-            syllable = syllable.upper()
-        stressed_ending[stressed_position] = syllable
-        # TODO: Other forms of relaxation should be tried iteratively, such as
-        # changing `i` for `e`, etc.
-        if relaxation:
-            relaxed_endings = []
-            for syllable in stressed_ending:
-                relaxed_syllable = WEAK_STRONG_VOWELS_RE.sub(
-                    r"\1", syllable, count=1)
-                relaxed_syllable = STRONG_WEAK_VOWELS_RE.sub(
-                    r"\1", relaxed_syllable, count=1)
-                relaxed_syllable = WEAK_WEAK_VOWELS_RE.sub(
-                    r"\1", relaxed_syllable, count=1)
-                # Homophones
-                for find, change in HOMOPHONES:
-                    relaxed_syllable = relaxed_syllable.replace(find, change)
-                    relaxed_syllable = relaxed_syllable.replace(
-                        find.upper(), change.upper()
-                    )
-                relaxed_endings.append(relaxed_syllable)
-            ending = "".join(relaxed_endings)
-        else:
-            ending = "".join(stressed_ending)
-        ending = GROUP_GQ_RE.sub(r"\1\2", ending)
-        ending = DIPHTHONG_Y_RE.sub(r"\1i\2", ending)
-        if assonance:
-            ending = CONSONANTS_RE.sub(r"", ending)
-        else:
-            # Consonance
-            ending = DIPHTHONG_H_RE.sub(r"\1\2", ending)
-            ending = INITIAL_CONSONANTS_RE.sub(r"", ending, count=1)
-        ending = strip_accents(ending)
+    for ending in endings:
         if ending not in codes:
             codes[ending] = len(codes)
         code_numbers.append(codes[ending])
@@ -145,21 +209,61 @@ def get_clean_codes(stressed_endings, assonance=False, relaxation=False):
     return codes2endings, code_numbers
 
 
+def get_clean_codes(stressed_endings, assonance=False, relaxation=False):
+    """Clean syllables from stressed_endings depending on the rhyme kind,
+    assonance or consonant, and some relaxation of diphthongs for rhyming
+    purposes. Stress is also marked by upper casing the corresponding
+    syllable. The codes for the endings and the rhymes in numerical form
+    are returned."""
+    endings = []
+    # Clean consonants as needed and assign numeric codes
+    for stressed_ending, _, stressed_position in stressed_endings:
+        endings.append(get_clean_code(
+            tuple(stressed_ending), stressed_position, assonance, relaxation))
+        stressed_ending[stressed_position] = mark_stressed_syllable(
+            stressed_ending[stressed_position])
+    return get_codes(endings)
+
+
+def get_clean_codes_variants(stressed_endings):
+    """Compute the clean codes of stressed_endings for consonant and assonant
+    rhyme, with and without relaxation, normalizing each ending only once.
+    A dictionary keyed by (assonance, relaxation) with the same output as
+    `get_clean_codes` for each combination is returned."""
+    endings = {(assonance, relaxation): []
+               for assonance in (False, True)
+               for relaxation in (False, True)}
+    for stressed_ending, _, stressed_position in stressed_endings:
+        ending = tuple(stressed_ending)
+        for assonance, relaxation in endings:
+            endings[(assonance, relaxation)].append(get_clean_code(
+                ending, stressed_position, assonance, relaxation))
+        stressed_ending[stressed_position] = mark_stressed_syllable(
+            stressed_ending[stressed_position])
+    return {variant: get_codes(variant_endings)
+            for variant, variant_endings in endings.items()}
+
+
 def apply_offset(codes, ending_codes, offset=4):
     """Control how many lines of distance should a matching rhyme occur at.
     An offset can be set to an arbitrary number, effectively allowing rhymes
     that only occur between lines i and i + offset, and assigning a new rhyme
-    code when the offset is exceeded, even if the ending appeared before."""
+    code when the offset is exceeded, even if the ending appeared before.
+    Codes are reassigned in a single pass over the lines."""
     code_numbers = ending_codes.copy()
-    offset_indices = generate_exceeded_offset_indices(code_numbers, offset)
-    for offset_index in offset_indices:
-        max_code = max(code_numbers) + 1
-        code_numbers = (
-            code_numbers[:offset_index]
-            + [max_code if code == code_numbers[offset_index] else code
-               for code in code_numbers[offset_index:]]
-        )
-        codes[max_code] = codes[ending_codes[offset_index]]
+    offset_indices = set(generate_exceeded_offset_indices(ending_codes, offset))
+    if not offset_indices:
+        return codes, code_numbers
+    # New codes are always greater than any code seen so far, so each line
+    # only needs the latest code assigned to its original ending code
+    max_code = max(ending_codes)
+    current_codes = {}
+    for index, code in enumerate(ending_codes):
+        if index in offset_indices:
+            max_code += 1
+            current_codes[code] = max_code
+            codes[max_code] = codes[code]
+        code_numbers[index] = current_codes.get(code, code)
     return codes, code_numbers
 
 
@@ -230,12 +334,22 @@ def get_rhymes(stressed_endings, assonance=False, relaxation=False,
     number, effectively allowing rhymes that only occur between
     lines i and i + offset. The symbol for unrhymed verse can be set
     using unrhymed_verse_symbol (defaults to '-')"""
-    if unrhymed_verse_symbol is None:
-        unrhymed_verse_symbol = "-"
     # Get a numerical representation of rhymes using numbers
     codes, ending_codes = get_clean_codes(
         stressed_endings, assonance, relaxation
     )
+    return get_rhymes_from_codes(
+        codes, ending_codes, offset, unrhymed_verse_symbol
+    )
+
+
+def get_rhymes_from_codes(codes, ending_codes, offset=None,
+                          unrhymed_verse_symbol=None):
+    """From the numerical representation of the endings returned by
+    `get_clean_codes`, return the same tuple of rhyme patterns, rhyme endings
+    and stresses as `get_rhymes`"""
+    if unrhymed_verse_symbol is None:
+        unrhymed_verse_symbol = "-"
     # Apply offset to codes and ending_codes
     if offset is not None:
         codes, ending_codes = apply_offset(codes, ending_codes, offset)
@@ -257,27 +371,114 @@ def search_structure(rhyme, length_ranges, structure_key, structures=None):
     consonance, a rhyme pattern (regex or callable), and a condition on the
     lengths of syllables of lines. For the first matching structure, its index
     in STRUCTURES will be returned. An alternative STRUCTURES list can be passed
-    in structures."""
+    in structures.
+    Results are memoized by rhyme type, rhyme pattern, line length ranges and
+    structures, converted to a tuple, in a bounded cache (see
+    `search_structure_cache_info`)."""
+    if structures is not None:
+        structures = tuple(structures)
+    return list(_search_structure_cached(
+        structure_key, rhyme, tuple(length_ranges), structures
+    ))
+
+
+@lru_cache(maxsize=STRUCTURES_CACHE_SIZE)
+def _search_structure_cached(structure_key, rhyme, length_ranges,
+                             structures):
+    # The default structures are keyed by None to skip hashing them
     if structures is None:
         structures = STRUCTURES
-    indices = []
-    for index, (key, _, structure, func) in enumerate(structures):
-        if callable(structure):
-            structure_check = structure(rhyme)
-        else:  # it's a regex
-            structure_re = re.compile(structure, re.VERBOSE)
-            structure_check = structure_re.fullmatch(rhyme)
-        if (key == structure_key
-                and structure_check
-                and func(length_ranges)):
-            indices.append(index)
-    return indices
+    return tuple(_search_structure(
+        rhyme, length_ranges, structure_key, structures
+    ))
+
+
+def _search_structure(rhyme, length_ranges, structure_key, structures):
+    patterns, pattern_structures, callable_structures = (
+        compile_structures(structures, structure_key))
+    matches = set()
+    # A single match of the combined regex tells every matching pattern
+    match = patterns.match(rhyme)
+    for group, indices in pattern_structures:
+        if match.group(group) is not None:
+            matches.update(indices)
+    for index, structure in callable_structures:
+        if structure(rhyme):
+            matches.add(index)
+    return [index for index in sorted(matches)
+            if structures[index][3](length_ranges)]
+
+
+@lru_cache(maxsize=COMPILED_STRUCTURES_CACHE_SIZE)
+def compile_structures(structures, structure_key):
+    """Compile the regular expressions of the structures of a rhyme type into
+    a single regular expression with one optional lookahead per distinct
+    pattern, so that one match tells which patterns fully match a rhyme
+    string. A tuple is returned with the combined regular expression, a list
+    of the group name of each pattern and the indices of the structures
+    using it, and a list of indices and callables for the rest of
+    structures, whose patterns are checked separately."""
+    pattern_indices = {}
+    callable_structures = []
+    for index, (key, _, structure, _) in enumerate(structures):
+        if key != structure_key:
+            continue
+        if callable(structure) or BACKREFERENCE_RE.search(structure):
+            callable_structures.append((
+                index, structure if callable(structure)
+                else re.compile(structure, re.VERBOSE).fullmatch
+            ))
+        else:
+            pattern_indices.setdefault(structure, []).append(index)
+    pattern_structures = []
+    lookaheads = []
+    for pattern_index, (pattern, indices) in enumerate(
+            pattern_indices.items()):
+        group = f"structure{pattern_index}"
+        # Patterns end in a new line in case they have a trailing comment
+        lookaheads.append(f"(?:(?=(?P<{group}>(?:{pattern}\n))\\Z)|)")
+        pattern_structures.append((group, indices))
+    patterns = re.compile("".join(lookaheads), re.VERBOSE)
+    return patterns, pattern_structures, callable_structures
+
+
+def search_structure_cache_info():
+    """Return hits, misses, maximum size and current size of the
+    `search_structure` cache"""
+    return _search_structure_cached.cache_info()
+
+
+def clear_structure_cache():
+    """Empty the `search_structure` cache and the compiled structures"""
+    _search_structure_cached.cache_clear()
+    compile_structures.cache_clear()
+
+
+def get_length_ranges(lines):
+    """Return the range of possible lengths of each line of a scansion"""
+    return [
+        range(line["rhythm"]["length_range"]["min_length"],
+              line["rhythm"]["length_range"]["max_length"] + 1)
+        for line in lines
+    ]
 
 
 def analyze_rhyme(lines, offset=4, always_return_rhyme=False):
     """Analyze the syllables of a text to propose a possible set of
     rhyme structure, rhyme name, rhyme endings, and rhyme pattern"""
     stressed_endings = get_stressed_endings(lines)
+    clean_codes = get_clean_codes_variants(stressed_endings)
+    length_ranges = get_length_ranges(lines)
+    return analyze_rhyme_codes(
+        clean_codes, length_ranges, offset, always_return_rhyme
+    )
+
+
+def analyze_rhyme_codes(clean_codes, length_ranges, offset=4,
+                        always_return_rhyme=False):
+    """Propose a rhyme structure as `analyze_rhyme` does, from the clean codes
+    variants (see `get_clean_codes_variants`) and the length ranges of the
+    lines"""
     best_ranking = len(STRUCTURES)
     best_structure = None
     analyses = []
@@ -286,14 +487,11 @@ def analyze_rhyme(lines, offset=4, always_return_rhyme=False):
         rhyme_type = ASSONANT_RHYME if assonance else CONSONANT_RHYME
         # Prefer relaxation to strictness
         for relaxation in (True, False):
-            rhymes, endings, endings_stress = get_rhymes(
-                stressed_endings, assonance, relaxation, offset
+            codes, ending_codes = clean_codes[(assonance, relaxation)]
+            rhymes, endings, endings_stress = get_rhymes_from_codes(
+                codes.copy(), ending_codes, offset
             )
             rhyme = "".join(rhymes)
-            length_ranges = [
-                range(line["rhythm"]["length_range"]["min_length"],
-                      line["rhythm"]["length_range"]["max_length"] + 1)
-                for line in lines]
             analysis = {
                 "rhyme": rhymes,
                 "endings": endings,
@@ -326,6 +524,132 @@ def analyze_rhyme(lines, offset=4, always_return_rhyme=False):
         return best_candidate
 
 
+def slice_clean_codes(clean_codes, start, end):
+    """Restrict the clean codes variants of a text to the lines between
+    start and end"""
+    sliced_codes = {}
+    for variant, (codes, ending_codes) in clean_codes.items():
+        sliced_ending_codes = ending_codes[start:end]
+        sliced_codes[variant] = (
+            {code: codes[code] for code in set(sliced_ending_codes)},
+            sliced_ending_codes,
+        )
+    return sliced_codes
+
+
+def analyze_rhyme_segments(lines, offset=4, always_return_rhyme=False,
+                           max_stanza_length=STANZA_MAX_LENGTH):
+    """Split a text with no explicit stanza boundaries into segments and
+    propose a rhyme structure for each of them.
+    Rhyme codes and line lengths are computed once for the whole text. The
+    partition is then found by dynamic programming over the candidate
+    stanza boundaries, with stanzas of up to max_stanza_length lines:
+    covering lines with a known structure is preferred over leaving them
+    unmatched, and structures ranking better in STRUCTURES over worse ones,
+    with a fixed cost per segment to prefer longer stanzas. Finally,
+    consecutive segments are joined while each of them still matches a
+    structure together with the segments before it, up to twice
+    max_stanza_length lines, and the joined segment as a whole matches a
+    structure too (e.g., long romances).
+    A list of dictionaries is returned, one per segment, with the segment
+    `start` and `end` line indices and the output of `analyze_rhyme` for it.
+    Unmatched segments only include their boundaries unless
+    always_return_rhyme is set."""
+    stressed_endings = get_stressed_endings(lines)
+    clean_codes = get_clean_codes_variants(stressed_endings)
+    length_ranges = get_length_ranges(lines)
+
+    def analyze_segment(start, end, return_rhyme=False):
+        return analyze_rhyme_codes(
+            slice_clean_codes(clean_codes, start, end),
+            length_ranges[start:end], offset, return_rhyme
+        )
+
+    def join_segments(segments):
+        joined_segments = []
+        for start, end, analysis in segments:
+            if joined_segments:
+                previous_start, _, _ = joined_segments[-1]
+                joined_analysis = analyze_segment(previous_start, end)
+                if joined_analysis is not None:
+                    joined_segments[-1] = (
+                        previous_start, end, joined_analysis)
+                    continue
+            joined_segments.append((start, end, analysis))
+        return joined_segments
+
+    # Each segment costs the rank of its structure per line plus a fixed
+    # amount, so that unmatched lines always cost the most
+    segment_cost = len(STRUCTURES)
+    unmatched_line_cost = 2 * len(STRUCTURES)
+    lines_length = len(lines)
+    costs = [0] + [None] * lines_length
+    segments = [None] * (lines_length + 1)
+    for end in range(1, lines_length + 1):
+        for length in range(min(max_stanza_length, end), 0, -1):
+            start = end - length
+            analysis = analyze_segment(start, end)
+            if analysis is not None:
+                cost = (costs[start] + segment_cost
+                        + analysis["rank"] * length)
+            elif length == 1:
+                cost = costs[start] + unmatched_line_cost
+            else:
+                continue
+            if costs[end] is None or cost < costs[end]:
+                costs[end] = cost
+                segments[end] = (start, analysis)
+    # Backtrack the best partition
+    partition = []
+    end = lines_length
+    while end > 0:
+        start, analysis = segments[end]
+        partition.append((start, end, analysis))
+        end = start
+    partition.reverse()
+    # Gather consecutive unmatched lines, and consecutive segments that
+    # still match a structure when joined to the segments before them. Only
+    # the previous segments within twice max_stanza_length lines are checked,
+    # so the cost of a check does not grow with the joined segment
+    join_length = 2 * max_stanza_length
+    runs = []
+    for start, end, analysis in partition:
+        if runs:
+            run = runs[-1]
+            _, _, previous_analysis = run[-1]
+            if previous_analysis is None and analysis is None:
+                run.append((start, end, analysis))
+                continue
+            elif previous_analysis is not None and analysis is not None:
+                window_start = start
+                for segment_start, _, _ in reversed(run):
+                    if end - segment_start > join_length:
+                        break
+                    window_start = segment_start
+                if analyze_segment(window_start, end) is not None:
+                    run.append((start, end, analysis))
+                    continue
+        runs.append([(start, end, analysis)])
+    # Each run is then analyzed once as a whole, and its segments are only
+    # joined one by one if the whole run does not match a structure
+    joined_partition = []
+    for run in runs:
+        run_start, _, run_analysis = run[0]
+        _, run_end, _ = run[-1]
+        if len(run) > 1 and run_analysis is not None:
+            run_analysis = analyze_segment(run_start, run_end)
+            if run_analysis is None:
+                joined_partition.extend(join_segments(run))
+                continue
+        joined_partition.append((run_start, run_end, run_analysis))
+    output = []
+    for start, end, analysis in joined_partition:
+        if analysis is None and always_return_rhyme:
+            analysis = analyze_segment(start, end, return_rhyme=True)
+        output.append({"start": start, "end": end, **(analysis or {})})
+    return output
+
+
 def get_best_rhyme_candidate(candidates):
     """From a list of candidates, return the one with the most rhymed verses,
     with priority:
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import get_context
+
+from .core import BATCH_SIZE
+from .core import get_scansion
+from .core import get_scansion_options
+from .core import get_scansions
+from .parallel import init_worker
+from .parallel import parse_record
+from .utils import chunked
+
+# Number of poems written to each shard file
+SHARD_SIZE = 1000
+MANIFEST = "manifest.json"
+
+
+class ManifestMismatchError(ValueError):
+    """The output directory has a manifest of a different run"""
+
+
+def list_corpus(source):
+    """List the items of a corpus, either the files of a directory, whose id
+    is their relative path, or the non-blank lines of an NDJSON file with
+    records like ``{"id": ..., "text": ...}``. Items are loaded lazily with
+    `load_item`, so skipped shards are never read nor parsed.
+
+    :param source: Path to a directory or to an NDJSON file
+    :return: Generator with tuples of item kind and value
+    :rtype: generator
+    """
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(source)
+            for name in names
+        )
+        for path in paths:
+            yield "file", os.path.relpath(path, source), path
+    else:
+        with open(source, encoding="utf-8") as lines:
+            for line_number, line in enumerate(lines, start=1):
+                if line.strip():
+                    yield "line", line_number, line
+
+
+def load_item(item):
+    """Load the id and text of an item listed by `list_corpus`"""
+    kind, record_id, value = item
+    if kind == "file":
+        with open(value, encoding="utf-8") as text:
+            return record_id, text.read()
+    return parse_record(value, record_id)
+
+
+def count_corpus(source):
+    """Count the items of a corpus without keeping them in memory"""
+    return sum(1 for _ in list_corpus(source))
+
+
+def format_error(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def scan_shard(items, options, batch_size=BATCH_SIZE):
+    """Analyze the items of a shard, capturing the errors of each record
+    instead of failing the whole shard. Texts are tagged in batches and, if
+    a batch fails, analyzed one by one to find the culprits.
+
+    :param items: List of items from `list_corpus`
+    :param options: Dictionary with the keyword arguments of `get_scansion`
+    :param batch_size: Number of texts tagged at once
+    :return: List of records with "id" and either "scansion" or "error"
+    :rtype: list
+    """
+    records = []
+    texts = []
+    for item in items:
+        try:
+            record_id, text = load_item(item)
+        except Exception as error:
+            records.append({"id": item[1], "error": format_error(error)})
+        else:
+            records.append({"id": record_id})
+            texts.append(text)
+    loaded = [record for record in records if "error" not in record]
+    try:
+        scansions = list(get_scansions(texts, batch_size=batch_size,
+                                       **options))
+    except Exception:
+        scansions = None
+    for index, record in enumerate(loaded):
+        if scansions is not None:
+            record["scansion"] = scansions[index]
+            continue
+        try:
+            record["scansion"] = get_scansion(texts[index], **options)
+        except Exception as error:
+            record["error"] = format_error(error)
+    return records
+
+
+def get_shard_path(output_dir, shard):
+    return os.path.join(output_dir, f"shard-{shard:06d}.ndjson")
+
+
+def write_json_atomically(path, content, lines=False):
+    """Write a JSON document, or a list of them as NDJSON if lines is True,
+    to a temporary file that replaces path once complete, so an interrupted
+    write never leaves a truncated file behind"""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as output:
+        if lines:
+            for record in content:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            json.dump(content, output, ensure_ascii=False, indent=2)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_manifest(output_dir, settings):
+    """Load the manifest of a previous run in output_dir, or create a new one
+
+    :param output_dir: Directory with the shards and the manifest
+    :param settings: Dictionary with the source, shard size and options
+    :return: Manifest dictionary
+    :rtype: dict
+    :raises ManifestMismatchError: If the manifest is for other settings
+    """
+    # Round trip the settings so they compare equal to the loaded ones
+    settings = json.loads(json.dumps(settings))
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return dict(settings, completed={})
+    with open(path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    for setting, value in settings.items():
+        if manifest.get(setting) != value:
+            raise ManifestMismatchError(
+                f"{output_dir} holds a run with a different {setting} "
+                f"({manifest.get(setting)!r} instead of {value!r})")
+    return manifest
+
+
+def run(source, output_dir, shard_size=SHARD_SIZE, jobs=1,
+        batch_size=BATCH_SIZE, progress=None, **options):
+    """Analyze a corpus in shards of shard_size poems, writing the results of
+    each shard to its own NDJSON file in output_dir as soon as it is done and
+    recording it in a manifest. Running it again on the same output_dir
+    skips the shards already completed, so an interrupted run resumes where
+    it stopped. Errors on single poems are written as records with an "error"
+    instead of a "scansion" and do not abort the shard.
+
+    :param source: Path to a directory of text files or to an NDJSON file
+        with records like ``{"id": ..., "text": ...}``
+    :param output_dir: Directory for the shards and the manifest
+    :param shard_size: Number of poems per shard
+    :param jobs: Number of worker processes, each analyzing whole shards
+    :param batch_size: Number of texts tagged at once
+    :param progress: Callable called with a dictionary with the shard, the
+        number of shards, records done, total records, errors so far,
+        throughput in records per second and ETA in seconds after each shard
+    :param options: Keyword arguments for `get_scansion`
+    :return: Dictionary with the number of shards, records and errors
+    :rtype: dict
+    """
+    options = get_scansion_options(**options)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir, {
+        "source": os.path.abspath(source),
+        "shard_size": shard_size,
+        "options": options,
+    })
+    completed = manifest["completed"]
+    total = count_corpus(source)
+    shards = -(-total // shard_size)
+    done = sum(shard["records"] for shard in completed.values())
+    errors = sum(shard["errors"] for shard in completed.values())
+    start_time = time.monotonic()
+    session_records = 0
+
+    def finish(shard, records):
+        nonlocal done, errors, session_records
+        write_json_atomically(get_shard_path(output_dir, shard), records,
+                              lines=True)
+        completed[str(shard)] = {
+            "records": len(records),
+            "errors": sum(1 for record in records if "error" in record),
+        }
+        write_json_atomically(os.path.join(output_dir, MANIFEST), manifest)
+        done += len(records)
+        errors += completed[str(shard)]["errors"]
+        session_records += len(records)
+        if progress is not None:
+            elapsed = time.monotonic() - start_time
+            rate = session_records / elapsed if elapsed > 0 else 0.0
+            progress({
+                "shard": shard,
+                "shards": shards,
+                "records": done,
+                "total": total,
+                "errors": errors,
+                "rate": rate,
+                "eta": (total - done) / rate if rate else None,
+            })
+
+    pending_shards = (
+        (shard, items)
+        for shard, items in enumerate(chunked(list_corpus(source),
+                                              shard_size))
+        if str(shard) not in completed
+    )
+    if jobs is None or jobs <= 1:
+        for shard, items in pending_shards:
+            finish(shard, scan_shard(items, options, batch_size))
+    else:
+        context = get_context()
+        with context.Pool(jobs, initializer=init_worker) as pool:
+            pending = deque()
+            for shard, items in pending_shards:
+                pending.append((shard, pool.apply_async(
+                    scan_shard, (items, options, batch_size))))
+                if len(pending) >= 2 * jobs:
+                    shard, result = pending.popleft()
+                    finish(shard, result.get())
+            while pending:
+                shard, result = pending.popleft()
+                finish(shard, result.get())
+    return {
+        "shards": shards,
+        "records": done,
+        "errors": errors,
+    }
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from . import __version__
+from .core import BATCH_SIZE
+from .core import RHYTHM_FORMATS
+from .core import get_scansions
+from .core import syllabify
+from .pipeline import load_pipeline
+
+# Seconds the batcher waits for more requests before tagging a batch
+MAX_WAIT = 0.01
+# Requests waiting to be analyzed before new ones are rejected
+MAX_QUEUE = 256
+# Seconds a request waits for its result
+REQUEST_TIMEOUT = 60
+# Maximum size in bytes of the body of a request
+MAX_REQUEST_SIZE = 2 ** 20
+
+BOOLEAN_OPTIONS = (
+    "rhyme_analysis",
+    "pos_output",
+    "always_return_rhyme",
+    "segment_stanzas",
+    "offsets_output",
+    "verse_type_output",
+)
+
+
+def validate_scansion_request(payload):
+    """Validate the JSON payload of a scansion request
+
+    :param payload: Decoded JSON payload with a "text" and, optionally, the
+        keyword arguments of `get_scansion`
+    :return: Tuple with the text and a dictionary with the options
+    :rtype: tuple
+    :raises ValueError: If the payload is not valid
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    options = dict(payload)
+    text = options.pop("text", None)
+    if not isinstance(text, str):
+        raise ValueError('"text" must be a string')
+    for option, value in options.items():
+        if option in BOOLEAN_OPTIONS:
+            if not isinstance(value, bool):
+                raise ValueError(f'"{option}" must be a boolean')
+        elif option == "rhythm_format":
+            if value not in RHYTHM_FORMATS:
+                raise ValueError(
+                    f'"rhythm_format" must be one of {", ".join(RHYTHM_FORMATS)}')
+        elif option == "rhythmical_lengths":
+            if value is not None and not (
+                    isinstance(value, list)
+                    and all(type(length) is int for length in value)):
+                raise ValueError(
+                    '"rhythmical_lengths" must be a list of integers')
+        elif option == "rhythmical_lengths_window":
+            if type(value) is not int or value < 1:
+                raise ValueError(
+                    '"rhythmical_lengths_window" must be a positive integer')
+        elif option == "rhyme_offset":
+            if value is not None and (type(value) is not int or value < 1):
+                raise ValueError(
+                    '"rhyme_offset" must be a positive integer or null')
+        elif option == "split_stanzas_on":
+            if value is not None:
+                if not isinstance(value, str):
+                    raise ValueError('"split_stanzas_on" must be a string')
+                try:
+                    re.compile(value)
+                except re.error as error:
+                    raise ValueError(
+                        f'"split_stanzas_on" is not a valid regular '
+                        f'expression: {error}') from None
+        else:
+            raise ValueError(f'Unknown option "{option}"')
+    return text, options
+
+
+def validate_syllabify_request(payload):
+    """Validate the JSON payload of a syllabification request
+
+    :param payload: Decoded JSON payload with a "word" and, optionally,
+        "alternative_syllabification"
+    :return: Tuple with the word and the alternative syllabification flag
+    :rtype: tuple
+    :raises ValueError: If the payload is not valid
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    unknown = set(payload) - {"word", "alternative_syllabification"}
+    if unknown:
+        raise ValueError(f'Unknown option "{sorted(unknown)[0]}"')
+    word = payload.get("word")
+    if not isinstance(word, str) or not word:
+        raise ValueError('"word" must be a non-empty string')
+    alternative = payload.get("alternative_syllabification", False)
+    if not isinstance(alternative, bool):
+        raise ValueError('"alternative_syllabification" must be a boolean')
+    return word, alternative
+
+
+class ScansionBatcher:
+    """Collect concurrent scansion requests in a bounded queue and analyze
+    them in a single worker thread, coalescing the requests that arrive
+    within max_wait seconds into micro-batches for `nlp.pipe`"""
+
+    def __init__(self, batch_size=BATCH_SIZE, max_wait=MAX_WAIT,
+                 max_queue=MAX_QUEUE):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the worker thread once the batch being analyzed is done,
+        failing the requests still waiting in the queue"""
+        self.stopped.set()
+        try:
+            # Wake up the worker if it is waiting for requests. If the queue
+            # is full, it is busy and checks the event after the batch
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[2].set_running_or_notify_cancel():
+                item[2].set_exception(
+                    RuntimeError("The server is shutting down"))
+
+    def submit(self, text, options):
+        """Enqueue a text to be analyzed
+
+        :param text: Text to be analyzed
+        :param options: Dictionary with the keyword arguments of
+            `get_scansion`
+        :return: Future with the scansion of the text
+        :rtype: concurrent.futures.Future
+        :raises queue.Full: If too many requests are already waiting
+        """
+        future = Future()
+        self.queue.put_nowait((text, options, future))
+        return future
+
+    def run(self):
+        stopping = False
+        while not stopping and not self.stopped.is_set():
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.process(batch)
+
+    def process(self, batch):
+        """Analyze a batch of requests, grouping them by their options. If a
+        group fails, its texts are analyzed one by one, so only the requests
+        with a failing text get the error"""
+        groups = {}
+        for text, options, future in batch:
+            if future.set_running_or_notify_cancel():
+                key = json.dumps(options, sort_keys=True)
+                groups.setdefault(key, (options, []))[1].append(
+                    (text, future))
+        for options, requests in groups.values():
+            self.process_group(requests, options)
+
+    def process_group(self, requests, options):
+        texts = [text for text, _ in requests]
+        try:
+            scansions = list(get_scansions(
+                texts, batch_size=self.batch_size, **options))
+        except Exception as error:
+            if len(requests) == 1:
+                _, future = requests[0]
+                future.set_exception(error)
+                return
+            for request in requests:
+                self.process_group([request], options)
+        else:
+            for (_, future), scansion in zip(requests, scansions):
+                future.set_result(scansion)
+
+
+class ScansionRequestHandler(BaseHTTPRequestHandler):
+    """Handle the requests of the HTTP/JSON API:
+
+    - ``GET /health``
+    - ``POST /scansion`` with ``{"text": ..., **options}``
+    - ``POST /syllabify`` with ``{"word": ...}``
+    """
+    server_version = f"rantanplan/{__version__}"
+
+    def send_json(self, status, body):
+        content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": message})
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ValueError("Invalid Content-Length header")
+        if length > MAX_REQUEST_SIZE:
+            raise OverflowError("Request body is too large")
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            raise ValueError("Request body must be valid JSON") from None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(HTTPStatus.OK, {
+                "status": "ok",
+                "version": __version__,
+                "queued": self.server.batcher.queue.qsize(),
+            })
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self):
+        handlers = {
+            "/scansion": self.handle_scansion,
+            "/syllabify": self.handle_syllabify,
+        }
+        if self.path not in handlers:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Not found")
+            return
+        try:
+            payload = self.read_json()
+        except OverflowError as error:
+            self.send_error_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 str(error))
+            return
+        except ValueError as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        handlers[self.path](payload)
+
+    def handle_scansion(self, payload):
+        try:
+            text, options = validate_scansion_request(payload)
+        except ValueError as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        try:
+            future = self.server.batcher.submit(text, options)
+        except queue.Full:
+            self.send_error_json(HTTPStatus.SERVICE_UNAVAILABLE,
+                                 "Too many requests, try again later")
+            return
+        try:
+            scansion = future.result(timeout=self.server.request_timeout)
+        except TimeoutError:
+            future.cancel()
+            self.send_error_json(HTTPStatus.GATEWAY_TIMEOUT,
+                                 "Scansion timed out")
+        except Exception as error:
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                 f"Scansion failed: {error}")
+        else:
+            self.send_json(HTTPStatus.OK, {"scansion": scansion})
+
+    def handle_syllabify(self, payload):
+        try:
+            word, alternative = validate_syllabify_request(payload)
+        except ValueError as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        syllabification = syllabify(word, alternative)
+        if isinstance(syllabification, tuple):
+            syllables, alternatives = syllabification
+        else:
+            syllables, alternatives = syllabification, ()
+        self.send_json(HTTPStatus.OK, {
+            "syllables": syllables,
+            "alternatives": list(alternatives),
+        })
+
+
+class ScansionServer(ThreadingHTTPServer):
+    """Threaded HTTP server that owns a `ScansionBatcher`"""
+    daemon_threads = True
+
+    def __init__(self, address, batch_size=BATCH_SIZE, max_wait=MAX_WAIT,
+                 max_queue=MAX_QUEUE, request_timeout=REQUEST_TIMEOUT):
+        super().__init__(address, ScansionRequestHandler)
+        self.request_timeout = request_timeout
+        self.batcher = ScansionBatcher(
+            batch_size=batch_size, max_wait=max_wait, max_queue=max_queue
+        ).start()
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
+
+
+def make_server(host="127.0.0.1", port=8000, prewarm=True, **kwargs):
+    """Create the HTTP scansion server, loading the spaCy pipeline first
+    unless prewarm is False
+
+    :param host: Address to bind to
+    :param port: Port to bind to. Use 0 for any free port
+    :param prewarm: `True` or `False` for loading the pipeline at startup
+    :param kwargs: Keyword arguments for `ScansionServer` (batch_size,
+        max_wait, max_queue and request_timeout)
+    :return: The server, ready to `serve_forever`
+    :rtype: ScansionServer
+    """
+    if prewarm:
+        load_pipeline()
+    return ScansionServer((host, port), **kwargs)
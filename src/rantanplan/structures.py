@@ -25,6 +25,8 @@ OCTOSYLLABLE = ARTE_MENOR_MAX_LENGTH
 TETRASYLLABLE = COPLA_ARTE_MENOR_MIN_LENGTH
 MINIMUM_SAFE_LENGTH = 3
 MAXIMUM_SAFE_LENGTH = 20
+# Longest stanza considered when splitting a text into stanzas automatically
+STANZA_MAX_LENGTH = 14
 #    STRUCTURES_LENGTH is a dictionary with a list of line lengths and a `True`
 #    or `False` flag to indicate if the structure can be repeated or not
 STRUCTURES_LENGTH = {
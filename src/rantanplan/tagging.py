@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import struct
+from itertools import count
+
+import spacy
+from spacy.tokens import DocBin
+from spacy.tokens import Token
+
+from .core import BATCH_SIZE
+from .core import _get_scansion
+from .core import get_scansion_options
+from .core import shift_offsets
+from .core import split_stanzas
+from .pipeline import load_pipeline
+
+# Token attributes that the scansion needs from the tagger
+DOCBIN_ATTRS = ["ORTH", "POS", "TAG", "SPACY"]
+# Token extensions set by the affixes matcher that the scansion needs
+DOCBIN_EXTENSIONS = ("affixes_length", )
+# Key of the id of the text and the index and offset of the stanza in
+# Doc.user_data
+USER_DATA_KEY = "rantanplan"
+# Number of Docs of each DocBin written to a tagged file
+DOCBIN_SIZE = 1000
+# Length in bytes of the DocBin that follows it in a tagged file
+DOCBIN_LENGTH = struct.Struct(">Q")
+
+
+def keep_extensions(doc, extensions=DOCBIN_EXTENSIONS):
+    """Drop the user data of a Doc except the values of some extensions
+
+    :param doc: spaCy Doc
+    :param extensions: Names of the token extensions to keep
+    :return: The same Doc
+    :rtype: spacy.tokens.Doc
+    """
+    doc.user_data = {
+        key: value for key, value in doc.user_data.items()
+        if isinstance(key, tuple) and key[1] in extensions
+    }
+    return doc
+
+
+def tag_texts(texts, path, ids=None, split_stanzas_on=None,
+              batch_size=BATCH_SIZE, docbin_size=DOCBIN_SIZE):
+    """Tag texts with the spaCy pipeline and save the results to a file of
+    DocBins, keeping only the attributes needed by the scansion, so the texts
+    can be scanned many times with `scan_tagged` without tagging them again.
+    A DocBin is written every docbin_size Docs, each preceded by its length,
+    so only one of them is kept in memory
+
+    :param texts: Iterable of texts to be tagged
+    :param path: Path of the file to write
+    :param ids: Iterable with the id of each text. Defaults to the index of
+        the text
+    :param split_stanzas_on: Regular expression to split texts in stanzas,
+        each of them tagged on their own. Defaults to None for not splitting.
+    :param batch_size: Number of texts (or stanzas) tagged at once
+    :param docbin_size: Number of Docs (texts or stanzas) of each DocBin
+    :return: Number of texts tagged
+    :rtype: int
+    """
+    nlp = load_pipeline()
+    if ids is None:
+        ids = count()
+    if split_stanzas_on is None:
+        stanzas = (
+            (text, (text_id, None, 0)) for text_id, text in zip(ids, texts)
+        )
+    else:
+        stanzas = (
+            (stanza, (text_id, index, offset))
+            for text_id, text in zip(ids, texts)
+            for index, (offset, stanza) in enumerate(
+                split_stanzas(text, split_stanzas_on))
+        )
+    tagged = 0
+    with open(path, "wb") as docbin_file:
+        docbin = DocBin(attrs=DOCBIN_ATTRS, store_user_data=True)
+        docs = 0
+        for doc, (text_id, stanza, offset) in nlp.pipe(
+                stanzas, as_tuples=True, batch_size=batch_size):
+            keep_extensions(doc)
+            doc.user_data[USER_DATA_KEY] = {
+                "id": text_id, "stanza": stanza, "offset": offset}
+            docbin.add(doc)
+            docs += 1
+            if not stanza:
+                tagged += 1
+            if docs >= docbin_size:
+                write_docbin(docbin_file, docbin)
+                docbin = DocBin(attrs=DOCBIN_ATTRS, store_user_data=True)
+                docs = 0
+        if docs:
+            write_docbin(docbin_file, docbin)
+    return tagged
+
+
+def write_docbin(docbin_file, docbin):
+    """Append a DocBin to a tagged file, preceded by its length
+
+    :param docbin_file: Binary file object
+    :param docbin: spaCy DocBin
+    """
+    content = docbin.to_bytes()
+    docbin_file.write(DOCBIN_LENGTH.pack(len(content)))
+    docbin_file.write(content)
+
+
+def iter_docbins(docbin_file):
+    """Read the DocBins of a tagged file one at a time, in the order they
+    were written by `tag_texts`
+
+    :param docbin_file: Binary file object
+    :return: Generator with each DocBin
+    :rtype: generator
+    :raises ValueError: If the file is truncated
+    """
+    while True:
+        header = docbin_file.read(DOCBIN_LENGTH.size)
+        if not header:
+            return
+        if len(header) < DOCBIN_LENGTH.size:
+            raise ValueError("Truncated tagged file")
+        length, = DOCBIN_LENGTH.unpack(header)
+        content = docbin_file.read(length)
+        if len(content) < length:
+            raise ValueError("Truncated tagged file")
+        yield DocBin(store_user_data=True).from_bytes(content)
+
+
+def get_tagged_vocab():
+    """Return a blank Spanish vocab to read tagged Docs without loading the
+    model, registering the token extensions they keep"""
+    for extension in DOCBIN_EXTENSIONS:
+        if not Token.has_extension(extension):
+            Token.set_extension(extension, default=0)
+    return spacy.blank("es").vocab
+
+
+def read_tagged(path, vocab=None):
+    """Read the texts of a file written by `tag_texts`, one DocBin at a time
+
+    :param path: Path of the tagged file
+    :param vocab: spaCy Vocab for the Docs. Defaults to a blank Spanish one,
+        so the model is not loaded
+    :return: Generator with a tuple with the id of each text and either its
+        Doc or, if it was split in stanzas, the list of Docs of its stanzas
+    :rtype: generator
+    """
+    if vocab is None:
+        vocab = get_tagged_vocab()
+    with open(path, "rb") as docbin_file:
+        text_id, stanzas = None, None
+        for docbin in iter_docbins(docbin_file):
+            for doc in docbin.get_docs(vocab):
+                metadata = doc.user_data[USER_DATA_KEY]
+                if metadata["stanza"]:
+                    stanzas.append(doc)
+                    continue
+                if stanzas is not None:
+                    yield text_id, stanzas
+                    stanzas = None
+                if metadata["stanza"] is None:
+                    yield metadata["id"], doc
+                else:
+                    text_id, stanzas = metadata["id"], [doc]
+        if stanzas is not None:
+            yield text_id, stanzas
+
+
+def scan_tagged(path, **options):
+    """Generate the scansion of each text of a file written by `tag_texts`,
+    skipping the tagging
+
+    :param path: Path of the tagged file
+    :param options: Keyword arguments for `get_scansion`, except
+        split_stanzas_on, which is set when tagging
+    :return: Generator with a tuple with the id and the scansion of each text
+    :rtype: generator
+    """
+    options = get_scansion_options(**options)
+    if options.pop("split_stanzas_on") is not None:
+        raise ValueError("Stanzas are split when tagging, with tag_texts")
+    for text_id, docs in read_tagged(path):
+        if isinstance(docs, list):
+            scansion = [_get_scansion(doc, **options) for doc in docs]
+            if options["offsets_output"]:
+                for doc, lines in zip(docs, scansion):
+                    shift_offsets(lines, doc.user_data[USER_DATA_KEY].get(
+                        "offset", 0))
+            yield text_id, scansion
+        else:
+            yield text_id, _get_scansion(docs, **options)
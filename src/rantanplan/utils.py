@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from collections import Counter
+from collections import deque
+from itertools import islice
 
 
 def generate_exceeded_offset_indices(values, offset=4):
@@ -22,3 +24,105 @@ def argcount(values, count=1):
     """Return the indices of elements that appear count times in values"""
     return [value for value, value_count in Counter(values).items()
             if value_count == count]
+
+
+def chunked(iterable, size):
+    """Split an iterable in lists of at most size elements"""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class ContextCounter:
+    """Most common value among the values around a position, within a
+    window at each side and leaving the position itself out, as
+    ``Counter(values[n - window:n] + values[n + 1:n + window + 1])
+    .most_common(1)[0][0]`` returns it, ties included: the value that
+    appears first wins. Counts are kept incrementally while the position
+    moves forward, so each step costs the same whatever the window.
+
+    Values are read with get_value when they enter the window, so a value
+    can change until it is passed (e.g., a line length fitted in place):
+    values before the position are read once the position moves past them.
+
+    :param get_value: Function returning the current value at an index, or
+        None if there is no such index
+    :param window: Number of values at each side of the position
+    """
+
+    def __init__(self, get_value, window=3):
+        self.get_value = get_value
+        self.window = window
+        self.position = None
+        # Values before and after the position, as they were read
+        self.left = deque()
+        self.right = deque()
+        # Indices of each value before and after the position, in order
+        self.indices = {}
+
+    def _add(self, value, index, side):
+        self.indices.setdefault(value, (deque(), deque()))[side].append(index)
+
+    def _remove(self, value, side):
+        indices = self.indices[value]
+        indices[side].popleft()
+        if not indices[0] and not indices[1]:
+            del self.indices[value]
+
+    def _move_to(self, position):
+        self.position = position
+        self.left.clear()
+        self.right.clear()
+        self.indices.clear()
+        for index in range(max(position - self.window, 0), position):
+            self.left.append(self.get_value(index))
+            self._add(self.left[-1], index, 0)
+        for index in range(position + 1, position + self.window + 1):
+            value = self.get_value(index)
+            if value is None:
+                break
+            self.right.append(value)
+            self._add(value, index, 1)
+
+    def _advance(self):
+        position = self.position
+        value = self.get_value(position)
+        self.left.append(value)
+        self._add(value, position, 0)
+        if len(self.left) > self.window:
+            self._remove(self.left.popleft(), 0)
+        if self.right:
+            self._remove(self.right.popleft(), 1)
+        if self.window:
+            index = position + self.window + 1
+            value = self.get_value(index)
+            if value is not None:
+                self.right.append(value)
+                self._add(value, index, 1)
+        self.position = position + 1
+
+    def most_common(self, position):
+        """Return the most common value around a position
+
+        :param position: Index of the position. Moving backwards or far
+            ahead reads the whole window again
+        :return: The most common value
+        :raises IndexError: If there are no values around the position
+        """
+        if (self.position is None or position < self.position
+                or position - self.position > 2 * self.window):
+            self._move_to(position)
+        while self.position < position:
+            self._advance()
+        if not self.indices:
+            raise IndexError("No values around the position")
+        best_value = None
+        best_key = None
+        for value, (left, right) in self.indices.items():
+            first = left[0] if left else right[0]
+            key = (len(left) + len(right), -first)
+            if best_key is None or key > best_key:
+                best_value, best_key = value, key
+        return best_value
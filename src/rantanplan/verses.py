@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import re
+
+from .structures import HENDECASYLLABLE
+from .structures import OCTOSYLLABLE
+
+# Lines longer than this cannot be stored in a 64 bits stress mask
+MAX_MASK_LENGTH = 64
+# Rhythmic types of each line length where each tuple is defined as follows:
+# (
+#     "type name",
+#     (1, 6),  # positions, starting at 1, that must be stressed
+#     (2, ),  # positions that must be unstressed
+# )
+# Types will be checked in order of definition, the first one to match will
+# be chosen, so types are classified by their first rhythmic stress. The
+# stress of the penultimate syllable is always there
+VERSE_TYPES = {
+    HENDECASYLLABLE: (
+        ("emphatic", (1, 6), ()),
+        ("heroic", (2, 6), ()),
+        ("melodic", (3, 6), ()),
+        ("sapphic", (4, 8), ()),
+        ("bagpipe", (4, 7), ()),
+    ),
+    OCTOSYLLABLE: (
+        ("dactylic", (1, 4), ()),
+        ("trochaic", (3, ), (2, 4)),
+        ("trochaic", (1, 5), (2, 4)),
+        ("mixed", (2, ), ()),
+    ),
+}
+
+# Names of the types, in order of definition
+VERSE_TYPE_NAMES = tuple(dict.fromkeys(
+    name for types in VERSE_TYPES.values() for name, _, _ in types))
+
+
+def get_positions_mask(positions):
+    """Return the bitmask of a list of syllable positions, starting at 1
+
+    :param positions: Iterable of positions
+    :return: Integer with the bit of each position set
+    :rtype: int
+    :raises ValueError: If a position does not fit in the mask
+    """
+    mask = 0
+    for position in positions:
+        if not 1 <= position <= MAX_MASK_LENGTH:
+            raise ValueError(
+                "Syllable positions must be between 1 and "
+                f"{MAX_MASK_LENGTH}")
+        mask |= 1 << (position - 1)
+    return mask
+
+
+# The same types with their positions as bitmasks
+VERSE_TYPE_MASKS = {
+    length: tuple(
+        (name, get_positions_mask(stressed), get_positions_mask(unstressed))
+        for name, stressed, unstressed in types
+    )
+    for length, types in VERSE_TYPES.items()
+}
+
+
+def get_stress_mask(rhythm):
+    """Return the stresses of the rhythm of a line as a bitmask, whatever the
+    format it was analyzed with
+
+    :param rhythm: Dictionary with the "stress", "type" and "length" of the
+        rhythm of a line
+    :return: Integer with the bit of each stressed syllable set, the first
+        syllable being the least significant bit
+    :rtype: int
+    """
+    stress = rhythm["stress"]
+    rhythm_format = rhythm.get("type", "pattern")
+    if rhythm_format == "bitmask":
+        return stress
+    if rhythm_format == "indexed":
+        # Any indexed_separator
+        return sum(1 << (int(position) - 1)
+                   for position in re.findall(r"\d+", stress))
+    stressed = "1" if rhythm_format == "binary" else "+"
+    return sum(1 << index for index, mark in enumerate(stress)
+               if mark == stressed)
+
+
+def get_verse_type(mask, length):
+    """Get the rhythmic type of a line, e.g., "heroic" for a hendecasyllable
+    stressed on the 2nd and 6th syllables
+
+    :param mask: Integer with the stresses of the line as a bitmask
+    :param length: Metrical length of the line
+    :return: Name of the type, or None if the line has none
+    :rtype: str
+    """
+    for name, stressed, unstressed in VERSE_TYPE_MASKS.get(length, ()):
+        if mask & stressed == stressed and not mask & unstressed:
+            return name
+    return None
@@ -0,0 +1,74 @@
+import pytest
+import spacy
+from spacy.tokens import Token
+
+import rantanplan.core
+import rantanplan.parallel
+import rantanplan.runner
+import rantanplan.server
+import rantanplan.tagging
+
+
+class FakePipeline:
+    """Blank Spanish pipeline that tags every word as a noun"""
+
+    def __init__(self):
+        self.nlp = spacy.blank("es")
+        if not Token.has_extension("affixes_length"):
+            Token.set_extension("affixes_length", default=0)
+        if not Token.has_extension("affixes_kind"):
+            Token.set_extension("affixes_kind", default=None)
+        self.docs = []
+
+    def __call__(self, text):
+        doc = self.nlp(text)
+        for token in doc:
+            token.pos_ = "SPACE" if token.is_space else "NOUN"
+            token.tag_ = "_SP" if token.is_space else "Number=Sing"
+            if token.text == "mayo":
+                token._.affixes_kind = "suffix"
+                token._.affixes_length = 2
+        self.docs.append(doc)
+        return doc
+
+    def pipe(self, texts, as_tuples=False, batch_size=None):
+        for text, context in texts:
+            yield self(text), context
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(rantanplan.tagging, "load_pipeline", lambda: pipeline)
+    return pipeline
+
+
+def fake_get_scansion(text, **options):
+    """Analysis without the spaCy model that returns each line of the text
+    with the options it was analyzed with. Texts with "boom" fail"""
+    if "boom" in text:
+        raise RuntimeError("boom")
+    return [{"text": line, "options": options} for line in text.splitlines()]
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Replace the analysis with `fake_get_scansion` in every module that
+    runs it, and return the list of the batches of texts analyzed"""
+    batches = []
+
+    def get_scansion(text, **options):
+        batches.append([text])
+        return fake_get_scansion(text, **options)
+
+    def get_scansions(texts, batch_size=None, cache=None, **options):
+        texts = list(texts)
+        batches.append(texts)
+        return (fake_get_scansion(text, **options) for text in texts)
+
+    for module in (rantanplan.core, rantanplan.parallel, rantanplan.runner,
+                   rantanplan.server):
+        monkeypatch.setattr(module, "get_scansions", get_scansions)
+    monkeypatch.setattr(rantanplan.runner, "get_scansion", get_scansion)
+    monkeypatch.setattr(rantanplan.parallel, "load_pipeline", lambda: None)
+    return batches
@@ -0,0 +1,145 @@
+import asyncio
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rantanplan
+import rantanplan.parallel
+from rantanplan.aio import AsyncScanner
+from rantanplan.aio import aget_scansion
+from rantanplan.aio import aiter_scansions
+from rantanplan.core import get_scansion
+
+
+def test_aget_scansion(batches, monkeypatch):
+    threads = []
+    get_scansions = rantanplan.parallel.get_scansions
+
+    def record_thread(texts, **options):
+        threads.append(threading.get_ident())
+        return get_scansions(texts, **options)
+
+    monkeypatch.setattr(rantanplan.parallel, "get_scansions", record_thread)
+
+    async def main():
+        return await aget_scansion("Verso", rhyme_analysis=True)
+
+    scansion = asyncio.run(main())
+
+    assert scansion[0]["text"] == "Verso"
+    assert threads and threading.get_ident() not in threads
+
+
+def test_aget_scansion_lazy_import():
+    assert rantanplan.aget_scansion is aget_scansion
+    modules = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, rantanplan; print(sorted(sys.modules))"],
+        check=True, capture_output=True, text=True).stdout
+    assert "'rantanplan.aio'" not in modules
+    with pytest.raises(AttributeError):
+        rantanplan.aget_scansions
+
+
+def test_aget_scansion_model():
+    texts = ["Que por mayo era por mayo\ncuando hace la calor",
+             "cuando los trigos encañan\ny están los campos en flor"]
+
+    async def main():
+        return await asyncio.gather(
+            *(aget_scansion(text, rhyme_analysis=True) for text in texts))
+
+    assert asyncio.run(main()) == [
+        get_scansion(text, rhyme_analysis=True) for text in texts]
+
+
+def test_aget_scansion_coalesces(batches):
+    texts = [f"Verso {index}" for index in range(10)]
+
+    async def main():
+        return await asyncio.gather(
+            *(aget_scansion(text) for text in texts),
+            aget_scansion("Otro", rhyme_analysis=True))
+
+    scansions = asyncio.run(main())
+
+    assert [scansion[0]["text"] for scansion in scansions] == texts + [
+        "Otro"]
+    assert sorted(batches) == sorted([texts, ["Otro"]])
+
+
+def test_aget_scansion_batch_size(batches):
+    scanner = AsyncScanner(batch_size=4, max_wait=0.05)
+
+    async def main():
+        first = [scanner.scansion(f"{index}") for index in range(3)]
+        await asyncio.sleep(0.01)
+        second = [scanner.scansion(f"{index}") for index in range(3, 6)]
+        return await asyncio.gather(*first, *second)
+
+    scansions = asyncio.run(main())
+
+    assert [scansion[0]["text"] for scansion in scansions] == [
+        str(index) for index in range(6)]
+    assert sorted(batches) == [["0", "1", "2", "3"], ["4", "5"]]
+
+
+def test_async_scanner_thread_concurrency():
+    with pytest.raises(ValueError):
+        AsyncScanner(max_concurrency=2)
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            AsyncScanner(executor=executor, max_concurrency=2)
+
+
+def test_aget_scansion_error(batches):
+    async def main():
+        return await asyncio.gather(
+            aget_scansion("boom"),
+            aget_scansion("Verso", rhyme_analysis=True),
+            return_exceptions=True)
+
+    error, scansion = asyncio.run(main())
+
+    assert isinstance(error, RuntimeError)
+    assert scansion[0]["text"] == "Verso"
+
+
+def test_aget_scansion_error_batch(batches):
+    async def main():
+        return await asyncio.gather(
+            aget_scansion("Verso"),
+            aget_scansion("boom"),
+            return_exceptions=True)
+
+    scansion, error = asyncio.run(main())
+
+    assert scansion[0]["text"] == "Verso"
+    assert isinstance(error, RuntimeError)
+    assert batches == [["Verso", "boom"], ["Verso"], ["boom"]]
+
+
+def test_aget_scansion_invalid_option(batches):
+    with pytest.raises(TypeError):
+        asyncio.run(aget_scansion("Verso", rhyme=True))
+
+
+def test_aiter_scansions(batches):
+    texts = [f"Verso {index}" for index in range(7)]
+
+    async def agenerate():
+        for text in texts:
+            await asyncio.sleep(0)
+            yield text
+
+    async def main(source):
+        scanner = AsyncScanner(batch_size=3)
+        return [scansion[0]["text"] async for scansion in aiter_scansions(
+            source, scanner=scanner)]
+
+    assert asyncio.run(main(texts)) == texts
+    assert asyncio.run(main(agenerate())) == texts
+    assert batches[:3] == [texts[:3], texts[3:6], texts[6:]]
@@ -0,0 +1,157 @@
+import pytest
+
+import rantanplan
+import rantanplan.core
+from rantanplan.cache import ScansionCache
+from rantanplan.core import get_scansion
+from rantanplan.core import get_scansion_options
+from rantanplan.core import get_scansions
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with ScansionCache(tmp_path / "cache.sqlite") as scansion_cache:
+        yield scansion_cache
+
+
+@pytest.fixture
+def no_pipeline(monkeypatch):
+    def load_pipeline():
+        raise AssertionError("The pipeline should not be loaded")
+
+    monkeypatch.setattr(rantanplan.core, "load_pipeline", load_pipeline)
+
+
+def test_cache_store_lookup(cache):
+    options = get_scansion_options()
+    entries = cache.lookup(["uno", "dos"], options)
+    assert [value for _, value in entries] == [None, None]
+
+    cache.store([(entries[0][0], [{"text": "uno"}])])
+    entries = cache.lookup(["uno", "dos", "uno"], options)
+
+    assert [value for _, value in entries] == [
+        [{"text": "uno"}], None, [{"text": "uno"}]]
+    assert cache.info()["entries"] == 1
+
+
+def test_cache_key(cache):
+    options = get_scansion_options()
+    key = cache.get_key("uno", options)
+
+    assert key == cache.get_key("uno", get_scansion_options())
+    assert key != cache.get_key("uno ", options)
+    assert key != cache.get_key(
+        "uno", get_scansion_options(rhyme_analysis=True))
+
+
+def test_cache_versions(cache, tmp_path):
+    options = get_scansion_options()
+    key = cache.get_key("uno", options)
+    with ScansionCache(tmp_path / "other.sqlite") as other:
+        other.versions = other.versions.replace(
+            rantanplan.__version__, "0.0.0")
+
+        assert other.get_key("uno", options) != key
+
+
+def test_cache_evict_entries(tmp_path):
+    with ScansionCache(tmp_path / "cache.sqlite", max_entries=2) as cache:
+        for index in range(3):
+            cache.store([(str(index), index)])
+            # Touch the first entry so it is the most recently used
+            cache.connection.execute(
+                "UPDATE scansions SET accessed = accessed + 10 "
+                "WHERE key = '0'")
+
+        assert cache.info()["entries"] == 2
+        assert cache.connection.execute(
+            "SELECT key FROM scansions ORDER BY key").fetchall() == [
+            ("0", ), ("2", )]
+
+
+def test_cache_evict_size(tmp_path):
+    with ScansionCache(tmp_path / "cache.sqlite", max_size=300) as cache:
+        for index in range(10):
+            cache.store([(str(index), "x" * 100)])
+
+        info = cache.info()
+        assert 0 < info["size"] <= 300
+        assert info["entries"] < 10
+
+
+def test_cache_totals(tmp_path):
+    def count():
+        return cache.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scansions"
+        ).fetchone()
+
+    with ScansionCache(tmp_path / "cache.sqlite", max_entries=3) as cache:
+        cache.store([("a", "x"), ("b", [1, 2]), ("a", "xyz")])
+        assert cache.get_totals() == count() == (2, 10)
+        cache.store([("b", None), ("c", {"d": 4}), ("e", "ñ")])
+        assert cache.get_totals() == count()
+        assert cache.info()["entries"] == 3
+        assert cache.evict() == 0
+
+    # Totals are kept when the cache is opened again
+    with ScansionCache(tmp_path / "cache.sqlite") as cache:
+        assert cache.get_totals() == count()
+
+
+def test_cache_json(cache):
+    cache.store([("a", [{"text": "uno", "stress": 5}])])
+    [(value, )] = cache.connection.execute("SELECT value FROM scansions")
+
+    assert value == b'[{"text":"uno","stress":5}]'
+
+
+def test_cache_purge(cache):
+    cache.store([("a", 1), ("b", 2)])
+
+    assert cache.purge() == 2
+    assert cache.info()["entries"] == 0
+    assert cache.get_totals() == (0, 0)
+
+
+def test_get_scansion_cache(cache, no_pipeline):
+    options = get_scansion_options(rhyme_analysis=True)
+    key = cache.get_key("Verso cacheado", options)
+    cache.store([(key, [{"text": "cached"}])])
+
+    assert get_scansion("Verso cacheado", rhyme_analysis=True,
+                        cache=cache) == [{"text": "cached"}]
+
+
+def test_get_scansions_cache_model(cache, monkeypatch):
+    texts = ["Que por mayo era por mayo\ncuando hace la calor",
+             "cuando los trigos encañan\ny están los campos en flor",
+             "Que por mayo era por mayo\ncuando hace la calor"]
+    expected = [get_scansion(text, rhyme_analysis=True) for text in texts]
+
+    assert list(get_scansions(texts, rhyme_analysis=True,
+                              cache=cache)) == expected
+    assert cache.info()["entries"] == 2
+
+    def load_pipeline():
+        raise AssertionError("The pipeline should not be loaded")
+
+    monkeypatch.setattr(rantanplan.core, "load_pipeline", load_pipeline)
+
+    assert list(get_scansions(texts, rhyme_analysis=True,
+                              cache=cache)) == expected
+
+
+def test_get_scansions_cache(cache, batches):
+    texts = ["uno", "dos", "tres", "dos"]
+    options = get_scansion_options()
+    for key, _ in cache.lookup(["uno", "tres"], options):
+        cache.store([(key, "hit")])
+    scansions = list(get_scansions(texts, cache=cache, batch_size=3))
+    dos = [{"text": "dos", "options": options}]
+
+    assert scansions == ["hit", dos, "hit", dos]
+    # The second "dos" is found in the cache, stored by the first chunk
+    assert batches == [["dos"]]
+    assert [value for _, value in cache.lookup(["dos"], {})] == [None]
+    assert cache.lookup(["dos"], options)[0][1] == dos
@@ -18,14 +18,19 @@ from rantanplan.core import get_orthographic_accent
 from rantanplan.core import get_phonological_groups
 from rantanplan.core import get_rhythmical_pattern
 from rantanplan.core import get_scansion
+from rantanplan.core import get_scansion_sweep
+from rantanplan.core import get_scansions
 from rantanplan.core import get_stresses
 from rantanplan.core import get_syllables_word_end
+from rantanplan.core import get_tag_features
 from rantanplan.core import get_word_stress
 from rantanplan.core import get_words
 from rantanplan.core import has_single_liaisons
 from rantanplan.core import have_prosodic_liaison
 from rantanplan.core import is_paroxytone
+from rantanplan.core import iter_scansion
 from rantanplan.core import remove_exact_length_matches
+from rantanplan.core import resolve_offsets
 from rantanplan.core import set_stress_exceptions
 from rantanplan.core import spacy_tag_to_dict
 from rantanplan.core import syllabify
@@ -473,6 +478,135 @@ def test_get_scansion_stanzas():
     assert cuarteto_lira[0]["structure"] == "cuarteto_lira"
 
 
+def test_get_scansion_segment_stanzas():
+    poem = """Cruel amor, ¿tan fieras sinrazones
+    tras tanta confusión, tras pena tanta?
+    ¿De qué sirve la argolla a la garganta
+    a quién jamás huyó de sus prisiones?
+    ¿Hierro por premio das a mis pasiones?
+    Dueño cruel, tu sinrazón espanta,
+    el castigo a la pena se adelanta
+    y cuando sirvo bien hierros me pones.
+    ¡Gentil laurel, amor; buenos despojos!
+    Y en un sujeto a tus mudanzas firme
+    hierro, virote, lágrimas y enojos.
+    Mas pienso que has querido persuadirme
+    que trayendo los hierros a los ojos
+    no pueda de la causa arrepentirme.
+    Que por mayo era por mayo,
+    cuando hace la calor,
+    cuando los trigos encañan
+    y están los campos en flor,
+    cuando canta la calandria
+    y responde el ruiseñor,
+    cuando los enamorados
+    van a servir al amor;
+    sino yo, triste, cuitado,
+    que vivo en esta prisión;
+    que ni sé cuando es de día
+    ni cuando las noches son,
+    sino por una avecilla
+    que me cantaba al albor.
+    Matómela un ballestero;
+    déle Dios mal galardón."""
+    scansion = get_scansion(poem, rhyme_analysis=True, segment_stanzas=True)
+    assert [line["stanza"] for line in scansion] == 14 * [0] + 16 * [1]
+    assert [line["structure"] for line in scansion] == (
+        14 * ["sonnet"] + 16 * ["romance"])
+
+
+def test_get_scansions():
+    texts = [
+        "Que por mayo era por mayo,\ncuando hace la calor,",
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+    ]
+    assert list(get_scansions(texts, rhyme_analysis=True, batch_size=1)) == [
+        get_scansion(text, rhyme_analysis=True) for text in texts]
+    split_on = r"\n"
+    assert list(get_scansions(texts, split_stanzas_on=split_on)) == [
+        get_scansion(text, split_stanzas_on=split_on) for text in texts]
+
+
+def test_get_scansion_sweep():
+    text = """Que por mayo era por mayo,
+cuando hace la calor,
+cuando los trigos encañan
+y están los campos en flor"""
+    option_sets = [
+        {},
+        {"rhyme_analysis": True, "rhythm_format": "binary"},
+        {"rhythm_format": "indexed", "pos_output": True},
+        {"rhythmical_lengths": [8, 8, 8, 8]},
+        {"split_stanzas_on": r"\n", "rhyme_analysis": True},
+        {"rhyme_analysis": True, "rhyme_offset": 1},
+        {"rhyme_analysis": True, "rhyme_offset": None},
+    ]
+    scansions = get_scansion_sweep(text, option_sets)
+    assert scansions == [
+        get_scansion(text, **options) for options in option_sets]
+    scansions[0][0]["tokens"].clear()
+    assert scansions[1][0]["tokens"]
+
+
+def test_get_scansion_rhyme_offset():
+    text = """Que por mayo era por mayo,
+cuando hace la calor,
+cuando los trigos encañan
+y están los campos en flor"""
+    scansion = get_scansion(text, rhyme_analysis=True)
+    assert [line["rhyme"] for line in scansion] == ["-", "a", "-", "a"]
+    # Even lines are two lines apart
+    scansion = get_scansion(text, rhyme_analysis=True, rhyme_offset=1,
+                            always_return_rhyme=True)
+    assert [line["rhyme"] for line in scansion] == ["-", "-", "-", "-"]
+
+
+def test_iter_scansion():
+    text = """Que por mayo era por mayo,
+cuando hace la calor,
+cuando los trigos encañan
+y están los campos en flor"""
+    option_sets = [
+        {},
+        {"rhythmical_lengths_window": 1, "pos_output": True},
+        {"rhyme_analysis": True, "rhythm_format": "binary"},
+        {"rhythmical_lengths": [8, 8, 8, 8]},
+        {"split_stanzas_on": r"\n", "rhyme_analysis": True},
+    ]
+    for options in option_sets:
+        scansion = get_scansion(text, **options)
+        lines = iter_scansion(text, **options)
+        assert next(lines) == scansion[0]
+        assert list(lines) == scansion[1:]
+
+
+def test_get_scansion_offsets():
+    text = """Que por mayo era por mayo,
+cuando hace la calor"""
+    scansion = get_scansion(text, offsets_output=True)
+    tokens = scansion[1]["tokens"]
+
+    assert tokens[0]["start"] == text.index("cuando")
+    assert [text[syllable["start"]:syllable["end"]]
+            for syllable in tokens[0]["word"]] == ["cuan", "do"]
+    assert "syllable" not in scansion[0]["phonological_groups"][0]
+    resolved = list(resolve_offsets(scansion, text))
+    expected = get_scansion(text)
+    assert [group["syllable"] for group in resolved[0][
+        "phonological_groups"]] == [
+        group["syllable"] for group in expected[0]["phonological_groups"]]
+    assert resolved[0]["tokens"][-1]["symbol"] == ","
+
+
+def test_get_scansion_verse_types():
+    text = "Cuando me paro a contemplar mi estado"
+    scansion = get_scansion(text, verse_type_output=True)
+
+    assert scansion[0]["rhythm"]["stress"] == "+--+---+-+-"
+    assert scansion[0]["rhythm"]["verse_type"] == "sapphic"
+    assert "verse_type" not in get_scansion(text)[0]["rhythm"]
+
+
 def test_get_scansion_structures_length():
     text = "casa azul"
     output = [
@@ -769,6 +903,40 @@ def test_spacy_tag_to_dict_no_tags():
     assert spacy_tag_to_dict(tag) == {}
 
 
+def test_get_tag_features():
+    features = get_tag_features("PRON", "Case=Nom|Number=Sing|Person=1")
+    assert features.tag == {'Case': 'Nom', 'Number': 'Sing', 'Person': '1'}
+    assert features.monosyllable
+    assert not features.polysyllable
+    assert get_tag_features("PRON", "Case=Nom|Number=Sing|Person=1") is (
+        features)
+    features = get_tag_features("DET", "Definite=Def|PronType=Art")
+    assert not features.monosyllable
+    assert not features.polysyllable
+    with pytest.raises(TypeError):
+        features.tag["Case"] = "Acc"
+
+
+@pytest.mark.parametrize("word, pos, tag", [
+    ("yo", "PRON", "Case=Nom|Number=Sing|Person=1"),
+    ("me", "PRON", "Case=Acc|Number=Sing|Person=1|PronType=Prs"),
+    ("la", "DET", "Definite=Def|Gender=Fem|Number=Sing|PronType=Art"),
+    ("mi", "DET", "Number=Sing|Person=1|Poss=Yes|PronType=Prs"),
+    ("nuestro", "DET", "Gender=Masc|Number=Sing|Poss=Yes|PronType=Prs"),
+    ("aquel", "PRON", "Gender=Masc|Number=Sing|PronType=Dem"),
+    ("cual", "PRON", "Number=Sing|PronType=Int,Rel"),
+    ("que", "SCONJ", ""),
+    ("casa", "NOUN", "Gender=Fem|Number=Sing"),
+])
+def test_get_word_stress_features(word, pos, tag):
+    features = get_tag_features(pos, tag)
+    for is_last_word in (False, True):
+        assert get_word_stress(word, pos, features.tag,
+                               is_last_word=is_last_word,
+                               features=features) == get_word_stress(
+            word, pos, spacy_tag_to_dict(tag), is_last_word=is_last_word)
+
+
 def test_get_syllables_word_end():
     output = [
         {'syllable': 'tu', 'is_stressed': False},
@@ -1122,6 +1290,12 @@ def test_format_stress_binary():
     assert (format_stress(stresses, rhythm_format="binary") == output)
 
 
+def test_format_stress_bitmask():
+    stresses = (True, True, False, True)
+    output = 0b1011
+    assert (format_stress(stresses, rhythm_format="bitmask") == output)
+
+
 def test_get_last_syllable():
     word = [
         {'word': [
@@ -0,0 +1,101 @@
+import pytest
+
+from rantanplan.core import get_scansions
+from rantanplan.corpus import Corpus
+
+CORPUS = """
+Poema uno,
+verso dos.
+***
+
+Poema dos
+***
+***
+  ***  \r
+Poema tres, con ***
+dentro
+***"""
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text(CORPUS, encoding="utf-8")
+    return path
+
+
+def test_corpus(corpus_path):
+    with Corpus(str(corpus_path), delimiter="***") as corpus:
+        assert len(corpus) == 3
+        assert list(corpus) == [
+            "Poema uno,\nverso dos.",
+            "Poema dos",
+            "Poema tres, con ***\ndentro",
+        ]
+        assert corpus[-1] == "Poema tres, con ***\ndentro"
+        raw = corpus.raw(1)
+        assert bytes(raw) == b"Poema dos"
+        raw.release()
+
+
+def test_corpus_views(corpus_path):
+    with Corpus(str(corpus_path), delimiter="***") as corpus:
+        view = corpus[1:]
+        assert len(view) == 2
+        assert view[0] == "Poema dos"
+        assert list(view[::-1]) == ["Poema tres, con ***\ndentro",
+                                    "Poema dos"]
+        assert list(corpus.select([2, 0])) == [
+            "Poema tres, con ***\ndentro", "Poema uno,\nverso dos."]
+        assert list(view.select([1])) == ["Poema tres, con ***\ndentro"]
+        with pytest.raises(IndexError):
+            corpus[3]
+        # Closing a view leaves the corpus open
+        with corpus[:1] as first:
+            assert list(first) == ["Poema uno,\nverso dos."]
+        view.close()
+        assert corpus[0] == "Poema uno,\nverso dos."
+
+
+def test_corpus_encoding(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text("Canción\n***\nCorazón", encoding="latin-1")
+    with Corpus(str(path), delimiter="***", encoding="latin-1") as corpus:
+        assert list(corpus) == ["Canción", "Corazón"]
+    for encoding in ("utf-16", "shift_jis", "cp500"):
+        with pytest.raises(ValueError):
+            Corpus(str(path), delimiter="***", encoding=encoding)
+
+
+def test_corpus_index(corpus_path, monkeypatch):
+    Corpus(str(corpus_path), delimiter="***").close()
+    index_path = corpus_path.parent / "corpus.txt.idx"
+    assert index_path.exists()
+
+    def build_offsets(*args):
+        raise AssertionError("The index should be loaded")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("rantanplan.corpus.build_offsets", build_offsets)
+        with Corpus(str(corpus_path), delimiter="***") as corpus:
+            assert corpus[1] == "Poema dos"
+
+    corpus_path.write_text(CORPUS + "\nPoema cuatro", encoding="utf-8")
+    with Corpus(str(corpus_path), delimiter="***") as corpus:
+        assert corpus[-1] == "Poema cuatro"
+    with Corpus(str(corpus_path), delimiter="Poema dos") as corpus:
+        assert len(corpus) == 2
+
+
+def test_corpus_empty(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_text("", encoding="utf-8")
+    with Corpus(str(path), delimiter="***", save_index=False) as corpus:
+        assert len(corpus) == 0
+        assert list(corpus) == []
+
+
+def test_corpus_scansions(corpus_path):
+    with Corpus(str(corpus_path), delimiter="***") as corpus:
+        scansions = list(get_scansions(corpus[:2]))
+        assert [len(scansion) for scansion in scansions] == [2, 1]
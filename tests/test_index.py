@@ -0,0 +1,95 @@
+import pytest
+
+from rantanplan.index import RhythmIndex
+from rantanplan.index import classify_masks
+from rantanplan.index import parse_pattern
+from rantanplan.index import set_verse_types
+from rantanplan.verses import VERSE_TYPE_NAMES
+from rantanplan.verses import get_verse_type
+
+np = pytest.importorskip("numpy")
+
+
+def line(stress, rhythm_format="pattern", length=None):
+    if length is None:
+        length = len(stress)
+    return {"rhythm": {"stress": stress, "type": rhythm_format,
+                       "length": length}}
+
+
+SCANSIONS = [
+    [line("-+---+---+-"), line("---+---+-+-"), line("+-+-+--+")],
+    [[line("2-6-10", "indexed", 11)],
+     [line("01000100010", "binary"), line(0b1010000010, "bitmask", 11)]],
+    [line("+" * 65)],
+]
+
+
+@pytest.fixture
+def index():
+    return RhythmIndex.build(SCANSIONS, ids=["a", "b", "c"])
+
+
+def test_parse_pattern():
+    assert parse_pattern("+-?+") == (4, 0b1001, 0b10)
+    with pytest.raises(ValueError):
+        parse_pattern("+-x")
+
+
+def test_rhythm_index_query(index):
+    # The line of 65 syllables is left out
+    assert len(index) == 6
+    assert index.query(length=11, stressed=[6, 10]).tolist() == [0, 3, 4]
+    assert index.query(length=11, stressed=[4]).tolist() == [1]
+    assert index.query(stressed=[1]).tolist() == [2]
+    assert index.query(pattern="-+---+---+-").tolist() == [0, 3, 4]
+    assert index.query(pattern="-+???+---+-",
+                       unstressed=[8]).tolist() == [0, 3, 4]
+    assert index.query(pattern="-+-+?+---+-").tolist() == []
+    assert index.query(length=8).tolist() == [2]
+    with pytest.raises(ValueError):
+        index.query(length=10, pattern="-+---+---+-")
+
+
+def test_rhythm_index_locate(index):
+    assert index.locate(index.query(stressed=[2])) == [
+        ("a", -1, 0), ("b", 0, 0), ("b", 1, 0), ("b", 1, 1)]
+
+
+def test_rhythm_index_save_load(index, tmp_path):
+    index.save(str(tmp_path / "index"))
+    loaded = RhythmIndex.load(str(tmp_path / "index"))
+    assert isinstance(loaded.masks, np.memmap)
+    assert loaded.ids == ["a", "b", "c"]
+    assert loaded.query(pattern="-+---+---+-").tolist() == [0, 3, 4]
+    assert loaded.locate([2]) == [("a", -1, 2)]
+
+
+def test_classify_masks():
+    masks = np.arange(2 ** 11, dtype=np.uint64)
+    for length in (8, 11):
+        lengths = np.full(len(masks), length, dtype=np.uint8)
+        names = VERSE_TYPE_NAMES + (None, )
+        assert [names[code] for code in classify_masks(masks, lengths)] == [
+            get_verse_type(mask, length) for mask in range(2 ** 11)]
+
+
+def test_rhythm_index_verse_types(index):
+    assert index.query(verse_type="heroic").tolist() == [0, 3, 4]
+    assert index.query(verse_type="sapphic").tolist() == [1]
+    assert index.query(verse_type="dactylic").tolist() == []
+    assert index.verse_types([2]).tolist() == [
+        VERSE_TYPE_NAMES.index("trochaic")]
+    with pytest.raises(ValueError):
+        index.query(verse_type="alexandrine")
+
+
+def test_set_verse_types():
+    scansions = set_verse_types([
+        [line("-+---+---+-"), line("+--+--+-")],
+        [[line("3,6,10", "indexed", 11)], [line("+" * 65)]],
+    ])
+    assert [line["rhythm"]["verse_type"] for line in scansions[0]] == [
+        "heroic", "dactylic"]
+    assert scansions[1][0][0]["rhythm"]["verse_type"] == "melodic"
+    assert scansions[1][1][0]["rhythm"]["verse_type"] is None
@@ -0,0 +1,79 @@
+import json
+
+import rantanplan.core
+import rantanplan.parallel
+from rantanplan.core import get_scansion
+from rantanplan.parallel import get_chunk_bounds
+from rantanplan.parallel import get_long_scansion
+from rantanplan.parallel import imap_scansions
+from rantanplan.parallel import pack_units
+from rantanplan.parallel import stream_scansions
+
+TEXTS = [
+    "Que por mayo era por mayo\ncuando hace la calor",
+    "cuando los trigos encañan\n\ny están los campos en flor",
+]
+
+
+def test_pack_units():
+    costs = [1, 9, 3, 12, 2, 4]
+
+    assert pack_units(costs, max_cost=10, max_size=3) == [
+        (12, [3]), (10, [1, 0]), (9, [5, 2, 4])]
+    assert pack_units(costs, max_cost=100, max_size=2) == [
+        (21, [3, 1]), (7, [5, 2]), (3, [4, 0])]
+
+
+def test_imap_scansions_scheduling(batches):
+    texts = [f"Verso {index}\n" * (index % 7 + 1) for index in range(40)]
+    # Long texts are only split in chunks with split_lines
+    texts.append("Verso largo\n" * 600)
+    reports = []
+    scansions = list(imap_scansions(texts, jobs=2, batch_size=3,
+                                    report=reports.append))
+
+    assert scansions == [[{"text": line, "options": {}}
+                          for line in text.splitlines()] for text in texts]
+    [report] = reports
+    assert report["split_texts"] == 0
+    assert report["units"] == sum(
+        worker["units"] for worker in report["workers"])
+    assert sum(worker["cost"] for worker in report["workers"]) == sum(
+        len(text.split()) + text.count("\n") + 1 for text in texts)
+
+
+def test_stream_scansions(batches):
+    lines = [json.dumps({"id": index, "text": f"Verso {index}"}) + "\n"
+             for index in range(7)]
+    lines.insert(3, "\n")
+    for jobs in (1, 2):
+        records = list(stream_scansions(iter(lines), jobs=jobs, batch_size=2,
+                                        rhyme_analysis=True))
+
+        assert [record["id"] for record in records] == list(range(7))
+        assert records[5]["scansion"] == [
+            {"text": "Verso 5", "options": {"rhyme_analysis": True}}]
+
+
+def test_get_chunk_bounds():
+    text = "\n\nuno\ndos\n\ntres\ncuatro"
+
+    assert [text[start:end] for start, end, _, _ in get_chunk_bounds(
+        text, chunk_lines=1, context_lines=1)] == [
+        "\n\nuno\ndos\n", "uno\ndos\n\n", "dos\n\ntres\n",
+        "dos\n\ntres\ncuatro", "tres\ncuatro"]
+    assert [text[start:end][chunk_start:chunk_end]
+            for start, end, chunk_start, chunk_end in get_chunk_bounds(
+                text, chunk_lines=2, context_lines=0)] == [
+        "\n\nuno\ndos\n", "\ntres\n", "cuatro"]
+
+
+def test_get_long_scansion(pipeline, monkeypatch):
+    monkeypatch.setattr(rantanplan.core, "load_pipeline", lambda: pipeline)
+    monkeypatch.setattr(rantanplan.parallel, "load_pipeline",
+                        lambda: pipeline)
+    text = "\n".join(TEXTS * 4)
+    for options in ({}, {"rhyme_analysis": True},
+                    {"split_stanzas_on": r"\n\n", "pos_output": True}):
+        assert get_long_scansion(text, jobs=2, chunk_lines=3,
+                                 **options) == get_scansion(text, **options)
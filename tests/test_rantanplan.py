@@ -1,12 +1,214 @@
+import json
 
+import pytest
 from click.testing import CliRunner
 
+import rantanplan.parallel
+from rantanplan.cache import ScansionCache
 from rantanplan.cli import main
 
 
+@pytest.fixture
+def poems(tmp_path):
+    for index in range(5):
+        (tmp_path / f"poem{index}.txt").write_text(
+            f"Verso {index}\nOtro verso {index}", encoding="utf-8")
+    return tmp_path
+
+
 def test_main():
     runner = CliRunner()
-    result = runner.invoke(main, [])
+    result = runner.invoke(main, ["--help"])
+
+    assert "scan" in result.output
+    assert result.exit_code == 0
+
+
+def test_scan_stdin(batches):
+    runner = CliRunner()
+    result = runner.invoke(main, ["scan", "--rhyme", "--rhythm-format",
+                                  "binary", "--rhythmical-lengths", "8,8"],
+                           input="Que por mayo\nera por mayo")
+
+    assert result.exit_code == 0
+    records = json.loads(result.output)
+    assert [record["source"] for record in records] == ["-"]
+    scansion = records[0]["scansion"]
+    assert [line["text"] for line in scansion] == [
+        "Que por mayo", "era por mayo"]
+    assert scansion[0]["options"] == {
+        "rhyme_analysis": True,
+        "rhythm_format": "binary",
+        "split_stanzas_on": None,
+        "rhythmical_lengths": [8, 8],
+        "offsets_output": False,
+        "verse_type_output": False,
+    }
+
+
+def test_scan_glob_ndjson(batches, poems):
+    runner = CliRunner()
+    result = runner.invoke(main, ["scan", "--format", "ndjson",
+                                  str(poems / "poem*.txt")])
+
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["source"] for record in records] == [
+        str(poems / f"poem{index}.txt") for index in range(5)]
+    assert records[3]["scansion"][1]["text"] == "Otro verso 3"
+
+
+def test_scan_jobs(batches, poems):
+    runner = CliRunner()
+    output = poems / "output.json"
+    result = runner.invoke(main, ["scan", "--jobs", "2", "--batch-size", "2",
+                                  "-o", str(output),
+                                  str(poems / "poem*.txt")])
+
+    assert result.exit_code == 0
+    records = json.loads(output.read_text(encoding="utf-8"))
+    assert [record["scansion"][0]["text"] for record in records] == [
+        f"Verso {index}" for index in range(5)]
+
+
+def test_scan_report(batches, poems):
+    runner = CliRunner()
+    output = poems / "output.json"
+    result = runner.invoke(main, ["scan", "--jobs", "2", "--report",
+                                  "-o", str(output),
+                                  str(poems / "poem*.txt")])
 
-    assert result.output == '()\n'
     assert result.exit_code == 0
+    assert "units of work" in result.output
+    assert "utilization" in result.output
+    records = json.loads(output.read_text(encoding="utf-8"))
+    assert len(records) == 5
+
+
+def test_scan_missing_file(batches, poems):
+    runner = CliRunner()
+    result = runner.invoke(main, ["scan", str(poems / "missing*.txt")])
+
+    assert result.exit_code != 0
+    assert "No such file" in result.output
+
+
+def test_scan_invalid_lengths(batches):
+    runner = CliRunner()
+    result = runner.invoke(main, ["scan", "--rhythmical-lengths", "8,a"],
+                           input="Verso")
+
+    assert result.exit_code != 0
+
+
+def test_stream(batches):
+    runner = CliRunner()
+    records = [{"id": "a", "text": "Verso a\nOtro a"},
+               {"text": "Verso b"},
+               {"id": 3, "text": "Verso c"}]
+    stream = "\n".join(json.dumps(record) for record in records) + "\n\n"
+    result = runner.invoke(main, ["stream", "--rhyme", "--batch-size", "2"],
+                           input=stream)
+
+    assert result.exit_code == 0
+    output = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["id"] for record in output] == ["a", 2, 3]
+    assert output[0]["scansion"][1]["text"] == "Otro a"
+    assert output[0]["scansion"][0]["options"]["rhyme_analysis"]
+
+
+def test_stream_invalid_record(batches):
+    runner = CliRunner()
+    result = runner.invoke(main, ["stream"],
+                           input='{"text": "Verso"}\n{"id": 2}\n')
+
+    assert result.exit_code != 0
+    assert "line 2" in result.output
+
+
+def test_cache_info_purge(tmp_path, monkeypatch):
+    monkeypatch.setenv("RANTANPLAN_CACHE", str(tmp_path / "cache.sqlite"))
+    runner = CliRunner()
+    result = runner.invoke(main, ["cache", "info"])
+
+    assert result.exit_code == 0
+    assert json.loads(result.output)["entries"] == 0
+
+    result = runner.invoke(main, ["cache", "purge", "--yes"])
+
+    assert result.exit_code == 0
+    assert "Deleted 0" in result.output
+
+
+def test_rhymes_build_find(tmp_path):
+    path = str(tmp_path / "rhymes.json.gz")
+    runner = CliRunner()
+    result = runner.invoke(main, ["rhymes", "build", "-o", path],
+                           input="casa\ncorazón\npasa\nrazón\ncama\n")
+
+    assert result.exit_code == 0
+    assert "5 words" in result.output
+
+    result = runner.invoke(main, ["rhymes", "find", "casa", "-d", path,
+                                  "--key", "assonant"])
+
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["pasa", "cama"]
+
+
+def test_scan_cache(batches, poems, monkeypatch):
+    monkeypatch.setenv("RANTANPLAN_CACHE", str(poems / "cache.sqlite"))
+    runner = CliRunner()
+    args = ["scan", "--cache", "-j", "2", "--batch-size", "2",
+            str(poems / "poem*.txt")]
+    first = runner.invoke(main, args)
+    monkeypatch.setattr(rantanplan.parallel, "scan_chunk", None)
+    second = runner.invoke(main, args)
+
+    assert first.exit_code == second.exit_code == 0
+    assert json.loads(first.output) == json.loads(second.output)
+    info = json.loads(runner.invoke(main, ["cache", "info"]).output)
+    assert info["entries"] == 5
+
+
+def test_cache_closed(batches, poems, monkeypatch):
+    monkeypatch.setenv("RANTANPLAN_CACHE", str(poems / "cache.sqlite"))
+    closed = []
+    close = ScansionCache.close
+
+    def record_close(self):
+        closed.append(self)
+        close(self)
+
+    monkeypatch.setattr(ScansionCache, "close", record_close)
+    runner = CliRunner()
+    result = runner.invoke(main, ["scan", "--cache", str(poems / "poem0.txt")])
+
+    assert result.exit_code == 0
+    assert len(closed) == 1
+    result = runner.invoke(main, ["stream", "--cache"],
+                           input='{"text": "Verso"}\n')
+
+    assert result.exit_code == 0
+    assert len(closed) == 2
+
+
+def test_run(batches, tmp_path):
+    corpus = tmp_path / "corpus.ndjson"
+    corpus.write_text("".join(
+        json.dumps({"id": index, "text": f"Verso {index}"}) + "\n"
+        for index in range(5)), encoding="utf-8")
+    runner = CliRunner()
+    output_dir = tmp_path / "output"
+    result = runner.invoke(main, ["run", "--shard-size", "2", str(corpus),
+                                  str(output_dir)])
+
+    assert result.exit_code == 0
+    assert "Shard 3/3: 5/5 poems" in result.output
+    assert len(list(output_dir.glob("shard-*.ndjson"))) == 3
+
+    result = runner.invoke(main, ["run", "--shard-size", "3", str(corpus),
+                                  str(output_dir)])
+
+    assert result.exit_code != 0
+    assert "different shard_size" in result.output
@@ -0,0 +1,48 @@
+import pytest
+
+from rantanplan.rhyme_dictionary import RhymeDictionary
+from rantanplan.rhyme_index import get_word_ending
+
+WORDS = ["canción", "corazón", "casa", " pasa\n", "", "tierra", "guerra",
+         "lámpara", "razón", "casa"]
+
+
+@pytest.fixture
+def dictionary():
+    return RhymeDictionary.build(WORDS)
+
+
+def test_get_word_ending():
+    assert get_word_ending("canción") == (("ción", ), -1)
+    assert get_word_ending("casa") == (("ca", "sa"), -2)
+    assert get_word_ending("lámpara") == (("lám", "pa", "ra"), -3)
+
+
+def test_rhyme_dictionary(dictionary):
+    assert len(dictionary) == 8
+    assert "pasa" in dictionary
+    assert dictionary.get_keys("tierra") == {
+        "consonant": "IErra", "assonant": "IEa",
+        "relaxed_consonant": "Erra", "relaxed_assonant": "Ea"}
+    # Words not in the dictionary are computed
+    assert dictionary.get_keys("sierra") == dictionary.get_keys("tierra")
+    assert dictionary.rhymes_with("razón") == ["corazón"]
+    assert dictionary.rhymes_with("canción", key="relaxed_consonant") == [
+        "corazón", "razón"]
+    assert dictionary.rhymes_with("cama", key="assonant") == [
+        "casa", "pasa"]
+    assert dictionary.rhymes_with("sierra", key="relaxed_consonant") == [
+        "tierra", "guerra"]
+    with pytest.raises(ValueError):
+        dictionary.rhymes_with("casa", key="rhyme")
+
+
+def test_rhyme_dictionary_save_load(dictionary, tmp_path):
+    path = str(tmp_path / "rhymes.json.gz")
+    dictionary.save(path)
+    loaded = RhymeDictionary.load(path)
+
+    assert loaded.words == dictionary.words
+    assert loaded.endings == dictionary.endings
+    assert loaded.rhymes == dictionary.rhymes
+    assert loaded.rhymes_with("casa") == ["pasa"]
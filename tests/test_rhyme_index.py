@@ -0,0 +1,112 @@
+import pytest
+
+from rantanplan.rhyme_index import RhymeIndex
+from rantanplan.rhyme_index import get_rhyme_keys
+
+
+def line(*words):
+    """Build a scansion line from words given as lists of syllables, with
+    the stressed syllable upper cased"""
+    return {
+        "tokens": [{"word": [{"syllable": syllable.lower()}
+                             for syllable in word]} for word in words],
+        "phonological_groups": [
+            {"syllable": syllable.lower(),
+             "is_stressed": syllable.isupper()}
+            for word in words for syllable in word
+        ],
+    }
+
+
+SCANSIONS = {
+    "poem1": [
+        line(["la"], ["CA", "sa"]),
+        line(["el"], ["co", "ra", "ZÓN"]),
+        line(["u", "na"], ["TA", "za"]),
+        line(["la"], ["can", "CIÓN"]),
+    ],
+    "poem2": [[
+        line(["el"], ["AL", "ma"]),
+        line(["la"], ["CA", "ma"]),
+    ], [
+        line(["la"], ["ra", "ZÓN"]),
+    ]],
+    "poem3": [
+        line(["su"], ["CA", "sa"]),
+        line(["mi"], ["PA", "sa"]),
+    ],
+}
+METADATA = {
+    "poem1": ("Lope", "Barroco"),
+    "poem2": ("Lope", "Barroco"),
+    "poem3": ("Bécquer", "Romanticismo"),
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    with RhymeIndex(str(tmp_path / "rhymes.sqlite")) as index:
+        index.add_records(
+            {"id": poem_id, "scansion": scansion,
+             "author": METADATA[poem_id][0], "period": METADATA[poem_id][1]}
+            for poem_id, scansion in SCANSIONS.items())
+        yield index
+
+
+def test_get_rhyme_keys():
+    keys = get_rhyme_keys(SCANSIONS["poem1"][:2])
+    assert keys == [
+        {"word": "casa", "consonant": "Asa", "assonant": "Aa",
+         "relaxed_consonant": "Asa", "relaxed_assonant": "Aa"},
+        {"word": "corazón", "consonant": "On", "assonant": "O",
+         "relaxed_consonant": "On", "relaxed_assonant": "O"},
+    ]
+    assert get_rhyme_keys(SCANSIONS["poem1"][3:])[0] == {
+        "word": "canción", "consonant": "iOn", "assonant": "iO",
+        "relaxed_consonant": "On", "relaxed_assonant": "O"}
+
+
+def test_rhyme_index_find_rhymes(index):
+    assert index.info()["lines"] == 9
+    assert index.find_rhymes("casa") == [
+        ("poem1", -1, 0, "casa"), ("poem3", -1, 0, "casa"),
+        ("poem3", -1, 1, "pasa")]
+    assert index.find_rhymes("Taza", key="assonant") == [
+        ("poem1", -1, 0, "casa"), ("poem1", -1, 2, "taza"),
+        ("poem2", 0, 0, "alma"), ("poem2", 0, 1, "cama"),
+        ("poem3", -1, 0, "casa"),
+        ("poem3", -1, 1, "pasa")]
+    assert index.find_lines("On") == [
+        ("poem1", -1, 1, "corazón"), ("poem2", 1, 0, "razón")]
+    assert index.find_rhymes("razón", key="relaxed_consonant") == [
+        ("poem1", -1, 1, "corazón"), ("poem1", -1, 3, "canción"),
+        ("poem2", 1, 0, "razón")]
+    # Words that do not end any line
+    assert index.find_rhymes("masa") == [
+        ("poem1", -1, 0, "casa"), ("poem3", -1, 0, "casa"),
+        ("poem3", -1, 1, "pasa")]
+    assert index.find_rhymes("ratón", key="assonant") == [
+        ("poem1", -1, 1, "corazón"), ("poem2", 1, 0, "razón")]
+    assert index.find_rhymes("luna") == []
+    # Words with another key at the end of their lines fall back to it
+    assert index.find_rhymes("alma") == [("poem2", 0, 0, "alma")]
+    with pytest.raises(ValueError):
+        index.find_rhymes("casa", key="rhyme")
+
+
+def test_rhyme_index_most_common(index):
+    assert index.most_common(n=2) == [("Asa", 3), ("On", 2)]
+    assert index.most_common("assonant", group_by="author", n=1) == {
+        "Bécquer": [("Aa", 2)], "Lope": [("Aa", 4)]}
+    assert index.most_common(group_by="period", n=None)["Barroco"] == [
+        ("On", 2), ("ALma", 1), ("Ama", 1), ("Asa", 1), ("Aza", 1),
+        ("iOn", 1)]
+    with pytest.raises(ValueError):
+        index.most_common(group_by="century")
+
+
+def test_rhyme_index_replace(index):
+    index.add("poem3", [line(["la"], ["LU", "na"])], author="Bécquer")
+    assert index.info()["poems"] == 3
+    assert index.find_lines("Una") == [("poem3", -1, 0, "luna")]
+    assert index.find_rhymes("pasa") == [("poem1", -1, 0, "casa")]
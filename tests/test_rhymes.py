@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
+import copy
 import json
+import random
 from pathlib import Path
 
 import pytest
 
+import rantanplan.rhymes
 from rantanplan.core import get_scansion
 from rantanplan.rhymes import analyze_rhyme
+from rantanplan.rhymes import analyze_rhyme_segments
 from rantanplan.rhymes import apply_offset
 from rantanplan.rhymes import assign_letter_codes
+from rantanplan.rhymes import clear_structure_cache
 from rantanplan.rhymes import get_best_rhyme_candidate
+from rantanplan.rhymes import get_clean_code
 from rantanplan.rhymes import get_clean_codes
+from rantanplan.rhymes import get_clean_codes_variants
 from rantanplan.rhymes import get_ending_with_liaison
 from rantanplan.rhymes import get_rhymes
+from rantanplan.rhymes import get_rhymes_from_codes
 from rantanplan.rhymes import get_stressed_endings
+from rantanplan.rhymes import relax_syllable
 from rantanplan.rhymes import rhyme_codes_to_letters
 from rantanplan.rhymes import search_structure
+from rantanplan.rhymes import search_structure_cache_info
 from rantanplan.rhymes import split_stress
+from rantanplan.utils import generate_exceeded_offset_indices
 
 
 @pytest.fixture
@@ -153,6 +164,38 @@ def test_get_clean_codes_assonance_relaxation(stressed_endings):
     assert get_clean_codes(stressed_endings, True, True) == output
 
 
+def test_get_clean_codes_variants(stressed_endings):
+    variants = get_clean_codes_variants(copy.deepcopy(stressed_endings))
+    assert sorted(variants) == [
+        (False, False), (False, True), (True, False), (True, True)]
+    for (assonance, relaxation), output in variants.items():
+        assert output == get_clean_codes(
+            copy.deepcopy(stressed_endings), assonance, relaxation)
+
+
+def test_get_clean_code():
+    assert get_clean_code(('ma', 'yo'), -2) == 'Ayo'
+    assert get_clean_code(('ma', 'yo'), -2, assonance=True) == 'Ao'
+    assert get_clean_code(('sión',), -1, relaxation=True) == 'On'
+    assert get_clean_code(('ci', 'lla'), -2, True, True) == 'Ia'
+
+
+def test_get_clean_code_cache(stressed_endings):
+    get_clean_code.cache_clear()
+    get_clean_codes(copy.deepcopy(stressed_endings))
+    misses = get_clean_code.cache_info().misses
+    get_clean_codes(copy.deepcopy(stressed_endings))
+    assert get_clean_code.cache_info().misses == misses
+    assert get_clean_code.cache_info().hits >= len(stressed_endings)
+
+
+def test_relax_syllable():
+    assert relax_syllable('viEN') == 'bEN'
+    assert relax_syllable('LLAVE') == 'YABE'
+    assert relax_syllable('quie') == 'ke'
+    assert relax_syllable('GUI') == 'JI'
+
+
 def get_assign_letter_codes():
     clean_codes = (
         {0: 'Ao', 1: 'O', 2: 'Aa', 3: 'Ia', 4: 'Eo'},
@@ -213,6 +256,33 @@ def test_apply_offset():
     assert apply_offset(codes, code_numbers) == out
 
 
+def apply_offset_reference(codes, ending_codes, offset=4):
+    """Previous quadratic implementation of apply_offset"""
+    code_numbers = ending_codes.copy()
+    offset_indices = generate_exceeded_offset_indices(code_numbers, offset)
+    for offset_index in offset_indices:
+        max_code = max(code_numbers) + 1
+        code_numbers = (
+            code_numbers[:offset_index]
+            + [max_code if code == code_numbers[offset_index] else code
+               for code in code_numbers[offset_index:]]
+        )
+        codes[max_code] = codes[ending_codes[offset_index]]
+    return codes, code_numbers
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_apply_offset_matches_reference(seed):
+    rng = random.Random(seed)
+    n_codes = rng.randint(1, 12)
+    code_numbers = [rng.randrange(n_codes)
+                    for _ in range(rng.randint(0, 200))]
+    codes = {code: f"ending{code}" for code in range(n_codes)}
+    offset = rng.randint(0, 10)
+    assert apply_offset(codes.copy(), code_numbers, offset) == (
+        apply_offset_reference(codes.copy(), code_numbers, offset))
+
+
 def test_sort_rhyme_letters_unrhymed():
     rhymes_codes = [-1, 1, 2, 1, 2, 1, 0, 1, 0, 1, 3, 1, 3, 1, -1, 1]
     output = ['$', 'a', 'b', 'a', 'b', 'a', 'c', 'a',
@@ -326,6 +396,13 @@ def test_get_rhymes_assonance_relaxation_offset(stressed_endings):
     ) == output
 
 
+def test_get_rhymes_from_codes(stressed_endings):
+    codes, ending_codes = get_clean_codes(
+        copy.deepcopy(stressed_endings), assonance=True)
+    assert get_rhymes_from_codes(codes, ending_codes, offset=4) == get_rhymes(
+        stressed_endings, assonance=True, offset=4)
+
+
 def test_get_rhymes_unrhymed(stressed_endings):
     output = (
         ['$', 'a', '$', 'a', '$', 'a', '$', 'a', '$', '$', '$', '$', '$', 'a',
@@ -457,6 +534,65 @@ def test_search_structure():
     assert search_structure(rhymes, ranges_list, key) == [50]
 
 
+def test_search_structure_cache():
+    clear_structure_cache()
+    rhymes = '-a-a'
+    ranges_list = [range(14, 16), range(14, 17), range(12, 15), range(15, 18)]
+    key = "assonant"
+    assert search_structure(rhymes, ranges_list, key) == [50]
+    assert search_structure_cache_info().misses == 1
+    assert search_structure(rhymes, ranges_list, key) == [50]
+    assert search_structure_cache_info().hits == 1
+    assert search_structure(rhymes, ranges_list, "consonant") == []
+    assert search_structure_cache_info().misses == 2
+
+
+def test_search_structure_custom_structures():
+    structures = [
+        ("assonant", "any", r".*", lambda _: True),
+        ("assonant", "paired", lambda rhyme: len(rhyme) % 2 == 0,
+         lambda _: True),
+    ]
+    ranges_list = [range(8, 9)] * 4
+    assert search_structure('-a-a', ranges_list, "assonant",
+                            structures) == [0, 1]
+    assert search_structure('-a-', ranges_list[:3], "assonant",
+                            structures) == [0]
+    assert search_structure('-a-a', ranges_list, "assonant") == [48, 49]
+
+
+def test_search_structure_cache_bounded():
+    clear_structure_cache()
+    ranges_list = [range(8, 9)] * 4
+    # Equal structures share their entries, whatever their identity
+    for _ in range(3):
+        structures = [("assonant", "any", r".*", bool)]
+        assert search_structure('-a-a', ranges_list, "assonant",
+                                structures) == [0]
+    assert search_structure_cache_info().misses == 1
+    assert search_structure_cache_info().hits == 2
+    assert search_structure_cache_info().maxsize is not None
+
+
+def test_search_structure_combined_patterns():
+    structures = [
+        ("consonant", "twice", r"(ab)\1", lambda _: True),
+        ("consonant", "pairs", r"(ab)+  # verbose comment", lambda _: True),
+        ("assonant", "pairs", r"(ab)+", lambda _: True),
+        ("consonant", "short", r"(ab)+", lambda ranges: len(ranges) < 4),
+        ("consonant", "any", r".*", lambda _: True),
+    ]
+    ranges_list = [range(8, 9)] * 4
+    assert search_structure('abab', ranges_list, "consonant",
+                            structures) == [0, 1, 4]
+    assert search_structure('ab', ranges_list[:2], "consonant",
+                            structures) == [1, 3, 4]
+    assert search_structure('abc', ranges_list[:3], "consonant",
+                            structures) == [4]
+    assert search_structure('abab', ranges_list, "assonant",
+                            structures) == [2]
+
+
 def test_analyze_rhyme_haiku(rhyme_analysis_haiku):
     """
     Noche sin luna.
@@ -516,6 +652,51 @@ def test_analyze_rhyme_romance(romance):
     assert analyze_rhyme(romance)["name"] == 'romance'
 
 
+def test_analyze_rhyme_segments(rhyme_analysis_sonnet, romance, couplet):
+    lines = rhyme_analysis_sonnet + romance + couplet + rhyme_analysis_sonnet
+    segments = analyze_rhyme_segments(copy.deepcopy(lines))
+    assert [(segment["start"], segment["end"], segment["name"])
+            for segment in segments] == [
+        (0, 14, "sonnet"),
+        (14, 30, "romance"),
+        (30, 32, "couplet"),
+        (32, 46, "sonnet"),
+    ]
+    assert segments[0]["rhyme"] == analyze_rhyme(
+        copy.deepcopy(rhyme_analysis_sonnet))["rhyme"]
+
+
+def test_analyze_rhyme_segments_single_structure(romance):
+    segments = analyze_rhyme_segments(copy.deepcopy(romance))
+    assert len(segments) == 1
+    assert {key: value for key, value in segments[0].items()
+            if key not in ("start", "end")} == analyze_rhyme(
+        copy.deepcopy(romance))
+
+
+def test_analyze_rhyme_segments_linear(monkeypatch, romance):
+    analyzed_lines = []
+    analyze_rhyme_codes = rantanplan.rhymes.analyze_rhyme_codes
+
+    def count_lines(clean_codes, length_ranges, *args):
+        analyzed_lines.append(len(length_ranges))
+        return analyze_rhyme_codes(clean_codes, length_ranges, *args)
+
+    monkeypatch.setattr(rantanplan.rhymes, "analyze_rhyme_codes", count_lines)
+    counts = []
+    for lines_length in (1000, 4000):
+        # A romance on a single pair of lines, repeated
+        lines = copy.deepcopy(romance[:2] * (lines_length // 2))
+        analyzed_lines.clear()
+        segments = analyze_rhyme_segments(lines)
+        assert [(segment["start"], segment["end"], segment["name"])
+                for segment in segments] == [(0, lines_length, "romance")]
+        counts.append(sum(analyzed_lines))
+    # Joining segments one by one to the whole joined segment grows with the
+    # square of the number of lines
+    assert counts[1] < 5 * counts[0]
+
+
 def test_rhyme_analysis_tercetillo_consonant():
     poem = """Poderoso visionario,
     raro ingenio temerario,
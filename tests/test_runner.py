@@ -0,0 +1,146 @@
+import json
+
+import pytest
+
+from rantanplan.core import get_scansion
+from rantanplan.core import get_scansion_options
+from rantanplan.runner import ManifestMismatchError
+from rantanplan.runner import run
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def corpus_dir(tmp_path):
+    corpus = tmp_path / "corpus"
+    (corpus / "b").mkdir(parents=True)
+    for index in range(3):
+        (corpus / f"poem{index}.txt").write_text(f"Verso {index}",
+                                                 encoding="utf-8")
+        (corpus / "b" / f"poem{index}.txt").write_text(f"Verso b{index}",
+                                                       encoding="utf-8")
+    return corpus
+
+
+def read_shards(output_dir):
+    return [json.loads(line)
+            for shard in sorted(output_dir.glob("shard-*.ndjson"))
+            for line in shard.read_text(encoding="utf-8").splitlines()]
+
+
+def test_run_directory(batches, corpus_dir, tmp_path):
+    output_dir = tmp_path / "output"
+    summary = run(str(corpus_dir), str(output_dir), shard_size=4)
+
+    assert summary == {"shards": 2, "records": 6, "errors": 0}
+    records = read_shards(output_dir)
+    assert [record["id"] for record in records] == [
+        "b/poem0.txt", "b/poem1.txt", "b/poem2.txt",
+        "poem0.txt", "poem1.txt", "poem2.txt"]
+    assert records[3]["scansion"] == [
+        {"text": "Verso 0", "options": get_scansion_options()}]
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    assert set(manifest["completed"]) == {"0", "1"}
+
+
+def test_run_model(tmp_path):
+    texts = ["Que por mayo era por mayo\ncuando hace la calor",
+             "cuando los trigos encañan\ny están los campos en flor",
+             "cuando canta la calandria\ny responde el ruiseñor"]
+    source = tmp_path / "corpus.ndjson"
+    source.write_text("".join(
+        json.dumps({"id": index, "text": text}, ensure_ascii=False) + "\n"
+        for index, text in enumerate(texts)), encoding="utf-8")
+    output_dir = tmp_path / "output"
+    summary = run(str(source), str(output_dir), shard_size=2,
+                  rhyme_analysis=True)
+
+    assert summary == {"shards": 2, "records": 3, "errors": 0}
+    assert [record["scansion"] for record in read_shards(output_dir)] == [
+        get_scansion(text, rhyme_analysis=True) for text in texts]
+
+
+def test_run_resume(batches, corpus_dir, tmp_path):
+    output_dir = tmp_path / "output"
+
+    def interrupt(status):
+        raise Interrupted
+
+    with pytest.raises(Interrupted):
+        run(str(corpus_dir), str(output_dir), shard_size=2,
+            progress=interrupt)
+    assert batches == [["Verso b0", "Verso b1"]]
+
+    statuses = []
+    summary = run(str(corpus_dir), str(output_dir), shard_size=2,
+                  progress=statuses.append)
+
+    assert summary["records"] == 6
+    assert sum(len(batch) for batch in batches) == 6
+    assert [status["shard"] for status in statuses] == [1, 2]
+    assert statuses[-1]["records"] == statuses[-1]["total"] == 6
+    assert statuses[-1]["eta"] == 0
+    assert len(read_shards(output_dir)) == 6
+
+
+def test_run_errors(batches, tmp_path):
+    source = tmp_path / "corpus.ndjson"
+    source.write_text("\n".join([
+        json.dumps({"id": "a", "text": "Verso a"}),
+        json.dumps({"id": "b", "text": "boom"}),
+        "{not json",
+        "",
+        json.dumps({"text": "Verso d"}),
+    ]), encoding="utf-8")
+    output_dir = tmp_path / "output"
+    summary = run(str(source), str(output_dir), shard_size=10)
+
+    assert summary == {"shards": 1, "records": 4, "errors": 2}
+    records = read_shards(output_dir)
+    assert [record["id"] for record in records] == ["a", "b", 3, 5]
+    assert records[0]["scansion"][0]["text"] == "Verso a"
+    assert records[1]["error"] == "RuntimeError: boom"
+    assert records[2]["error"].startswith("ValueError: Invalid JSON")
+    assert records[3]["scansion"][0]["text"] == "Verso d"
+
+
+def test_run_progress_errors(batches, tmp_path):
+    source = tmp_path / "corpus.ndjson"
+    source.write_text("\n".join(
+        json.dumps({"id": index, "text": "boom" if index % 2 else "Verso"})
+        for index in range(6)), encoding="utf-8")
+    output_dir = tmp_path / "output"
+
+    def interrupt(status):
+        raise Interrupted
+
+    with pytest.raises(Interrupted):
+        run(str(source), str(output_dir), shard_size=2, progress=interrupt)
+    statuses = []
+    run(str(source), str(output_dir), shard_size=2, progress=statuses.append)
+
+    # Errors are counted over every shard done, including resumed ones
+    assert [(status["records"], status["errors"])
+            for status in statuses] == [(4, 2), (6, 3)]
+
+
+def test_run_jobs(batches, corpus_dir, tmp_path):
+    output_dir = tmp_path / "output"
+    summary = run(str(corpus_dir), str(output_dir), shard_size=1, jobs=2,
+                  batch_size=2)
+
+    assert summary == {"shards": 6, "records": 6, "errors": 0}
+    assert [record["scansion"][0]["text"]
+            for record in read_shards(output_dir)] == [
+        "Verso b0", "Verso b1", "Verso b2", "Verso 0", "Verso 1", "Verso 2"]
+
+
+def test_run_manifest_mismatch(batches, corpus_dir, tmp_path):
+    output_dir = tmp_path / "output"
+    run(str(corpus_dir), str(output_dir), shard_size=2)
+
+    with pytest.raises(ManifestMismatchError):
+        run(str(corpus_dir), str(output_dir), shard_size=2,
+            rhyme_analysis=True)
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.error import HTTPError
+from urllib.request import Request
+from urllib.request import urlopen
+
+import pytest
+
+import rantanplan.server
+from rantanplan.core import get_scansion
+from rantanplan.server import ScansionBatcher
+from rantanplan.server import make_server
+from rantanplan.server import validate_scansion_request
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def factory(**kwargs):
+        server = make_server(port=0, prewarm=False, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append(server)
+        return "http://{}:{}".format(*server.server_address[:2])
+
+    yield factory
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(url, payload=None, data=None):
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+    try:
+        with urlopen(Request(url, data=data), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_health(batches, server_factory):
+    url = server_factory()
+    status, body = request(f"{url}/health")
+
+    assert status == 200
+    assert body["status"] == "ok"
+
+
+def test_scansion(batches, server_factory):
+    url = server_factory()
+    status, body = request(f"{url}/scansion", {
+        "text": "Verso uno\nVerso dos",
+        "rhyme_analysis": True,
+        "rhythmical_lengths": [4, 4],
+    })
+
+    assert status == 200
+    assert [line["text"] for line in body["scansion"]] == [
+        "Verso uno", "Verso dos"]
+    assert body["scansion"][0]["options"] == {
+        "rhyme_analysis": True, "rhythmical_lengths": [4, 4]}
+
+
+def test_scansion_model(server_factory):
+    url = server_factory()
+    text = "Que por mayo era por mayo\ncuando hace la calor"
+    status, body = request(f"{url}/scansion", {
+        "text": text, "rhyme_analysis": True})
+
+    assert status == 200
+    assert body["scansion"] == get_scansion(text, rhyme_analysis=True)
+
+
+def test_scansion_micro_batching(batches, server_factory):
+    url = server_factory(max_wait=0.5, batch_size=4)
+    texts = [f"Verso {index}" for index in range(8)]
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(
+            lambda text: request(f"{url}/scansion", {"text": text}), texts))
+
+    assert [body["scansion"][0]["text"] for _, body in responses] == texts
+    assert len(batches) < len(texts)
+    assert max(len(batch) for batch in batches) <= 4
+
+
+def test_scansion_backpressure(batches, server_factory, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    process = rantanplan.server.ScansionBatcher.process
+
+    def blocking_process(self, batch):
+        started.set()
+        release.wait(10)
+        process(self, batch)
+
+    monkeypatch.setattr(rantanplan.server.ScansionBatcher, "process",
+                        blocking_process)
+    url = server_factory(max_wait=0, max_queue=1)
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(request, f"{url}/scansion", {"text": "Uno"})
+        assert started.wait(10)
+        second = executor.submit(request, f"{url}/scansion", {"text": "Dos"})
+        while request(f"{url}/health")[1]["queued"] < 1:
+            time.sleep(0.01)
+        status, body = request(f"{url}/scansion", {"text": "Tres"})
+        release.set()
+
+        assert status == 503
+        assert first.result()[0] == 200
+        assert second.result()[0] == 200
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"rhyme_analysis": True}, '"text"'),
+    ({"text": "Verso", "rhyme_analysis": "yes"}, '"rhyme_analysis"'),
+    ({"text": "Verso", "rhythm_format": "morse"}, '"rhythm_format"'),
+    ({"text": "Verso", "rhythmical_lengths": [8, "8"]},
+     '"rhythmical_lengths"'),
+    ({"text": "Verso", "rhyme_offset": 0}, '"rhyme_offset"'),
+    ({"text": "Verso", "split_stanzas_on": "("}, '"split_stanzas_on"'),
+    ({"text": "Verso", "colour": "blue"}, '"colour"'),
+])
+def test_scansion_invalid_options(batches, server_factory, payload, message):
+    url = server_factory()
+    status, body = request(f"{url}/scansion", payload)
+
+    assert status == 400
+    assert message in body["error"]
+    assert batches == []
+
+
+def test_scansion_invalid_json(batches, server_factory):
+    url = server_factory()
+    status, body = request(f"{url}/scansion", data=b"{text")
+
+    assert status == 400
+
+
+@pytest.mark.parametrize("length", ["-1", "ten"])
+def test_scansion_invalid_length(batches, server_factory, length):
+    url = server_factory()
+    connection = HTTPConnection(*url[len("http://"):].split(":"), timeout=10)
+    connection.putrequest("POST", "/scansion")
+    connection.putheader("Content-Length", length)
+    connection.endheaders(b'{"text": "Verso"}')
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read())["error"]
+    connection.close()
+
+
+def test_batcher_stop_full_queue(batches, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    process = ScansionBatcher.process
+
+    def blocking_process(self, batch):
+        started.set()
+        release.wait(10)
+        process(self, batch)
+
+    monkeypatch.setattr(ScansionBatcher, "process", blocking_process)
+    batcher = ScansionBatcher(max_wait=0, max_queue=1).start()
+    first = batcher.submit("Uno", {})
+    assert started.wait(10)
+    second = batcher.submit("Dos", {})
+    stopping = threading.Thread(target=batcher.stop)
+    stopping.start()
+    assert batcher.stopped.wait(10)
+    release.set()
+    stopping.join(10)
+
+    assert not stopping.is_alive()
+    assert first.result(10) == [{"text": "Uno", "options": {}}]
+    with pytest.raises(RuntimeError):
+        second.result(10)
+    assert batches == [["Uno"]]
+
+
+def test_scansion_error(batches, server_factory):
+    url = server_factory()
+    status, body = request(f"{url}/scansion", {"text": "boom"})
+
+    assert status == 500
+    assert "boom" in body["error"]
+
+
+def test_scansion_error_batch(batches, server_factory):
+    url = server_factory(max_wait=0.5)
+    with ThreadPoolExecutor(2) as executor:
+        good, bad = executor.map(
+            lambda text: request(f"{url}/scansion", {"text": text}),
+            ["Verso", "boom"])
+
+    assert good == (200, {"scansion": [{"text": "Verso", "options": {}}]})
+    assert bad[0] == 500
+    assert sorted(batches[0]) == ["Verso", "boom"]
+    assert sorted(batches[1:]) == [["Verso"], ["boom"]]
+
+
+def test_syllabify(batches, server_factory):
+    url = server_factory()
+    status, body = request(f"{url}/syllabify", {"word": "atlántico"})
+
+    assert status == 200
+    assert body["syllables"] == ["a", "tlán", "ti", "co"]
+
+
+def test_not_found(batches, server_factory):
+    url = server_factory()
+
+    assert request(f"{url}/scan", {"text": "Verso"})[0] == 404
+    assert request(f"{url}/status")[0] == 404
+
+
+def test_validate_scansion_request():
+    assert validate_scansion_request({"text": "Verso", "pos_output": True}) == (
+        "Verso", {"pos_output": True})
+    assert validate_scansion_request({"text": "Verso", "rhyme_offset": None}) == (
+        "Verso", {"rhyme_offset": None})
@@ -0,0 +1,127 @@
+import pytest
+from click.testing import CliRunner
+
+import rantanplan.core
+import rantanplan.tagging
+from rantanplan.cli import main
+from rantanplan.core import _get_scansion
+from rantanplan.core import get_scansion
+from rantanplan.core import resolve_offsets
+from rantanplan.tagging import iter_docbins
+from rantanplan.tagging import read_tagged
+from rantanplan.tagging import scan_tagged
+from rantanplan.tagging import tag_texts
+
+TEXTS = [
+    "Que por mayo era por mayo\ncuando hace la calor",
+    "cuando los trigos encañan\n\ny están los campos en flor",
+]
+
+
+def test_tag_texts(pipeline, tmp_path):
+    path = tmp_path / "corpus.spacy"
+
+    assert tag_texts(TEXTS, str(path), ids=["a", "b"]) == 2
+    tagged = list(read_tagged(str(path)))
+    assert [text_id for text_id, _ in tagged] == ["a", "b"]
+    assert [doc.text for _, doc in tagged] == TEXTS
+    doc = tagged[0][1]
+    assert [token.pos_ for token in doc][:3] == ["NOUN"] * 3
+    assert doc[2].tag_ == "Number=Sing"
+    assert doc[2]._.affixes_length == 2
+    assert doc[3]._.affixes_length == 0
+    # Only the extensions needed for the scansion are kept
+    assert sorted(key[1] if isinstance(key, tuple) else key
+                  for key in doc.user_data) == [
+        "affixes_length", "affixes_length", "rantanplan"]
+
+
+def test_tag_texts_split(pipeline, tmp_path):
+    path = tmp_path / "corpus.spacy"
+    texts = TEXTS + TEXTS[1:]
+
+    assert tag_texts(texts, str(path), ids=["a", "b", "b"],
+                     split_stanzas_on=r"\n\n") == 3
+    tagged = list(read_tagged(str(path)))
+    assert [(text_id, [doc.text for doc in docs])
+            for text_id, docs in tagged] == [
+        ("a", [TEXTS[0]]),
+        ("b", ["cuando los trigos encañan", "y están los campos en flor"]),
+        ("b", ["cuando los trigos encañan", "y están los campos en flor"]),
+    ]
+
+
+def test_tag_texts_docbin_size(pipeline, tmp_path):
+    path = tmp_path / "corpus.spacy"
+    texts = TEXTS * 3
+    ids = ["a", "b", "c", "d", "e", "f"]
+
+    assert tag_texts(texts, str(path), ids=ids, split_stanzas_on=r"\n\n",
+                     docbin_size=2) == 6
+    with open(path, "rb") as docbin_file:
+        assert [len(list(docbin.get_docs(pipeline.nlp.vocab)))
+                for docbin in iter_docbins(docbin_file)] == [2, 2, 2, 2, 1]
+    # Stanzas of a text can be in different DocBins
+    assert [(text_id, [doc.text for doc in docs])
+            for text_id, docs in read_tagged(str(path))] == [
+        (text_id, [doc.text for doc in pipeline.docs[index:index + length]])
+        for text_id, index, length in zip(ids, (0, 1, 3, 4, 6, 7),
+                                          (1, 2, 1, 2, 1, 2))]
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        list(read_tagged(str(path)))
+
+
+def test_scan_tagged(pipeline, tmp_path):
+    path = tmp_path / "corpus.spacy"
+    tag_texts(TEXTS, str(path))
+    expected = [_get_scansion(doc, rhyme_analysis=True)
+                for doc in pipeline.docs]
+
+    assert list(scan_tagged(str(path), rhyme_analysis=True)) == list(
+        enumerate(expected))
+    with pytest.raises(ValueError):
+        next(scan_tagged(str(path), split_stanzas_on="\n"))
+
+
+def test_tag_scan_cli(pipeline, tmp_path):
+    runner = CliRunner()
+    poem = tmp_path / "poem.txt"
+    poem.write_text(TEXTS[0], encoding="utf-8")
+    path = tmp_path / "corpus.spacy"
+    result = runner.invoke(main, ["tag", "-o", str(path), str(poem)])
+
+    assert result.exit_code == 0
+    result = runner.invoke(main, ["scan", "--tagged", "--format", "ndjson",
+                                  str(path)])
+
+    assert result.exit_code == 0
+    assert str(poem) in result.output
+    result = runner.invoke(main, ["scan", "--tagged"])
+
+    assert result.exit_code != 0
+    for option in (["-j", "2"], ["--batch-size", "10"], ["--cache"],
+                   ["--split-long"]):
+        result = runner.invoke(main, ["scan", "--tagged", *option, str(path)])
+
+        assert result.exit_code != 0
+        assert option[0] in result.output
+
+
+def test_scan_tagged_offsets(pipeline, monkeypatch, tmp_path):
+    monkeypatch.setattr(rantanplan.core, "load_pipeline", lambda: pipeline)
+    path = tmp_path / "corpus.spacy"
+    tag_texts(TEXTS, str(path), split_stanzas_on=r"\n\n")
+    text = TEXTS[1]
+    [_, (_, scansion)] = scan_tagged(str(path), offsets_output=True)
+
+    assert scansion == get_scansion(text, split_stanzas_on=r"\n\n",
+                                    offsets_output=True)
+    line = scansion[1][0]
+    assert text[line["tokens"][0]["start"]:line["tokens"][0]["end"]] == "y"
+    [resolved] = resolve_offsets(scansion[1], text)
+    assert resolved["tokens"][1]["word"][0]["syllable"] == "es"
+    assert [group["syllable"] for group in resolved[
+        "phonological_groups"]] == [
+        group["syllable"] for group in get_scansion(
+            text, split_stanzas_on=r"\n\n")[1][0]["phonological_groups"]]
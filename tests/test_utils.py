@@ -1,4 +1,10 @@
 # -*- coding: utf-8 -*-
+import random
+from collections import Counter
+
+import pytest
+
+from rantanplan.utils import ContextCounter
 from rantanplan.utils import argcount
 from rantanplan.utils import generate_exceeded_offset_indices
 
@@ -13,3 +19,42 @@ def test_argcount():
     values = [0, 1, 2, 1, 3, 3, 4, 4, 1, 1, 3, 3]
     out = [0, 2]
     assert argcount(values, count=1) == out
+
+
+def test_context_counter():
+    values = [8, 11, 7, 7, 11, 8, 8, 11]
+    context = ContextCounter(
+        lambda index: values[index] if index < len(values) else None,
+        window=2)
+    # Ties go to the value that appears first
+    assert [context.most_common(n) for n in range(len(values))] == [
+        11, 7, 11, 11, 7, 11, 11, 8]
+    # Values before the position are read once it moves past them
+    context = ContextCounter(
+        lambda index: values[index] if index < len(values) else None,
+        window=2)
+    assert context.most_common(2) == 11
+    values[2] = 8
+    assert context.most_common(4) == 8
+    assert context.most_common(0) == 11
+    with pytest.raises(IndexError):
+        ContextCounter(lambda index: 8 if index < 1 else None).most_common(0)
+
+
+def test_context_counter_same_as_counter():
+    rng = random.Random(0)
+    for _ in range(200):
+        values = [rng.choice([5, 7, 8, 8, 11, 11, 14])
+                  for _ in range(rng.randint(2, 40))]
+        window = rng.randint(1, 10)
+        context = ContextCounter(
+            lambda index: values[index] if index < len(values) else None,
+            window=window)
+        for n in range(len(values)):
+            lengths = (values[max(n - window, 0):n]
+                       + values[n + 1:n + window + 1])
+            if rng.random() < 0.7:
+                assert context.most_common(n) == Counter(
+                    lengths).most_common(1)[0][0]
+            # Fit the value in place, as the analysis does
+            values[n] = rng.choice([7, 8, 11])
@@ -0,0 +1,58 @@
+import pytest
+
+from rantanplan.verses import VERSE_TYPE_NAMES
+from rantanplan.verses import get_positions_mask
+from rantanplan.verses import get_stress_mask
+from rantanplan.verses import get_verse_type
+
+
+def mask(pattern):
+    return get_stress_mask({"stress": pattern, "type": "pattern"})
+
+
+def test_get_positions_mask():
+    assert get_positions_mask([1, 3]) == 0b101
+    assert get_positions_mask([]) == 0
+    with pytest.raises(ValueError):
+        get_positions_mask([0])
+    with pytest.raises(ValueError):
+        get_positions_mask([65])
+
+
+def test_get_stress_mask():
+    rhythms = [
+        {"stress": "-+---+---+-", "type": "pattern", "length": 11},
+        {"stress": "2,6,10", "type": "indexed", "length": 11},
+        {"stress": "01000100010", "type": "binary", "length": 11},
+        {"stress": 0b1000100010, "type": "bitmask", "length": 11},
+    ]
+    for rhythm in rhythms:
+        assert get_stress_mask(rhythm) == 0b1000100010
+
+
+@pytest.mark.parametrize("pattern, verse_type", [
+    ("+----+---+-", "emphatic"),
+    ("++---+---+-", "emphatic"),
+    ("-+---+---+-", "heroic"),
+    ("-+-+-+-+-+-", "heroic"),
+    ("--+--+---+-", "melodic"),
+    ("+--+---+-+-", "sapphic"),
+    ("---+-+-+-+-", "sapphic"),
+    ("---+--+--+-", "bagpipe"),
+    ("---+-----+-", None),
+    ("+--+--+-", "dactylic"),
+    ("--+---+-", "trochaic"),
+    ("+---+-+-", "trochaic"),
+    ("-+-+--+-", "mixed"),
+    ("-+--+-+-", "mixed"),
+    ("---+--+-", None),
+    ("-+---+-", None),
+])
+def test_get_verse_type(pattern, verse_type):
+    assert get_verse_type(mask(pattern), len(pattern)) == verse_type
+
+
+def test_verse_type_names():
+    assert VERSE_TYPE_NAMES == (
+        "emphatic", "heroic", "melodic", "sapphic", "bagpipe", "dactylic",
+        "trochaic", "mixed")